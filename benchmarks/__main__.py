@@ -0,0 +1,152 @@
+"""Run the benchmark suite, save its results and compare them against
+a previous run.
+
+Results are saved as JSON under benchmarks/results/ so that runs from
+before and after a change can be compared:
+
+  python -m benchmarks --save before
+  # ...make some changes...
+  python -m benchmarks --save after --compare before
+
+Pass --load to also run the end-to-end load generator.
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+MICRO_BENCHMARKS = [
+    "bench_router",
+    "bench_headers",
+    "bench_parser",
+    "bench_response",
+    "bench_json",
+    "bench_compression",
+    "bench_worker",
+]
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+ResultsT = Dict[str, float]
+
+
+def get_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_micro_benchmarks(names: List[str]) -> ResultsT:
+    results = {}
+    for name in names:
+        print(f"Running {name}...", file=sys.stderr)
+        module = importlib.import_module(f"benchmarks.{name}")
+        # Cases are timings in microseconds unless they name their
+        # own unit (eg. "get/peak_kib").
+        for case, value in module.run().items():  # type: ignore
+            results[f"{name}/{case}" if "/" in case else f"{name}/{case}/us"] = value
+    return results
+
+
+def run_load_generator(duration: float, concurrency: int) -> ResultsT:
+    from . import loadgen
+
+    print("Running loadgen...", file=sys.stderr)
+    results = {}
+    for result in loadgen.run(duration=duration, concurrency=concurrency):
+        for metric, value in result.to_dict().items():
+            results[f"loadgen/{result.scenario}/{metric}"] = value
+    return results
+
+
+def is_higher_better(metric: str) -> bool:
+    return metric.endswith("/rps")
+
+
+def resolve_path(name: str) -> str:
+    if os.path.sep in name or name.endswith(".json"):
+        return name
+    return os.path.join(RESULTS_DIR, f"{name}.json")
+
+
+def save(name: str, results: ResultsT) -> str:
+    path = resolve_path(name)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({
+            "revision": get_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.time(),
+            "results": results,
+        }, f, indent=2, sort_keys=True)
+    return path
+
+
+def load(name: str) -> ResultsT:
+    with open(resolve_path(name)) as f:
+        return json.load(f)["results"]
+
+
+def compare(baseline: ResultsT, results: ResultsT, threshold: float) -> List[str]:
+    """Print every metric found in both sets of results alongside
+    its relative change.  Returns the metrics that got worse by more
+    than threshold (a fraction).
+    """
+    regressions = []
+    print(f"{'metric':<60} {'baseline':>10} {'current':>10} {'change':>8}")
+    for metric, value in results.items():
+        baseline_value = baseline.get(metric)
+        if baseline_value is None or metric.endswith("/errors"):
+            continue
+
+        change = (value - baseline_value) / baseline_value if baseline_value else 0.0
+        worse = -change if is_higher_better(metric) else change
+        flag = ""
+        if worse > threshold:
+            flag = " REGRESSION"
+            regressions.append(metric)
+        print(f"{metric:<60} {baseline_value:>10.2f} {value:>10.2f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument(
+        "--only", action="append", choices=MICRO_BENCHMARKS,
+        help="a micro-benchmark to run (may be repeated); all of them are run by default",
+    )
+    parser.add_argument("--load", action="store_true", help="also run the end-to-end load generator")
+    parser.add_argument("--duration", type=float, default=5, help="the duration of each load scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="the number of concurrent load connections")
+    parser.add_argument("--save", metavar="NAME", help="save the results under benchmarks/results/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="compare the results against a saved run")
+    parser.add_argument(
+        "--threshold", type=float, default=0.1,
+        help="the relative slowdown past which a metric is reported as a regression",
+    )
+    args = parser.parse_args()
+
+    results = run_micro_benchmarks(args.only or MICRO_BENCHMARKS)
+    if args.load:
+        results.update(run_load_generator(args.duration, args.concurrency))
+
+    if args.save:
+        print(f"Saved results to {save(args.save, results)}.", file=sys.stderr)
+
+    if args.compare:
+        return 1 if compare(load(args.compare), results, args.threshold) else 0
+
+    for metric, value in results.items():
+        print(f"{metric:<60} {value:>10.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+"""Measure the CPU time spent compressing typical payloads against the
+number of bytes saved, for each encoding and compression level.
+
+Run with: python -m benchmarks.bench_compression
+"""
+import json
+import timeit
+from typing import Dict, List, Tuple
+
+from scratch.compression import DYNAMIC_LEVELS, ENCODINGS, compress
+
+NUMBER = 20
+
+LEVELS: Dict[str, List[int]] = {
+    "gzip": [1, 6, 9],
+    "br": [1, 4, 11],
+}
+
+
+def make_payloads() -> List[Tuple[str, bytes]]:
+    users = [{"id": i, "name": f"user {i}", "email": f"user{i}@example.com", "active": i % 2 == 0} for i in range(1000)]
+    with open("www/index.html", "rb") as f:
+        index = f.read()
+
+    return [
+        ("index.html", index),
+        ("users-10.json", json.dumps(users[:10]).encode()),
+        ("users-1000.json", json.dumps(users).encode()),
+        ("lorem-64k.txt", (b"Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 1200)[:65536]),
+    ]
+
+
+def run() -> Dict[str, float]:
+    """Time compressing every payload at the levels used for dynamic
+    responses, returning microseconds per call by payload and encoding.
+    """
+    results = {}
+    for name, data in make_payloads():
+        for encoding in ENCODINGS:
+            level = DYNAMIC_LEVELS[encoding]
+            total = timeit.timeit(lambda: compress(data, encoding, level), number=NUMBER)
+            results[f"{name} {encoding}-{level}"] = total / NUMBER * 1_000_000
+    return results
+
+
+def main() -> None:
+    print(
+        f"{'payload':<16} {'bytes':>8} {'encoding':>8} {'level':>5} "
+        f"{'encoded':>8} {'ratio':>6} {'us':>9} {'MB/s':>8}"
+    )
+    for name, data in make_payloads():
+        for encoding in ENCODINGS:
+            for level in LEVELS[encoding]:
+                encoded = compress(data, encoding, level)
+                total = timeit.timeit(lambda: compress(data, encoding, level), number=NUMBER)
+                per_call = total / NUMBER
+                print(
+                    f"{name:<16} {len(data):>8} {encoding:>8} {level:>5} {len(encoded):>8} "
+                    f"{len(encoded) / len(data):>6.2f} {per_call * 1_000_000:>9.1f} "
+                    f"{len(data) / per_call / 1_000_000:>8.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Measure the cost of the Headers operations on the request and
+response hot paths.
+
+Run with: python -m benchmarks.bench_headers
+"""
+import timeit
+from typing import Callable, Dict, List, Tuple
+
+from scratch.headers import Headers
+
+NUMBER = 20_000
+REPEAT = 5
+
+RAW_HEADERS = [
+    (b"Host", b"example.com"),
+    (b"User-Agent", b"Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/115.0"),
+    (b"Accept", b"text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8"),
+    (b"Accept-Language", b"en-US,en;q=0.5"),
+    (b"Accept-Encoding", b"gzip, deflate, br"),
+    (b"Connection", b"keep-alive"),
+    (b"Cookie", b"session=abc123; theme=dark"),
+    (b"X-Request-Id", b"f0e1d2c3b4a59687"),
+]
+
+
+def make_request_headers() -> Headers:
+    headers = Headers()
+    for name, value in RAW_HEADERS:
+        headers.add_raw(name, value)
+    return headers
+
+
+def make_response_headers() -> Headers:
+    headers = Headers()
+    headers.add("content-type", "application/json")
+    headers.add("content-length", "1024")
+    headers.add("cache-control", "max-age=60")
+    headers.add("vary", "accept-encoding")
+    return headers
+
+
+def make_cases() -> List[Tuple[str, Callable[[], object]]]:
+    request_headers = make_request_headers()
+    response_headers = make_response_headers()
+    return [
+        ("parse 8 request headers", make_request_headers),
+        ("build 4 response headers", make_response_headers),
+        ("get present", lambda: request_headers.get("connection")),
+        ("get missing", lambda: request_headers.get("transfer-encoding")),
+        ("get mixed case", lambda: request_headers.get("Content-Length")),
+        ("iterate", lambda: list(request_headers)),
+        ("encode", response_headers.encode),
+    ]
+
+
+def run() -> Dict[str, float]:
+    """Time every case, returning microseconds per call by case.
+    """
+    results = {}
+    for name, fn in make_cases():
+        total = min(timeit.repeat(fn, number=NUMBER, repeat=REPEAT))
+        results[name] = total / NUMBER * 1_000_000
+    return results
+
+
+def main() -> None:
+    print(f"{'operation':<26} {'us':>8}")
+    for name, us in run().items():
+        print(f"{name:<26} {us:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Compare the time it takes to build and send JSON responses using
+the stdlib encoder against the default one.
+
+Run with: python -m benchmarks.bench_json
+"""
+import socket
+import timeit
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from scratch.response import JSONResponse, encode_json, encode_json_stdlib
+
+NUMBER = 200
+
+ENCODERS: Dict[str, Callable[[Any], bytes]] = {
+    "stdlib": encode_json_stdlib,
+    "default": encode_json,
+}
+
+
+def make_payloads() -> List[Tuple[str, Any]]:
+    users = [{"id": i, "name": f"user {i}", "email": f"user{i}@example.com", "active": i % 2 == 0} for i in range(1000)]
+    return [
+        ("user", {"user": users[0]}),
+        ("users-10", {"users": users[:10]}),
+        ("users-1000", {"users": users}),
+    ]
+
+
+def bench_all() -> Iterator[Tuple[str, str, int, float]]:
+    """Time building and sending a JSON response for every payload
+    and encoder.  Yields the payload and encoder names, the size of the
+    encoded payload and the microseconds per response.
+    """
+    server_sock, client_sock = socket.socketpair()
+    client_sock.setblocking(False)
+
+    def drain() -> None:
+        try:
+            while client_sock.recv(1 << 20):
+                pass
+        except BlockingIOError:
+            pass
+
+    with server_sock, client_sock:
+        for name, value in make_payloads():
+            for encoder_name, encoder in ENCODERS.items():
+                def send() -> None:
+                    JSONResponse(value, encoder=encoder).send(server_sock)
+                    drain()
+
+                total = timeit.timeit(send, number=NUMBER)
+                yield name, encoder_name, len(encoder(value)), total / NUMBER * 1_000_000
+
+
+def run() -> Dict[str, float]:
+    """Time building and sending JSON responses, returning
+    microseconds per response by payload and encoder.
+    """
+    return {f"{name} {encoder_name}": us for name, encoder_name, _, us in bench_all()}
+
+
+def main() -> None:
+    print(f"{'payload':<12} {'encoder':>8} {'bytes':>8} {'us':>9}")
+    for name, encoder_name, size, us in bench_all():
+        print(f"{name:<12} {encoder_name:>8} {size:>8} {us:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
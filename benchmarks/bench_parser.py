@@ -0,0 +1,96 @@
+"""Compare Request.from_socket against the line-by-line parser it
+replaced for requests with 10, 50 and 100 headers.
+
+Run with: python -m benchmarks.bench_parser
+"""
+import socket
+import timeit
+import typing
+from typing import Dict
+
+from scratch.headers import Headers
+from scratch.request import Request
+
+HEADER_COUNTS = [10, 50, 100]
+NUMBER = 2_000
+REPEAT = 5
+
+
+def legacy_iter_lines(sock, bufsize: int = 16_384) -> typing.Generator[bytes, None, bytes]:
+    buff = b""
+    while True:
+        data = sock.recv(bufsize)
+        if not data:
+            return b""
+
+        buff += data
+        while True:
+            try:
+                i = buff.index(b"\r\n")
+                line, buff = buff[:i], buff[i + 2:]
+                if not line:
+                    return buff
+
+                yield line
+            except (IndexError, ValueError):
+                break
+
+
+def legacy_from_socket(sock) -> typing.Tuple[str, str, Headers, bytes]:
+    """The parser that Request.from_socket used to be.
+    """
+    lines = legacy_iter_lines(sock)
+    request_line = next(lines).decode("ascii")
+    method, path, _ = request_line.split(" ")
+
+    headers = Headers()
+    while True:
+        try:
+            line = next(lines)
+        except StopIteration as e:
+            buff = e.value
+            break
+
+        name, value = line.decode("ascii").split(":", 1)
+        headers.add(name, value.lstrip())
+
+    return method.upper(), path, headers, buff
+
+
+def make_request(header_count: int) -> bytes:
+    lines = ["GET /users/42?include=posts HTTP/1.1"]
+    for i in range(header_count):
+        lines.append(f"X-Header-{i}: some-reasonably-long-value-{i}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode()
+
+
+def bench(parser: typing.Callable[[socket.socket], typing.Any], data: bytes) -> float:
+    client_sock, server_sock = socket.socketpair()
+    with client_sock, server_sock:
+        def parse():
+            client_sock.sendall(data)
+            parser(server_sock)
+
+        total = min(timeit.repeat(parse, number=NUMBER, repeat=REPEAT))
+        return total / NUMBER * 1_000_000
+
+
+def run() -> Dict[str, float]:
+    """Time Request.from_socket, returning microseconds per request
+    by header count.
+    """
+    return {f"{header_count} headers": bench(Request.from_socket, make_request(header_count))
+            for header_count in HEADER_COUNTS}
+
+
+def main() -> None:
+    print(f"{'headers':>8} {'bytes':>7} {'legacy (us)':>12} {'current (us)':>13}")
+    for header_count in HEADER_COUNTS:
+        data = make_request(header_count)
+        legacy = bench(legacy_from_socket, data)
+        current = bench(Request.from_socket, data)
+        print(f"{header_count:>8} {len(data):>7} {legacy:>12.2f} {current:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
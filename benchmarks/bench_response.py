@@ -0,0 +1,73 @@
+"""Measure the cost of serializing and sending responses with small,
+large and streaming bodies over a socket pair.
+
+Run with: python -m benchmarks.bench_response
+"""
+import socket
+import threading
+import timeit
+from typing import Callable, Dict, List, Tuple
+
+from scratch.response import JSONResponse, Response, StreamingResponse
+
+NUMBER = 2_000
+REPEAT = 5
+
+SMALL_BODY = "Hello, world!"
+LARGE_BODY = b"x" * 256 * 1024
+USERS = [{"id": i, "name": f"user {i}", "email": f"user{i}@example.com"} for i in range(10)]
+
+
+def make_cases() -> List[Tuple[str, Callable[[], Response]]]:
+    def small() -> Response:
+        response = Response(content=SMALL_BODY)
+        response.headers.add("content-type", "text/plain")
+        return response
+
+    def large() -> Response:
+        response = Response()
+        response.body.write(LARGE_BODY)
+        return response
+
+    return [
+        ("small", small),
+        ("json-10-users", lambda: JSONResponse({"users": USERS})),
+        ("large-256k", large),
+        ("streaming-16-chunks", lambda: StreamingResponse(chunks=[b"x" * 1024] * 16)),
+    ]
+
+
+def discard(sock: socket.socket) -> None:
+    while sock.recv(1 << 20):
+        pass
+
+
+def run() -> Dict[str, float]:
+    """Time encoding the head of, and sending, every case.  Returns
+    microseconds per response by case.
+    """
+    results = {}
+    for name, factory in make_cases():
+        server_sock, client_sock = socket.socketpair()
+        reader = threading.Thread(target=discard, args=(client_sock,), daemon=True)
+        reader.start()
+        with server_sock, client_sock:
+            results[f"{name} prepare"] = min(timeit.repeat(
+                lambda: factory().prepare(), number=NUMBER, repeat=REPEAT,
+            )) / NUMBER * 1_000_000
+            results[f"{name} send"] = min(timeit.repeat(
+                lambda: factory().send(server_sock), number=NUMBER, repeat=REPEAT,
+            )) / NUMBER * 1_000_000
+            server_sock.shutdown(socket.SHUT_WR)
+            reader.join()
+    return results
+
+
+def main() -> None:
+    print(f"{'case':<30} {'us':>9}")
+    for name, us in run().items():
+        print(f"{name:<30} {us:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
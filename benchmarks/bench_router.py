@@ -0,0 +1,83 @@
+"""Compare Router.lookup against the linear regex scan it replaced as
+the number of routes grows.
+
+Run with: python -m benchmarks.bench_router
+"""
+import re
+import timeit
+from functools import partial
+from typing import Dict, List, Optional, Pattern, Tuple
+
+from scratch.application import RouteHandlerT, Router
+
+ROUTE_COUNTS = [10, 100, 1_000, 5_000]
+NUMBER = 10_000
+
+
+class LinearRouter:
+    """The regex-based router that Router used to be.
+    """
+
+    def __init__(self) -> None:
+        self.routes_by_method: Dict[str, List[Tuple[Pattern[str], RouteHandlerT]]] = {}
+
+    def add_route(self, name: str, method: str, path: str, handler: RouteHandlerT) -> None:
+        route_template = ""
+        for segment in path.split("/")[1:]:
+            if segment.startswith("{") and segment.endswith("}"):
+                route_template += f"/(?P<{segment[1:-1]}>[^/]+)"
+            else:
+                route_template += f"/{segment}"
+
+        self.routes_by_method.setdefault(method, []).append((re.compile(f"^{route_template}$"), handler))
+
+    def lookup(self, method: str, path: str) -> Optional[RouteHandlerT]:
+        for route_re, handler in self.routes_by_method[method]:
+            match = route_re.match(path)
+            if match is not None:
+                return partial(handler, **match.groupdict())
+        return None
+
+
+def handler(*args, **kwargs):
+    pass
+
+
+def populate(router, route_count: int) -> None:
+    for i in range(route_count // 2):
+        router.add_route(f"list_{i}", "GET", f"/resource{i}/items", handler)
+        router.add_route(f"get_{i}", "GET", f"/resource{i}/items/{{item_id}}", handler)
+
+
+def bench(router_factory, route_count: int, path: str) -> float:
+    router = router_factory()
+    populate(router, route_count)
+    assert router.lookup("GET", path) is not None
+    total = timeit.timeit(lambda: router.lookup("GET", path), number=NUMBER)
+    return total / NUMBER * 1_000_000
+
+
+def run() -> Dict[str, float]:
+    """Time Router lookups, returning microseconds per lookup by
+    route count and path.
+    """
+    results = {}
+    for route_count in ROUTE_COUNTS:
+        last = route_count // 2 - 1
+        for path in ["/resource0/items", f"/resource{last}/items/42"]:
+            results[f"{route_count} routes {path}"] = bench(Router, route_count, path)
+    return results
+
+
+def main() -> None:
+    print(f"{'routes':>8} {'path':<28} {'linear (us)':>12} {'tree (us)':>10}")
+    for route_count in ROUTE_COUNTS:
+        last = route_count // 2 - 1
+        for path in ["/resource0/items", f"/resource{last}/items/42"]:
+            linear = bench(LinearRouter, route_count, path)
+            tree = bench(Router, route_count, path)
+            print(f"{route_count:>8} {path:<28} {linear:>12.2f} {tree:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Measure how long it takes an HTTPWorker to serve a request, from
+reading its head to writing its response, and how much memory it
+allocates while doing so.
+
+Memory is measured with tracemalloc as the peak number of bytes
+allocated while serving each request, so buffers that are allocated
+per request show up in full even if they're freed right away.
+
+Run with: python -m benchmarks.bench_worker
+"""
+import socket
+import statistics
+import time
+import tracemalloc
+from queue import Queue
+from typing import Dict, List
+
+from scratch.application import Application
+from scratch.request import Request
+from scratch.response import Response
+from scratch.server import HTTPWorker
+
+NUMBER = 2_000
+
+REQUESTS = {
+    "get": (
+        b"GET /api/users/42?include=posts HTTP/1.1\r\n"
+        b"host: localhost\r\n"
+        b"user-agent: bench\r\n"
+        b"accept: */*\r\n"
+        b"connection: close\r\n\r\n"
+    ),
+    "post": (
+        b"POST /api/users HTTP/1.1\r\n"
+        b"host: localhost\r\n"
+        b"content-type: application/json\r\n"
+        b"content-length: 16\r\n"
+        b"connection: close\r\n\r\n"
+        b'{"name": "Jim"}\n'
+    ),
+}
+
+
+def make_worker() -> HTTPWorker:
+    app = Application()
+
+    @app.route("/users/{user_id}")
+    def get_user(request: Request, user_id: str) -> Response:
+        return Response(content=f"user {user_id}")
+
+    @app.route("/users", method="POST")
+    def create_user(request: Request) -> Response:
+        return Response(status="201 Created", content=request.body.read().decode())
+
+    return HTTPWorker(Queue(), [("/api", app)])
+
+
+def serve(worker: HTTPWorker, data: bytes, trace: bool) -> float:
+    """Serve a single request, returning the number of seconds it took
+    or, if trace is True, the peak number of bytes allocated.
+    """
+    server_sock, client_sock = socket.socketpair()
+    with client_sock:
+        client_sock.sendall(data)
+        if trace:
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            worker.handle_client(server_sock, ("127.0.0.1", 0))
+            _, peak = tracemalloc.get_traced_memory()
+            result = float(peak - current)
+        else:
+            started_at = time.perf_counter()
+            worker.handle_client(server_sock, ("127.0.0.1", 0))
+            result = time.perf_counter() - started_at
+
+        if not client_sock.recv(4096).startswith(b"HTTP/1.1 2"):
+            raise RuntimeError("Unexpected response.")
+        return result
+
+
+def bench(worker: HTTPWorker, data: bytes) -> Dict[str, float]:
+    timings = [serve(worker, data, False) for _ in range(NUMBER)]
+
+    tracemalloc.start()
+    try:
+        peaks: List[float] = [serve(worker, data, True) for _ in range(NUMBER)]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "us": statistics.median(timings) * 1_000_000,
+        "peak_kib": statistics.median(peaks) / 1024,
+    }
+
+
+def run() -> Dict[str, float]:
+    """Serve each kind of request, returning the median microseconds
+    and peak KiB allocated per request.
+    """
+    worker = make_worker()
+    results = {}
+    for name, data in REQUESTS.items():
+        for metric, value in bench(worker, data).items():
+            results[f"{name}/{metric}"] = value
+    return results
+
+
+def main() -> None:
+    print(f"{'request':>8} {'time (us)':>10} {'peak (KiB)':>11}")
+    worker = make_worker()
+    for name, data in REQUESTS.items():
+        results = bench(worker, data)
+        print(f"{name:>8} {results['us']:>10.2f} {results['peak_kib']:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""An end-to-end load generator.  Starts `python -m scratch` in a
+subprocess and hammers it with a fixed number of concurrent
+connections per scenario, then reports throughput and latency.
+
+Each connection is driven by its own client process so that the
+client's GIL doesn't become the bottleneck.
+
+Run with: python -m benchmarks.loadgen [--engine async] [--duration 5]
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+#: The size of the large static file served by the static scenarios.
+LARGE_FILE_SIZE = 1024 * 1024
+
+
+class Scenario(NamedTuple):
+    name: str
+    path: str
+    keep_alive: bool
+
+    def encode_request(self, host: str, port: int) -> bytes:
+        connection = "keep-alive" if self.keep_alive else "close"
+        return f"GET {self.path} HTTP/1.1\r\nhost: {host}:{port}\r\nconnection: {connection}\r\n\r\n".encode()
+
+
+SCENARIOS = [
+    Scenario("json-keepalive", "/users", True),
+    Scenario("json-close", "/users", False),
+    Scenario("static-keepalive", "/static/large.bin", True),
+    Scenario("static-close", "/static/large.bin", False),
+]
+
+
+class Result(NamedTuple):
+    scenario: str
+    requests: int
+    errors: int
+    duration: float
+    p50: float
+    p99: float
+
+    @property
+    def rps(self) -> float:
+        return self.requests / self.duration
+
+    def to_dict(self) -> Dict[str, float]:
+        return {"rps": self.rps, "p50_ms": self.p50 * 1000, "p99_ms": self.p99 * 1000, "errors": self.errors}
+
+
+def percentile(samples: Sequence[float], q: float) -> float:
+    """Get the q-th percentile of a sorted sequence of samples using
+    the nearest-rank method.
+    """
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, max(0, int(round(q / 100 * len(samples))) - 1))]
+
+
+def read_response(sock: socket.socket, buff: bytes) -> Tuple[bytes, bool]:
+    """Read a single response off of sock, discarding its body.
+    Returns any data read past its end and whether or not the server
+    will keep the connection open.
+
+    Raises:
+      ValueError: When the connection is closed mid-response or the
+        response isn't a 200.
+    """
+    while b"\r\n\r\n" not in buff:
+        data = sock.recv(65536)
+        if not data:
+            raise ValueError("Connection closed before the end of the head.")
+        buff += data
+
+    head, _, buff = buff.partition(b"\r\n\r\n")
+    status_line, *header_lines = head.decode("latin-1").split("\r\n")
+    if not status_line.startswith("HTTP/1.1 200 "):
+        raise ValueError(f"Unexpected status {status_line!r}.")
+
+    headers = {}
+    for line in header_lines:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip().lower()
+
+    if headers.get("transfer-encoding") == "chunked":
+        while not buff.endswith(b"0\r\n\r\n"):
+            data = sock.recv(65536)
+            if not data:
+                raise ValueError("Connection closed before the end of the body.")
+            buff += data
+        buff = b""
+    else:
+        remaining = int(headers.get("content-length", "0")) - len(buff)
+        while remaining > 0:
+            data = sock.recv(min(remaining, 1 << 20))
+            if not data:
+                raise ValueError("Connection closed before the end of the body.")
+            remaining -= len(data)
+        buff = buff[len(buff) + remaining:] if remaining < 0 else b""
+
+    return buff, headers.get("connection") != "close"
+
+
+def drive_connection(args: Tuple[str, int, bytes, bool, float]) -> Tuple[List[float], int]:
+    """Send requests one after the other for duration seconds and
+    return the latency of each one along with the number of errors.
+    Connections are reopened whenever the server closes them.
+    """
+    host, port, request, keep_alive, duration = args
+    latencies: List[float] = []
+    errors = 0
+    sock: Optional[socket.socket] = None
+    buff = b""
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        started_at = time.perf_counter()
+        try:
+            if sock is None:
+                sock = socket.create_connection((host, port))
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                buff = b""
+
+            sock.sendall(request)
+            buff, server_keep_alive = read_response(sock, buff)
+            latencies.append(time.perf_counter() - started_at)
+            if not keep_alive or not server_keep_alive:
+                sock.close()
+                sock = None
+        except (OSError, ValueError):
+            errors += 1
+            if sock is not None:
+                sock.close()
+                sock = None
+
+    if sock is not None:
+        sock.close()
+    return latencies, errors
+
+
+def run_scenario(host: str, port: int, scenario: Scenario, concurrency: int, duration: float) -> Result:
+    request = scenario.encode_request(host, port)
+    with multiprocessing.Pool(concurrency) as pool:
+        results = pool.map(drive_connection, [(host, port, request, scenario.keep_alive, duration)] * concurrency)
+
+    latencies = sorted(latency for connection_latencies, _ in results for latency in connection_latencies)
+    return Result(
+        scenario=scenario.name,
+        requests=len(latencies),
+        errors=sum(errors for _, errors in results),
+        duration=duration,
+        p50=percentile(latencies, 50),
+        p99=percentile(latencies, 99),
+    )
+
+
+def wait_for_port(host: str, port: int, process: subprocess.Popen, timeout: float = 10) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}.")
+
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.05)
+
+    raise RuntimeError(f"Server didn't start listening on {host}:{port} within {timeout} seconds.")
+
+
+def start_server(host: str, port: int, static_root: str, server_args: Sequence[str]) -> subprocess.Popen:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "scratch", "--host", host, "--port", str(port), "--static-root", static_root,
+         *server_args],
+        cwd=root,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(host, port, process)
+    except Exception:
+        process.kill()
+        process.wait()
+        raise
+    return process
+
+
+def stop_server(process: subprocess.Popen) -> None:
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def run(
+        *,
+        host: str = "127.0.0.1",
+        port: int = 9100,
+        concurrency: int = 8,
+        duration: float = 5,
+        scenarios: Sequence[Scenario] = SCENARIOS,
+        server_args: Sequence[str] = (),
+) -> List[Result]:
+    """Start a server and run every scenario against it.
+    """
+    with tempfile.TemporaryDirectory() as static_root:
+        with open(os.path.join(static_root, "large.bin"), "wb") as f:
+            f.write(os.urandom(LARGE_FILE_SIZE))
+
+        process = start_server(host, port, static_root, server_args)
+        try:
+            return [run_scenario(host, port, scenario, concurrency, duration) for scenario in scenarios]
+        finally:
+            stop_server(process)
+
+
+def print_results(results: Sequence[Result]) -> None:
+    print(f"{'scenario':<18} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+    for result in results:
+        print(
+            f"{result.scenario:<18} {result.requests:>9} {result.errors:>7} {result.rps:>9.1f} "
+            f"{result.p50 * 1000:>9.2f} {result.p99 * 1000:>9.2f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.loadgen")
+    parser.add_argument("--port", type=int, default=9100, help="the port to run the server on")
+    parser.add_argument("--concurrency", type=int, default=8, help="the number of concurrent connections")
+    parser.add_argument("--duration", type=float, default=5, help="the number of seconds to run each scenario for")
+    parser.add_argument("--engine", choices=["threaded", "async"], default="threaded")
+    parser.add_argument("--processes", type=int, default=1, help="the number of server processes")
+    parser.add_argument(
+        "--scenario", action="append", choices=[scenario.name for scenario in SCENARIOS],
+        help="a scenario to run (may be repeated); all of them are run by default",
+    )
+    args = parser.parse_args()
+
+    scenarios = [scenario for scenario in SCENARIOS if not args.scenario or scenario.name in args.scenario]
+    print_results(run(
+        port=args.port,
+        concurrency=args.concurrency,
+        duration=args.duration,
+        scenarios=scenarios,
+        server_args=["--engine", args.engine, "--processes", str(args.processes)],
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,17 @@
+import argparse
 import functools
-import json
 import sys
+import typing
 from typing import Callable, Tuple, Union
 
+from .aio import AsyncHTTPServer
 from .application import Application
+from .cache import ResponseCache
+from .compression import compressed
+from .metrics import Metrics
 from .request import Request
-from .response import Response
-from .server import HTTPServer
+from .response import JSONResponse, Response
+from .server import HTTPServer, serve_static
 
 USERS = [
     {"id": 1, "name": "Jim"},
@@ -24,23 +29,21 @@ def jsonresponse(handler: Callable[..., Union[dict, Tuple[str, dict]]]) -> Calla
         else:
             status, result = "200 OK", result
 
-        response = Response(status=status)
-        response.headers.add("content-type", "application/json")
-        response.body.write(json.dumps(result).encode())
-        return response
+        return JSONResponse(result, status)
     return wrapper
 
 
 app = Application()
+cache = ResponseCache(ttl=5, stale_while_revalidate=30)
 
 
-@app.route("/users")
+@app.route("/users", middleware=[cache, compressed])
 @jsonresponse
 def get_users(request: Request) -> dict:
     return {"users": USERS}
 
 
-@app.route("/users/{user_id}")
+@app.route("/users/{user_id}", middleware=[cache, compressed])
 @jsonresponse
 def get_user(request: Request, user_id: str) -> Union[dict, Tuple[str, dict]]:
     try:
@@ -50,7 +53,44 @@ def get_user(request: Request, user_id: str) -> Union[dict, Tuple[str, dict]]:
 
 
 def main() -> int:
-    server = HTTPServer()
+    parser = argparse.ArgumentParser(prog="python -m scratch")
+    parser.add_argument("--host", default="127.0.0.1", help="the address to listen on")
+    parser.add_argument("--port", type=int, default=9000, help="the port to listen on")
+    parser.add_argument("--static-root", help="a directory to serve files from under /static")
+    parser.add_argument(
+        "--engine", choices=["threaded", "async"], default="threaded",
+        help="the server implementation to run the application with",
+    )
+    parser.add_argument(
+        "--processes", type=int, default=1,
+        help="the number of worker processes to fork (threaded engine only)",
+    )
+    parser.add_argument(
+        "--reuse-port", action="store_true",
+        help="bind a separate SO_REUSEPORT socket in each worker process",
+    )
+    args = parser.parse_args()
+
+    server: typing.Union[HTTPServer, AsyncHTTPServer]
+    if args.engine == "async":
+        if args.processes != 1:
+            parser.error("--processes is only supported by the threaded engine")
+
+        server = AsyncHTTPServer(host=args.host, port=args.port)
+    else:
+        metrics = Metrics()
+        server = HTTPServer(
+            host=args.host,
+            port=args.port,
+            process_count=args.processes,
+            reuse_port=args.reuse_port,
+            metrics=metrics,
+        )
+        server.mount("/metrics", metrics.handler)
+
+    if args.static_root is not None:
+        server.mount("/static", serve_static(args.static_root))
+
     server.mount("", app)
     server.serve_forever()
     return 0
@@ -0,0 +1,303 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Optional, Union, cast
+
+from .forms import MalformedForm
+from .mounts import MountTable
+from .request import (MAX_BODY_SIZE, MAX_HEAD_SIZE, MAX_HEADER_COUNT,
+                      BodyTooLarge, BufferedBody, HeadTooLarge, Request,
+                      RequestTimeout, get_content_length, parse_chunk_size,
+                      parse_head, transfer_time_left)
+from .response import Response
+from .server import HandlerT, prepare_connection
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None  # type: ignore
+
+LOGGER = logging.getLogger(__name__)
+
+AsyncHandlerT = Callable[[Request], Awaitable[Response]]
+AnyHandlerT = Union[HandlerT, AsyncHandlerT]
+
+
+def is_async_handler(handler: AnyHandlerT) -> bool:
+    """Returns True if handler is a coroutine function or an object
+    whose __call__ method is one.
+    """
+    return asyncio.iscoroutinefunction(handler) or \
+        asyncio.iscoroutinefunction(getattr(handler, "__call__", None))
+
+
+class AsyncHTTPServer:
+    """An HTTP server that multiplexes all of its connections on an
+    asyncio event loop.  Async handlers run on the loop and synchronous
+    handlers are offloaded to a pool of worker_count threads.
+
+    Request bodies are read in full, up to max_body_size bytes, before
+    handlers are called.  None means request bodies may be of any size.
+    Receiving n bytes of a body may take at most body_timeout + n /
+    min_transfer_rate seconds.  Slower clients get a 408.
+    """
+
+    def __init__(
+            self,
+            host="127.0.0.1",
+            port=9000,
+            worker_count=16,
+            keepalive_timeout=5,
+            max_keepalive_requests=100,
+            max_head_size=MAX_HEAD_SIZE,
+            max_header_count=MAX_HEADER_COUNT,
+            max_body_size=MAX_BODY_SIZE,
+            backlog=1024,
+            body_timeout=30,
+            min_transfer_rate=1024,
+    ) -> None:
+        self.mounts: MountTable[AnyHandlerT] = MountTable()
+        self.host = host
+        self.port = port
+        self.worker_count = worker_count
+        self.keepalive_timeout = keepalive_timeout
+        self.max_keepalive_requests = max_keepalive_requests
+        self.max_head_size = max_head_size
+        self.max_header_count = max_header_count
+        self.max_body_size = max_body_size
+        self.backlog = backlog
+        self.body_timeout = body_timeout
+        self.min_transfer_rate = min_transfer_rate
+        self.executor: Optional[ThreadPoolExecutor] = None
+
+    def mount(self, path_prefix: str, handler: AnyHandlerT) -> None:
+        """Mount a request handler at a particular path.  Requests are
+        dispatched to the handler mounted at the longest prefix of
+        their path, matching whole path segments (see MountTable).
+
+        Raises:
+          ValueError: When a handler is already mounted at path_prefix.
+        """
+        self.mounts.add(path_prefix, handler)
+
+    def serve_forever(self) -> None:
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+
+    async def serve(self) -> None:
+        raise_open_files_limit()
+
+        self.executor = ThreadPoolExecutor(self.worker_count)
+        server = await asyncio.start_server(
+            self.handle_client,
+            self.host,
+            self.port,
+            backlog=self.backlog,
+            limit=self.max_head_size,
+        )
+
+        LOGGER.info("Listening on %s:%d...", self.host, self.port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.executor.shutdown(wait=False)
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            for requests_served in range(1, self.max_keepalive_requests + 1):
+                request = await self.read_request(reader, writer)
+                if request is None:
+                    return
+
+                keep_alive = request.keep_alive and requests_served < self.max_keepalive_requests
+                response = await self.handle_request(request)
+                keep_alive = prepare_connection(request, response, keep_alive)
+
+                await response.send_async(writer)
+                if not keep_alive:
+                    return
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> Optional[Request]:
+        """Read the next request, including its body, off of a
+        connection.  Returns None when the connection should be closed,
+        after responding with an error if the request was invalid.
+        """
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.keepalive_timeout)
+            method, target, version, headers = parse_head(head[:-4], max_header_count=self.max_header_count)
+            content_length = get_content_length(headers)
+            if content_length is not None and self.max_body_size is not None and \
+                    content_length > self.max_body_size:
+                raise BodyTooLarge("Request body too large.")
+
+            # Force clients to send their request bodies on every
+            # request rather than making the handlers deal with this.
+            if "100-continue" in headers.get("expect", ""):
+                await Response(status="100 Continue").send_async(writer)
+
+            budget = TransferBudget(self.body_timeout, self.min_transfer_rate)
+            if content_length is None:
+                body = await read_chunked_body(reader, self.max_body_size, budget)
+            else:
+                body = await read_exactly(reader, content_length, budget)
+        except asyncio.IncompleteReadError as e:
+            if e.partial:
+                await self.send_error(writer, "400 Bad Request", "Bad Request")
+            return None
+        except RequestTimeout:
+            await self.send_error(writer, "408 Request Timeout", "Request Timeout")
+            return None
+        except (asyncio.TimeoutError, ConnectionError):
+            return None
+        except (asyncio.LimitOverrunError, HeadTooLarge):
+            await self.send_error(writer, "431 Request Header Fields Too Large", "Headers Too Large")
+            return None
+        except BodyTooLarge:
+            await self.send_error(writer, "413 Payload Too Large", "Payload Too Large")
+            return None
+        except ValueError:
+            LOGGER.warning("Failed to parse request.", exc_info=True)
+            await self.send_error(writer, "400 Bad Request", "Bad Request")
+            return None
+
+        path, _, query_string = target.partition("?")
+        return Request(
+            method=method,
+            path=path,
+            headers=headers,
+            body=BufferedBody(body),
+            version=version,
+            query_string=query_string,
+        )
+
+    async def handle_request(self, request: Request) -> Response:
+        mount = self.mounts.match(request.path)
+        if mount is None:
+            return Response(status="404 Not Found", content="Not Found")
+
+        path_prefix, handler = mount
+        try:
+            request.strip_prefix(path_prefix)
+            if is_async_handler(handler):
+                return await handler(request)  # type: ignore
+
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self.executor, cast(HandlerT, handler), request)
+        except MalformedForm:
+            return Response(status="400 Bad Request", content="Bad Request")
+        except Exception:
+            LOGGER.exception("Unexpected error from handler %r.", handler)
+            return Response(status="500 Internal Server Error", content="Internal Error")
+
+    async def send_error(self, writer: asyncio.StreamWriter, status: str, content: str) -> None:
+        response = Response(status=status, content=content)
+        response.headers.add("connection", "close")
+        await response.send_async(writer)
+
+
+class TransferBudget:
+    """Limits how long a request body may take to arrive.  Receiving n
+    bytes may take at most timeout + n / min_rate seconds (see
+    transfer_time_left).  A timeout of None means there's no limit.
+    """
+
+    def __init__(self, timeout: Optional[float] = None, min_rate: Optional[float] = None) -> None:
+        self.timeout = timeout
+        self.min_rate = min_rate
+        self.received = 0
+        self.started_at = time.monotonic()
+
+    async def read(self, aw: Awaitable[bytes]) -> bytes:
+        """Await a read, giving up once the budget runs out.
+
+        Raises:
+          RequestTimeout: When the budget runs out.
+        """
+        if self.timeout is None:
+            data = await aw
+        else:
+            elapsed = time.monotonic() - self.started_at
+            time_left = transfer_time_left(self.timeout, self.min_rate, self.received, elapsed)
+            try:
+                data = await asyncio.wait_for(aw, max(time_left, 0))
+            except asyncio.TimeoutError:
+                raise RequestTimeout("Timed out reading request body.")
+
+        self.received += len(data)
+        return data
+
+
+async def read_exactly(reader: asyncio.StreamReader, n: int, budget: TransferBudget, bufsize: int = 65_536) -> bytes:
+    """Read exactly n bytes off of a stream a piece at a time so that
+    the budget grows as data arrives.
+
+    Raises:
+      IncompleteReadError: When the stream ends early.
+      RequestTimeout: When the budget runs out.
+    """
+    data = bytearray()
+    while len(data) < n:
+        chunk = await budget.read(reader.read(min(n - len(data), bufsize)))
+        if not chunk:
+            raise asyncio.IncompleteReadError(bytes(data), n)
+        data += chunk
+    return bytes(data)
+
+
+async def read_chunked_body(
+        reader: asyncio.StreamReader,
+        max_size: Optional[int] = None,
+        budget: Optional[TransferBudget] = None,
+) -> bytes:
+    """Read and decode a chunked request body off of a stream.
+
+    Raises:
+      BodyTooLarge: When the decoded body is larger than max_size.
+      RequestTimeout: When the budget runs out.
+      ValueError: When the body is malformed.
+    """
+    budget = budget or TransferBudget()
+    body = bytearray()
+    while True:
+        try:
+            line = await budget.read(reader.readuntil(b"\r\n"))
+        except asyncio.LimitOverrunError:
+            raise ValueError("Chunk line too long.")
+
+        size = parse_chunk_size(line[:-2])
+        if size == 0:
+            # Trailers aren't exposed to handlers.
+            while await budget.read(reader.readuntil(b"\r\n")) != b"\r\n":
+                pass
+
+            return bytes(body)
+
+        if max_size is not None and len(body) + size > max_size:
+            raise BodyTooLarge("Request body too large.")
+
+        body += await read_exactly(reader, size, budget)
+        if await read_exactly(reader, 2, budget) != b"\r\n":
+            raise ValueError("Malformed chunk terminator.")
+
+
+def raise_open_files_limit() -> None:
+    """Raise the soft limit on open file descriptors up to the hard
+    limit so that the server can hold on to as many idle connections
+    as the system allows.
+    """
+    if resource is None:  # pragma: no cover
+        return
+
+    try:
+        _, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard_limit, hard_limit))
+    except (ValueError, OSError):  # pragma: no cover
+        LOGGER.warning("Failed to raise the open files limit.", exc_info=True)
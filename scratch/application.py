@@ -1,68 +1,336 @@
-import re
-from collections import OrderedDict, defaultdict
-from functools import partial
-from typing import Callable, Dict, Optional, Pattern, Set, Tuple
+from functools import partial, wraps
+from typing import (Any, Callable, Dict, Iterator, List, NamedTuple, Optional,
+                    Sequence, Set, Tuple)
 
 from .request import Request
 from .response import Response
 from .server import HandlerT
 
-RouteT = Tuple[Pattern[str], HandlerT]
-RoutesT = Dict[str, Dict[str, RouteT]]
 RouteHandlerT = Callable[..., Response]
+MiddlewareT = Callable[[RouteHandlerT], RouteHandlerT]
+BeforeHookT = Callable[[Request], Optional[Response]]
+AfterHookT = Callable[[Request, Response], Response]
+ConverterT = Callable[[str], Any]
+ParamsT = Dict[str, Any]
+
+
+def convert_str(segment: str) -> str:
+    if not segment:
+        raise ValueError("empty segment")
+    return segment
+
+
+def convert_int(segment: str) -> int:
+    if not segment.isdigit():
+        raise ValueError(f"{segment!r} is not an int")
+    return int(segment)
+
+
+#: The converters that can be used in route templates (eg. "{id:int}").
+#: The "path" converter is special in that it consumes the remainder
+#: of the path so it may only be used for the last segment of a route.
+CONVERTERS: Dict[str, ConverterT] = {
+    "str": convert_str,
+    "int": convert_int,
+    "path": convert_str,
+}
+
+
+class Route(NamedTuple):
+    name: str
+    method: str
+    path: str
+    handler: RouteHandlerT
+    middleware: Tuple[MiddlewareT, ...] = ()
+
+
+class RouteNode:
+    """A node in the Router's segment tree.  Static children are tried
+    first, then dynamic children in order of specificity and, finally,
+    the catch-all ("path") child, if any.
+    """
+
+    def __init__(self) -> None:
+        self.static: Dict[str, RouteNode] = {}
+        self.dynamic: List[Tuple[str, str, RouteNode]] = []
+        self.catch_all: Optional[Tuple[str, RouteNode]] = None
+        self.routes: Dict[str, Route] = {}
+
+    def add_dynamic(self, param_name: str, converter_name: str) -> "RouteNode":
+        for name, converter, node in self.dynamic:
+            if (name, converter) == (param_name, converter_name):
+                return node
+
+        node = RouteNode()
+        self.dynamic.append((param_name, converter_name, node))
+        self.dynamic.sort(key=lambda child: child[1] == "str")
+        return node
+
+    def match(
+            self,
+            segments: List[str],
+            index: int = 0,
+            params: Optional[ParamsT] = None,
+    ) -> Iterator[Tuple["RouteNode", ParamsT]]:
+        """Generate every node (and the params captured on the way to
+        it) that matches segments[index:], in priority order.
+        """
+        params = params or {}
+        if index == len(segments):
+            if self.routes:
+                yield self, params
+            return
+
+        segment = segments[index]
+        child = self.static.get(segment)
+        if child is not None:
+            yield from child.match(segments, index + 1, params)
+
+        for param_name, converter_name, child in self.dynamic:
+            try:
+                value = CONVERTERS[converter_name](segment)
+            except ValueError:
+                continue
+
+            yield from child.match(segments, index + 1, {**params, param_name: value})
+
+        if self.catch_all is not None and segment:
+            param_name, child = self.catch_all
+            yield child, {**params, param_name: "/".join(segments[index:])}
 
 
 class Router:
+    """Routes requests to handlers using a tree of path segments so
+    that lookups take time proportional to the depth of the path
+    rather than to the number of routes.
+
+    Route templates may contain dynamic segments like "{name}",
+    "{id:int}" or "{filename:path}".
+    """
+
     def __init__(self) -> None:
-        self.routes_by_method: RoutesT = defaultdict(OrderedDict)
-        self.route_names: Set[str] = set()
+        self.root = RouteNode()
+        self.routes_by_name: Dict[str, Route] = {}
+
+        # Nodes of routes without any dynamic segments, keyed by path.
+        # These always take priority so they can skip the tree walk.
+        self.static_nodes: Dict[str, RouteNode] = {}
 
-    def add_route(self, name: str, method: str, path: str, handler: RouteHandlerT) -> None:
+    @property
+    def route_names(self) -> Set[str]:
+        return set(self.routes_by_name)
+
+    def add_route(
+            self,
+            name: str,
+            method: str,
+            path: str,
+            handler: RouteHandlerT,
+            middleware: Sequence[MiddlewareT] = (),
+    ) -> None:
         assert path.startswith("/"), "paths must start with '/'"
-        if name in self.route_names:
+        if name in self.routes_by_name:
             raise ValueError(f"A route named {name} already exists.")
 
-        route_template = ""
-        for segment in path.split("/")[1:]:
+        node = self.root
+        segments = path.split("/")[1:]
+        is_static = True
+        for i, segment in enumerate(segments):
             if segment.startswith("{") and segment.endswith("}"):
-                segment_name = segment[1:-1]
-                route_template += f"/(?P<{segment_name}>[^/]+)"
+                is_static = False
+                param_name, _, converter_name = segment[1:-1].partition(":")
+                converter_name = converter_name or "str"
+                if converter_name not in CONVERTERS:
+                    raise ValueError(f"Unknown converter {converter_name!r} in route {path!r}.")
+
+                if converter_name == "path":
+                    if i != len(segments) - 1:
+                        raise ValueError(f"Path segments must come last in route {path!r}.")
+
+                    if node.catch_all is None:
+                        node.catch_all = param_name, RouteNode()
+                    elif node.catch_all[0] != param_name:
+                        raise ValueError(f"Conflicting path segment in route {path!r}.")
+
+                    node = node.catch_all[1]
+                else:
+                    node = node.add_dynamic(param_name, converter_name)
             else:
-                route_template += f"/{segment}"
+                node = node.static.setdefault(segment, RouteNode())
 
-        route_re = re.compile(f"^{route_template}$")
-        self.routes_by_method[method][name] = route_re, handler
-        self.route_names.add(name)
+        if method in node.routes:
+            raise ValueError(f"A route for {method} {path} already exists.")
 
-    def lookup(self, method: str, path: str) -> Optional[HandlerT]:
-        for route_re, handler in self.routes_by_method[method].values():
-            match = route_re.match(path)
-            if match is not None:
-                params = match.groupdict()
-                return partial(handler, **params)
+        route = Route(name, method, path, handler, tuple(middleware))
+        node.routes[method] = route
+        self.routes_by_name[name] = route
+        if is_static:
+            self.static_nodes[path] = node
+
+    def match(self, method: str, path: str) -> Optional[Tuple[Route, ParamsT]]:
+        """Find the route matching a method and path.  Returns the
+        route along with the params captured from the path.
+        """
+        static_node = self.static_nodes.get(path)
+        if static_node is not None and method in static_node.routes:
+            return static_node.routes[method], {}
+
+        for node, params in self.root.match(path.split("/")[1:]):
+            route = node.routes.get(method)
+            if route is not None:
+                return route, params
         return None
 
+    def lookup(self, method: str, path: str) -> Optional[HandlerT]:
+        match = self.match(method, path)
+        if match is None:
+            return None
+
+        route, params = match
+        return partial(route.handler, **params)
+
+    def allowed_methods(self, path: str) -> Set[str]:
+        """Get the set of methods that routes matching path respond to.
+        """
+        methods: Set[str] = set()
+        for node, _ in self.root.match(path.split("/")[1:]):
+            methods.update(node.routes)
+        return methods
+
+
+def before(hook: BeforeHookT) -> MiddlewareT:
+    """Turn a function that runs before handlers into middleware.  If
+    the hook returns a response, then it is returned instead of
+    calling the handler.
+    """
+
+    def middleware(handler: RouteHandlerT) -> RouteHandlerT:
+        @wraps(handler)
+        def wrapper(request: Request, **params: Any) -> Response:
+            response = hook(request)
+            if response is not None:
+                return response
+            return handler(request, **params)
+        return wrapper
+    return middleware
+
+
+def after(hook: AfterHookT) -> MiddlewareT:
+    """Turn a function that takes a request and the response a handler
+    produced for it and returns a (possibly different) response into
+    middleware.
+    """
+
+    def middleware(handler: RouteHandlerT) -> RouteHandlerT:
+        @wraps(handler)
+        def wrapper(request: Request, **params: Any) -> Response:
+            return hook(request, handler(request, **params))
+        return wrapper
+    return middleware
+
+
+def tag_route(route: Route) -> RouteHandlerT:
+    """Wrap a route's handler so that its responses are tagged with
+    the route's name.
+    """
+    handler = route.handler
+
+    def wrapper(request: Request, **params: Any) -> Response:
+        response = handler(request, **params)
+        response.route_name = route.name
+        return response
+    return wrapper
+
 
 class Application:
+    """Routes requests to handlers through a pipeline of middleware.
+
+    Middleware are functions that take a handler and return a new
+    handler that wraps it.  Global middleware apply to every request,
+    including ones that don't match any route, and wrap around the
+    middleware of individual routes.  In both cases, middleware added
+    first end up outermost.  The call chain of every route is built
+    once, the first time the application is called, rather than on
+    every request.
+    """
+
     def __init__(self) -> None:
         self.router = Router()
+        self.middleware: List[MiddlewareT] = []
+        self.chains: Optional[Dict[str, RouteHandlerT]] = None
+        self.fallback_chain: RouteHandlerT = self.handle_unrouted
 
-    def add_route(self, method: str, path: str, handler: RouteHandlerT, name: Optional[str] = None) -> None:
-        self.router.add_route(name or handler.__name__, method, path, handler)
+    def add_middleware(self, middleware: MiddlewareT) -> None:
+        self.middleware.append(middleware)
+        self.chains = None
+
+    def add_route(
+            self,
+            method: str,
+            path: str,
+            handler: RouteHandlerT,
+            name: Optional[str] = None,
+            middleware: Sequence[MiddlewareT] = (),
+    ) -> None:
+        self.router.add_route(name or handler.__name__, method, path, handler, middleware)
+        self.chains = None
 
     def route(
             self,
             path: str,
             method: str = "GET",
             name: Optional[str] = None,
+            middleware: Sequence[MiddlewareT] = (),
     ) -> Callable[[RouteHandlerT], RouteHandlerT]:
         def decorator(handler: RouteHandlerT) -> RouteHandlerT:
-            self.add_route(method, path, handler, name)
+            self.add_route(method, path, handler, name, middleware)
             return handler
         return decorator
 
+    def compile(self) -> Dict[str, RouteHandlerT]:
+        """Build the call chain of every route.  This is done lazily
+        but may be called ahead of time to avoid the cost on the first
+        request.
+        """
+        chains = {}
+        for route in self.router.routes_by_name.values():
+            handler = tag_route(route)
+            for middleware in reversed((*self.middleware, *route.middleware)):
+                handler = middleware(handler)
+
+            chains[route.name] = handler
+
+        fallback_chain = self.handle_unrouted
+        for middleware in reversed(self.middleware):
+            fallback_chain = middleware(fallback_chain)
+
+        self.fallback_chain = fallback_chain
+        self.chains = chains
+        return chains
+
+    def handle_unrouted(self, request: Request) -> Response:
+        allowed_methods = self.router.allowed_methods(request.path)
+        if allowed_methods:
+            response = Response("405 Method Not Allowed", content="Method Not Allowed")
+            response.headers.add("allow", ", ".join(sorted(allowed_methods)))
+            return response
+
+        return Response("404 Not Found", content="Not Found")
+
     def __call__(self, request: Request) -> Response:
-        handler = self.router.lookup(request.method, request.path)
-        if handler is None:
-            return Response("404 Not Found", content="Not Found")
-        return handler(request)
+        chains = self.chains
+        if chains is None:
+            chains = self.compile()
+
+        match = self.router.match(request.method, request.path)
+        if match is None:
+            return self.fallback_chain(request)
+
+        route, params = match
+        response = chains[route.name](request, **params)
+
+        # Responses from middleware that short-circuited the route's
+        # handler still belong to the route.
+        if response.route_name is None:
+            response.route_name = route.name
+        return response
@@ -0,0 +1,259 @@
+import io
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import (Any, Callable, Dict, Hashable, NamedTuple, Optional,
+                    Sequence, Set, Tuple)
+
+from .headers import Headers
+from .request import Request
+from .response import Response
+
+LOGGER = logging.getLogger(__name__)
+
+RouteHandlerT = Callable[..., Response]
+KeyT = Tuple[Hashable, ...]
+
+#: The methods whose responses may be cached.
+CACHEABLE_METHODS = {"GET", "HEAD"}
+
+
+class CachedResponse(Response):
+    """A response served from the cache.  Each one gets its own copy
+    of the cached headers so that middleware outside of the cache and
+    the server (eg. when it adds connection headers) can change them
+    without affecting the cache entry.
+    """
+
+    def __init__(
+            self,
+            status: bytes,
+            headers: Sequence[Tuple[str, str]],
+            body: bytes,
+            route_name: Optional[str] = None,
+    ) -> None:
+        response_headers = Headers()
+        for name, value in headers:
+            response_headers.add(name, value)
+
+        super().__init__(headers=response_headers, body=io.BytesIO(body))
+        self.status = status
+        self.route_name = route_name
+
+
+class CacheEntry(NamedTuple):
+    route_name: Optional[str]
+    status: bytes
+    headers: Tuple[Tuple[str, str], ...]
+    body: bytes
+    expires_at: float
+    stale_until: float
+
+    @property
+    def size(self) -> int:
+        """The approximate size of this entry's response on the wire.
+        """
+        head_size = len(b"HTTP/1.1 \r\n") + len(self.status)
+        head_size += sum(len(name) + len(value) + len(": \r\n") for name, value in self.headers)
+        return head_size + len(self.body)
+
+    def to_response(self) -> CachedResponse:
+        return CachedResponse(self.status, self.headers, self.body, self.route_name)
+
+
+class ResponseCache:
+    """Middleware that caches the responses of GET and HEAD requests.
+    Cache hits never reach the handler.
+
+    Responses are keyed by method, path, query string, route params
+    and the values of the request headers named in vary.  Only 200
+    responses with in-memory bodies that don't set cookies or opt out
+    via Cache-Control are cached.
+
+    Compression middleware should go inside of the cache (i.e. after
+    it in a route's middleware) so that entries hold encoded bodies and
+    hits don't have to compress them again.
+
+    Concurrent misses for the same key are coalesced so that the
+    handler is only called once.  Entries that are expired by less
+    than stale_while_revalidate seconds are served while they are
+    refreshed in the background.
+
+    Parameters:
+      ttl: The number of seconds entries are fresh for.
+      stale_while_revalidate: The number of seconds past their ttl
+        that entries may still be served for while being refreshed.
+      max_size: The max number of bytes of responses to hold on to.
+      vary: The names of the request headers responses vary by.
+    """
+
+    def __init__(
+            self,
+            ttl: float = 1.0,
+            stale_while_revalidate: float = 0.0,
+            max_size: int = 64 * 1024 * 1024,
+            vary: Sequence[str] = ("accept-encoding",),
+    ) -> None:
+        self.ttl = ttl
+        self.stale_while_revalidate = stale_while_revalidate
+        self.max_size = max_size
+        self.vary = tuple(name.lower() for name in vary)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[KeyT, CacheEntry]" = OrderedDict()
+        self._keys_by_route: Dict[Optional[str], Set[KeyT]] = {}
+        self._in_flight: Dict[KeyT, Future] = {}
+        self._refreshing: Set[KeyT] = set()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __call__(self, handler: RouteHandlerT) -> RouteHandlerT:
+        def wrapper(request: Request, **params: Any) -> Response:
+            if request.method not in CACHEABLE_METHODS:
+                return handler(request, **params)
+
+            key = self.make_key(request, params)
+            now = time.monotonic()
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and now < entry.stale_until:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    if now >= entry.expires_at and key not in self._refreshing:
+                        self._refreshing.add(key)
+                        threading.Thread(
+                            target=self.refresh,
+                            args=(key, handler, request, params),
+                            daemon=True,
+                        ).start()
+
+                    return entry.to_response()
+
+                self.misses += 1
+                future = self._in_flight.get(key)
+                if future is None:
+                    future = self._in_flight[key] = Future()
+                    generation = self._generation
+                    is_leader = True
+                else:
+                    is_leader = False
+
+            if not is_leader:
+                entry = future.result()
+                if entry is None:
+                    return handler(request, **params)
+                return entry.to_response()
+
+            entry = None
+            try:
+                response = handler(request, **params)
+                entry = self.store(key, response, generation)
+            finally:
+                with self._lock:
+                    del self._in_flight[key]
+                future.set_result(entry)
+
+            if entry is None:
+                return response
+            return entry.to_response()
+
+        return wrapper
+
+    def make_key(self, request: Request, params: Dict[str, Any]) -> KeyT:
+        return (
+            request.method,
+            request.path,
+            request.query_string,
+            tuple(sorted(params.items())) if params else (),
+            tuple(request.headers.get(name) for name in self.vary),
+        )
+
+    def refresh(self, key: KeyT, handler: RouteHandlerT, request: Request, params: Dict[str, Any]) -> None:
+        try:
+            with self._lock:
+                generation = self._generation
+
+            self.store(key, handler(request, **params), generation)
+        except Exception:
+            LOGGER.exception("Failed to refresh cache entry %r.", key)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def store(self, key: KeyT, response: Response, generation: int) -> Optional[CacheEntry]:
+        """Encode response and store it under key unless it can't be
+        cached.  Entries computed before the last invalidation are
+        discarded since they may be outdated.
+        """
+        if not is_cacheable(response):
+            return None
+
+        body = response.body.getvalue()  # type: ignore
+        response.headers.remove("content-length")
+        response.headers.add("content-length", str(len(body)))
+
+        now = time.monotonic()
+        entry = CacheEntry(
+            route_name=response.route_name,
+            status=response.status,
+            headers=tuple(response.headers),
+            body=body,
+            expires_at=now + self.ttl,
+            stale_until=now + self.ttl + self.stale_while_revalidate,
+        )
+        if entry.size > self.max_size:
+            return entry
+
+        with self._lock:
+            if generation != self._generation:
+                return entry
+
+            self._remove(key)
+            self._entries[key] = entry
+            self._keys_by_route.setdefault(entry.route_name, set()).add(key)
+            self.size += entry.size
+            while self.size > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+        return entry
+
+    def invalidate(self, route_name: str) -> None:
+        """Drop every entry produced by the route called route_name.
+        """
+        with self._lock:
+            self._generation += 1
+            for key in list(self._keys_by_route.get(route_name, ())):
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._keys_by_route.clear()
+            self.size = 0
+
+    def _remove(self, key: KeyT) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+            keys = self._keys_by_route.get(entry.route_name)
+            if keys is not None:
+                keys.discard(key)
+
+
+def is_cacheable(response: Response) -> bool:
+    if not response.status.startswith(b"200 ") or isinstance(response, CachedResponse) or \
+            not isinstance(response.body, io.BytesIO):
+        return False
+
+    if response.headers.get("set-cookie") is not None:
+        return False
+
+    cache_control = response.headers.get("cache-control", "").lower()
+    return "no-store" not in cache_control and "private" not in cache_control
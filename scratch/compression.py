@@ -0,0 +1,312 @@
+import io
+import threading
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import (IO, Any, Callable, Dict, Iterable, Iterator, List,
+                    NamedTuple, Optional, Sequence, Tuple)
+
+from .request import Request
+from .response import Response, StreamingResponse
+from .static import StaticFile, StaticFileCache
+
+try:
+    import brotli  # type: ignore
+except ImportError:  # pragma: no cover
+    brotli = None
+
+#: The content encodings that can be produced, in order of preference.
+ENCODINGS: List[str] = ["br", "gzip"] if brotli is not None else ["gzip"]
+
+#: The file extensions of precompressed static files, by encoding.
+FILE_EXTENSIONS: Dict[str, str] = {"br": ".br", "gzip": ".gz"}
+
+#: Content types worth compressing.  Entries ending in "/" match any
+#: subtype.
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "application/manifest+json",
+    "application/wasm",
+    "application/xml",
+    "image/svg+xml",
+)
+
+#: The compression levels used for dynamic responses, by encoding.
+#: These favor speed since responses are compressed on every request.
+DYNAMIC_LEVELS: Dict[str, int] = {"br": 4, "gzip": 6}
+
+#: The compression levels used for static files, by encoding.  These
+#: favor size since static files are compressed once and cached.
+STATIC_LEVELS: Dict[str, int] = {"br": 11, "gzip": 9}
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    if content_type is None:
+        return False
+
+    mime_type = content_type.split(";", 1)[0].strip().lower()
+    return any(
+        mime_type.startswith(compressible) if compressible.endswith("/") else mime_type == compressible
+        for compressible in COMPRESSIBLE_TYPES
+    )
+
+
+def negotiate_encoding(accept_encoding: Optional[str], available: Sequence[str]) -> Optional[str]:
+    """Pick the best encoding out of available according to the
+    client's Accept-Encoding header.  Ties are broken by the order of
+    available.  Returns None if the response shouldn't be encoded.
+    """
+    if not accept_encoding:
+        return None
+
+    qualities: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, *params = item.split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0
+
+        coding = coding.strip().lower()
+        qualities["gzip" if coding == "x-gzip" else coding] = quality
+
+    best_encoding, best_quality = None, 0.0
+    for encoding in available:
+        quality = qualities.get(encoding, qualities.get("*", 0))
+        if quality > best_quality:
+            best_encoding, best_quality = encoding, quality
+    return best_encoding
+
+
+class Compressor:
+    """A streaming compressor.  Every call to compress returns data
+    that can be decompressed up to the end of its input so chunks can
+    be flushed to clients as they are produced.
+    """
+
+    def __init__(self, encoding: str, level: int) -> None:
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=level)
+        else:
+            self._zlib = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+        self.encoding = encoding
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.finish()
+        return self._zlib.flush(zlib.Z_FINISH)
+
+
+def compress(data: bytes, encoding: str, level: int) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    return zlib.compress(data, level, wbits=31)
+
+
+def compress_chunks(chunks: Iterable[bytes], encoding: str, level: int) -> Iterator[bytes]:
+    compressor = Compressor(encoding, level)
+    try:
+        for chunk in chunks:
+            if chunk:
+                yield compressor.compress(chunk)
+
+        yield compressor.finish()
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+def iter_file(f: io.IOBase, bufsize: int = 65_536) -> Iterator[bytes]:
+    try:
+        while True:
+            data = f.read(bufsize)
+            if not data:
+                break
+
+            yield data
+    finally:
+        f.close()
+
+
+def compress_response(request: Request, response: Response, min_size: int = 1024) -> Response:
+    """Compress response according to request's Accept-Encoding header.
+
+    In-memory bodies smaller than min_size bytes are left alone, other
+    in-memory bodies are compressed in one go and file and streaming
+    bodies are compressed as they are sent.
+    """
+    content_type = response.headers.get("content-type")
+    if not response.status.startswith(b"200") or \
+            response.headers.get("content-encoding") is not None or \
+            not is_compressible(content_type):
+        return response
+
+    response.headers.add("vary", "accept-encoding")
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"), ENCODINGS)
+    if encoding is None:
+        return response
+
+    level = DYNAMIC_LEVELS[encoding]
+    if isinstance(response, StreamingResponse):
+        if isinstance(response.chunks, Iterable):
+            response.headers.remove("content-length")
+            response.headers.add("content-encoding", encoding)
+            response.chunks = compress_chunks(response.chunks, encoding, level)
+        return response
+
+    if isinstance(response.body, io.BytesIO):
+        data = response.body.getvalue()
+        if len(data) < min_size:
+            return response
+
+        response.body = io.BytesIO(compress(data, encoding, level))
+        response.headers.remove("content-length")
+        response.headers.add("content-encoding", encoding)
+        return response
+
+    streaming_response = StreamingResponse(
+        response.status.decode(),
+        headers=response.headers,
+        chunks=compress_chunks(iter_file(response.body), encoding, level),  # type: ignore
+    )
+    streaming_response.route_name = response.route_name
+    streaming_response.headers.remove("content-length")
+    streaming_response.headers.add("content-encoding", encoding)
+    return streaming_response
+
+
+def compressed(handler: Callable[..., Response], *, min_size: int = 1024) -> Callable[..., Response]:
+    """Wrap handler so that its responses are compressed according to
+    each request's Accept-Encoding header.  This can also be used as
+    Application middleware.
+    """
+
+    def wrapper(request: Request, **params: Any) -> Response:
+        return compress_response(request, handler(request, **params), min_size)
+
+    return wrapper
+
+
+class StaticVariant(NamedTuple):
+    """An encoded representation of a static file.  Its data is either
+    in memory or in a precompressed file on disk.
+    """
+
+    encoding: str
+    etag: str
+    size: int
+    abspath: Optional[str]
+    data: Optional[bytes]
+
+    def open(self) -> IO[bytes]:
+        if self.data is not None:
+            return io.BytesIO(self.data)
+        return open(self.abspath, "rb")  # type: ignore
+
+
+class CompressedFileCache:
+    """Finds or produces encoded variants of static files.
+
+    Precompressed siblings (eg. "site.css.gz" next to "site.css") are
+    preferred.  Files without siblings that are at most max_file_size
+    bytes large are compressed once and kept in an LRU cache holding
+    up to max_size bytes of compressed data.  Entries are keyed by the
+    file's ETag so they're invalidated whenever the file changes.
+    Concurrent misses for the same entry wait for a single thread to
+    compress the file.
+    """
+
+    def __init__(self, max_size: int = 32 * 1024 * 1024, max_file_size: int = 1024 * 1024) -> None:
+        self.max_size = max_size
+        self.max_file_size = max_file_size
+        self._entries: "OrderedDict[Tuple[str, str, str], bytes]" = OrderedDict()
+        self._size = 0
+        self._in_flight: Dict[Tuple[str, str, str], Future] = {}
+        self._lock = threading.Lock()
+
+    def get_variant(
+            self,
+            accept_encoding: Optional[str],
+            file_cache: StaticFileCache,
+            server_root: str,
+            path: str,
+            static_file: StaticFile,
+    ) -> Optional[StaticVariant]:
+        """Get the best encoded variant of static_file for a client
+        given its Accept-Encoding header.  Returns None if the file
+        should be served as-is.
+        """
+        if not accept_encoding:
+            return None
+
+        available, siblings = [], {}
+        for encoding in ENCODINGS:
+            sibling = file_cache.get(server_root, path + FILE_EXTENSIONS[encoding])
+            if sibling is not None:
+                siblings[encoding] = sibling
+                available.append(encoding)
+            elif static_file.size <= self.max_file_size:
+                available.append(encoding)
+
+        best_encoding = negotiate_encoding(accept_encoding, available)
+        if best_encoding is None:
+            return None
+
+        etag = f'{static_file.etag[:-1]}-{best_encoding}"'
+        sibling = siblings.get(best_encoding)
+        if sibling is not None:
+            return StaticVariant(best_encoding, etag, sibling.size, sibling.abspath, None)
+
+        data = self.compress_file(static_file, best_encoding)
+        return StaticVariant(best_encoding, etag, len(data), None, data)
+
+    def compress_file(self, static_file: StaticFile, encoding: str) -> bytes:
+        key = static_file.abspath, static_file.etag, encoding
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                return data
+
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self._in_flight[key] = Future()
+                is_leader = True
+            else:
+                is_leader = False
+
+        if not is_leader:
+            return future.result()
+
+        try:
+            with open(static_file.abspath, "rb") as f:
+                data = compress(f.read(), encoding, STATIC_LEVELS[encoding])
+        except Exception as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._in_flight[key]
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+        future.set_result(data)
+        return data
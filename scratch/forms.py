@@ -0,0 +1,286 @@
+import re
+import tempfile
+import typing
+from urllib.parse import parse_qsl
+
+#: The size above which uploaded files are moved from memory to a
+#: temporary file on disk, in bytes.
+MAX_SPOOL_SIZE = 1024 * 1024
+
+#: The max size of the headers of a single multipart part, in bytes.
+MAX_PART_HEAD_SIZE = 16_384
+
+#: The max size of a non-file multipart field, in bytes.
+MAX_FIELD_SIZE = 1024 * 1024
+
+OPTION_RE = re.compile(r';\s*([^\s=;]+)\s*=\s*("(?:[^"\\]|\\.)*"|[^;]*)')
+
+T = typing.TypeVar("T")
+
+
+class MalformedForm(ValueError):
+    """Raised when a request body cannot be parsed as a form.
+    """
+
+
+class Params(typing.Generic[T]):
+    """A mapping from names to lists of values, for query strings and
+    form fields where names may be repeated.
+    """
+
+    __slots__ = ("_params",)
+
+    def __init__(self, pairs: typing.Iterable[typing.Tuple[str, T]] = ()) -> None:
+        self._params: typing.Dict[str, typing.List[T]] = {}
+        for name, value in pairs:
+            self.add(name, value)
+
+    def add(self, name: str, value: T) -> None:
+        values = self._params.get(name)
+        if values is None:
+            self._params[name] = [value]
+        else:
+            values.append(value)
+
+    def get_all(self, name: str) -> typing.List[T]:
+        return self._params.get(name, [])
+
+    @typing.overload
+    def get(self, name: str) -> typing.Optional[T]:
+        ...
+
+    @typing.overload
+    def get(self, name: str, default: T) -> T:
+        ...
+
+    def get(self, name: str, default: typing.Optional[T] = None) -> typing.Optional[T]:
+        """Get the first value of the parameter called name.
+        """
+        values = self._params.get(name)
+        if not values:
+            return default
+        return values[0]
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._params
+
+    def __len__(self) -> int:
+        return len(self._params)
+
+    def __iter__(self) -> typing.Iterator[typing.Tuple[str, T]]:
+        for name, values in self._params.items():
+            for value in values:
+                yield name, value
+
+
+class UploadedFile(typing.NamedTuple):
+    """A file uploaded as part of a multipart form.  Small files are
+    kept in memory, larger ones are spooled to a temporary file.
+    """
+
+    filename: str
+    content_type: str
+    file: typing.IO[bytes]
+
+
+def parse_options(value: str) -> typing.Tuple[str, typing.Dict[str, str]]:
+    """Parse a header value with options, such as a content-type or
+    content-disposition, into its main value and its options.
+
+    Examples:
+      >>> parse_options('form-data; name="a"; filename="a.txt"')
+      ('form-data', {'name': 'a', 'filename': 'a.txt'})
+    """
+    main, _, rest = value.partition(";")
+    options = {}
+    for match in OPTION_RE.finditer(";" + rest):
+        name, option_value = match.groups()
+        option_value = option_value.strip()
+        if option_value.startswith('"') and option_value.endswith('"') and len(option_value) > 1:
+            option_value = re.sub(r"\\(.)", r"\1", option_value[1:-1])
+        options[name.lower()] = option_value
+    return main.strip().lower(), options
+
+
+def parse_query(query_string: str) -> Params[str]:
+    return Params(parse_qsl(query_string, keep_blank_values=True))
+
+
+def parse_cookies(header: typing.Optional[str]) -> typing.Dict[str, str]:
+    """Parse a cookie header into a dict.  When a cookie is repeated,
+    its first value wins since user agents send more specific cookies
+    first.
+    """
+    cookies: typing.Dict[str, str] = {}
+    if not header:
+        return cookies
+
+    for pair in header.split(";"):
+        name, sep, value = pair.partition("=")
+        name = name.strip()
+        if not sep or not name or name in cookies:
+            continue
+
+        value = value.strip()
+        if len(value) > 1 and value[0] == value[-1] == '"':
+            value = value[1:-1]
+        cookies[name] = value
+    return cookies
+
+
+class MultipartParser:
+    """A streaming parser for multipart/form-data bodies.  The body is
+    read chunk_size bytes at a time and each file part is written to a
+    SpooledTemporaryFile so that large uploads never have to be held in
+    memory.
+
+    Parameters:
+      read: A function that reads up to n bytes from the body.
+      boundary: The boundary parameter of the body's content-type.
+      chunk_size: The max number of bytes to read at a time.
+      max_spool_size: The size above which files are moved to disk.
+    """
+
+    def __init__(
+            self,
+            read: typing.Callable[[int], bytes],
+            boundary: str,
+            *,
+            chunk_size: int = 65_536,
+            max_spool_size: int = MAX_SPOOL_SIZE,
+    ) -> None:
+        if not boundary or len(boundary) > 70:
+            raise MalformedForm("Invalid multipart boundary.")
+
+        self.read = read
+        self.delimiter = b"\r\n--" + boundary.encode("latin-1")
+        self.chunk_size = chunk_size
+        self.max_spool_size = max_spool_size
+        # The first delimiter isn't preceded by a CRLF unless there's
+        # a preamble, so one is added to treat every delimiter the same.
+        self.buff = bytearray(b"\r\n")
+        self.eof = False
+
+    def parse(self) -> typing.Tuple[Params[str], Params[UploadedFile]]:
+        """Parse the body into its fields and files.
+
+        Raises:
+          MalformedForm: When the body is not a valid multipart body.
+        """
+        fields: Params[str] = Params()
+        files: Params[UploadedFile] = Params()
+        self.read_part(None)
+        while True:
+            self.fill_to(2)
+            if self.buff.startswith(b"--"):
+                return fields, files
+
+            # Transport padding may follow delimiters.
+            if self.read_until(b"\r\n").strip(b" \t"):
+                raise MalformedForm("Malformed multipart delimiter.")
+
+            disposition, content_type = self.read_part_head()
+            _, options = parse_options(disposition)
+            field_name = options.get("name")
+            if field_name is None:
+                raise MalformedForm("Multipart part without a name.")
+
+            filename = options.get("filename")
+            if filename is None:
+                data = bytearray()
+
+                def write_field(chunk: bytes) -> None:
+                    data.extend(chunk)
+                    if len(data) > MAX_FIELD_SIZE:
+                        raise MalformedForm(f"Field {field_name!r} too large.")
+
+                self.read_part(write_field)
+                _, content_type_options = parse_options(content_type)
+                fields.add(field_name, data.decode(content_type_options.get("charset", "utf-8"), "replace"))
+            else:
+                f = tempfile.SpooledTemporaryFile(max_size=self.max_spool_size)
+                self.read_part(f.write)
+                f.seek(0)
+                files.add(field_name, UploadedFile(filename, content_type, typing.cast(typing.IO[bytes], f)))
+
+    def read_part_head(self) -> typing.Tuple[str, str]:
+        """Read a part's headers and return its content-disposition
+        and content-type.
+        """
+        self.fill_to(2)
+        if self.buff.startswith(b"\r\n"):
+            del self.buff[:2]
+            head = b""
+        else:
+            head = self.read_until(b"\r\n\r\n")
+
+        disposition, content_type = "", "text/plain"
+        for line in head.decode("latin-1").split("\r\n"):
+            name, _, value = line.partition(":")
+            name = name.strip().lower()
+            if name == "content-disposition":
+                disposition = value
+            elif name == "content-type":
+                content_type = value.strip()
+        return disposition, content_type
+
+    def read_part(self, sink: typing.Optional[typing.Callable[[bytes], typing.Any]]) -> None:
+        """Read up to and past the next delimiter, passing everything
+        before it to sink.
+        """
+        buff, delimiter = self.buff, self.delimiter
+        while True:
+            i = buff.find(delimiter)
+            if i != -1:
+                if sink is not None:
+                    sink(bytes(buff[:i]))
+                del buff[:i + len(delimiter)]
+                return
+
+            if self.eof:
+                raise MalformedForm("Unexpected end of multipart body.")
+
+            # Keep enough data around to find delimiters that straddle
+            # the boundary between reads.
+            keep = len(delimiter) - 1
+            if len(buff) > keep:
+                if sink is not None:
+                    sink(bytes(buff[:-keep]))
+                del buff[:-keep]
+            self.fill()
+
+    def read_until(self, marker: bytes) -> bytes:
+        while True:
+            i = self.buff.find(marker)
+            if i != -1:
+                data = bytes(self.buff[:i])
+                del self.buff[:i + len(marker)]
+                return data
+
+            if len(self.buff) > MAX_PART_HEAD_SIZE or self.eof:
+                raise MalformedForm("Malformed multipart part.")
+            self.fill()
+
+    def fill_to(self, n: int) -> None:
+        while len(self.buff) < n and not self.eof:
+            self.fill()
+
+    def fill(self) -> None:
+        data = self.read(self.chunk_size)
+        if not data:
+            self.eof = True
+        self.buff += data
+
+
+def parse_multipart(
+        read: typing.Callable[[int], bytes],
+        boundary: str,
+        *,
+        max_spool_size: int = MAX_SPOOL_SIZE,
+) -> typing.Tuple[Params[str], Params[UploadedFile]]:
+    """Parse a multipart/form-data body into its fields and files.
+
+    Raises:
+      MalformedForm: When the body is not a valid multipart body.
+    """
+    return MultipartParser(read, boundary, max_spool_size=max_spool_size).parse()
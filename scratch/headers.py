@@ -1,32 +1,145 @@
-from collections import defaultdict
+COMMON_HEADER_NAMES = [
+    "accept", "accept-encoding", "accept-language", "accept-ranges", "allow", "authorization",
+    "cache-control", "connection", "content-encoding", "content-length", "content-range", "content-type",
+    "cookie", "date", "etag", "expect", "host", "if-match", "if-modified-since", "if-none-match",
+    "if-range", "if-unmodified-since", "last-modified", "location", "origin", "range", "referer",
+    "retry-after", "server", "set-cookie", "transfer-encoding", "upgrade", "user-agent", "vary",
+    "x-forwarded-for", "x-forwarded-proto", "x-request-id",
+]
+
+#: The max number of entries in each of the name caches.  This
+#: prevents arbitrary header names from growing them without bound.
+NAME_CACHE_SIZE = 512
+
+#: Lower-cased, interned header names keyed by their raw (wire) form.
+#: Common names are seeded in both lower and title case.
+RAW_NAMES = {}
+
+#: Lower-cased, interned header names keyed by the names they were
+#: added or looked up with.
+NAMES = {}
+
+#: Pre-encoded header name prefixes (eg. b"content-type: "), keyed by name.
+ENCODED_NAMES = {}
+
+for _name in COMMON_HEADER_NAMES:
+    NAMES[_name] = NAMES[_name.title()] = _name
+    RAW_NAMES[_name.encode()] = RAW_NAMES[_name.title().encode()] = _name
+    ENCODED_NAMES[_name] = f"{_name}: ".encode()
+
+
+def normalize_name(name):
+    normalized = NAMES.get(name)
+    if normalized is None:
+        lowered = name.lower()
+        normalized = NAMES.get(lowered, lowered)
+        if len(NAMES) < NAME_CACHE_SIZE:
+            NAMES[name] = normalized
+    return normalized
+
+
+def normalize_raw_name(name):
+    normalized = RAW_NAMES.get(name)
+    if normalized is None:
+        normalized = normalize_name(name.decode("latin-1"))
+        if len(RAW_NAMES) < NAME_CACHE_SIZE:
+            RAW_NAMES[name] = normalized
+    return normalized
+
+
+def encode_name(name):
+    prefix = ENCODED_NAMES.get(name)
+    if prefix is None:
+        prefix = name.encode() + b": "
+        if len(ENCODED_NAMES) < NAME_CACHE_SIZE:
+            ENCODED_NAMES[name] = prefix
+    return prefix
 
 
 class Headers:
     """A mapping from lower-cased header names to lists of string values.
+
+    Values may be added as raw bytes (eg. by the request parser), in
+    which case they're only decoded, as latin-1, once they are looked
+    up.  Looking up missing headers never modifies the mapping.
     """
 
+    __slots__ = ("_headers",)
+
     def __init__(self):
-        self._headers = defaultdict(list)
+        self._headers = {}
 
     def add(self, name, value):
-        self._headers[name.lower()].append(value)
+        name = normalize_name(name)
+        values = self._headers.get(name)
+        if values is None:
+            self._headers[name] = [value]
+        else:
+            values.append(value)
+
+    def add_raw(self, name, value):
+        """Add a header whose name and value are raw bytes read off of
+        the wire.  The value is decoded on first access.
+        """
+        name = normalize_raw_name(name)
+        values = self._headers.get(name)
+        if values is None:
+            self._headers[name] = [value]
+        else:
+            values.append(value)
+
+    def _lookup(self, name):
+        values = self._headers.get(name)
+        if values is None and not name.islower():
+            values = self._headers.get(normalize_name(name))
+        return values
 
     def get_all(self, name):
-        return self._headers[name.lower()]
+        values = self._lookup(name)
+        if values is None:
+            return []
+
+        for i, value in enumerate(values):
+            if isinstance(value, bytes):
+                values[i] = value.decode("latin-1")
+        return values
 
     def get(self, name, default=None):
-        try:
-            return self.get_all(name)[-1]
-        except IndexError:
+        values = self._lookup(name)
+        if not values:
             return default
 
+        value = values[-1]
+        if isinstance(value, bytes):
+            value = values[-1] = value.decode("latin-1")
+        return value
+
+    def remove(self, name):
+        self._headers.pop(normalize_name(name), None)
+
     def get_int(self, name):
         try:
             return int(self.get(name))
         except (TypeError, ValueError):
             return None
 
-    def __iter__(self):
+    def encode(self):
+        """Encode these headers as they are sent on the wire, with
+        each header line terminated by CRLF.
+        """
+        parts = []
         for name, values in self._headers.items():
+            prefix = encode_name(name)
             for value in values:
+                parts.append(prefix)
+                parts.append(value if isinstance(value, bytes) else value.encode())
+                parts.append(b"\r\n")
+        return b"".join(parts)
+
+    def __contains__(self, name):
+        return self._lookup(name) is not None
+
+    def __iter__(self):
+        for name in self._headers:
+            for value in self.get_all(name):
                 yield name, value
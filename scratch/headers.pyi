@@ -1,13 +1,37 @@
-from typing import Dict, Generator, List, Optional, Tuple, overload
+from typing import Dict, Generator, List, Optional, Tuple, Union, overload
 
-HeadersDict = Dict[str, List[str]]
+HeadersDict = Dict[str, List[Union[str, bytes]]]
 HeadersGenerator = Generator[Tuple[str, str], None, None]
 
+COMMON_HEADER_NAMES: List[str]
+NAME_CACHE_SIZE: int
+RAW_NAMES: Dict[bytes, str]
+NAMES: Dict[str, str]
+ENCODED_NAMES: Dict[str, bytes]
+
+
+def normalize_name(name: str) -> str:
+    ...
+
+
+def normalize_raw_name(name: bytes) -> str:
+    ...
+
+
+def encode_name(name: str) -> bytes:
+    ...
+
 
 class Headers:
     _headers: HeadersDict
 
-    def add(self, name: str, value: str) -> None:
+    def add(self, name: str, value: Union[str, bytes]) -> None:
+        ...
+
+    def add_raw(self, name: bytes, value: bytes) -> None:
+        ...
+
+    def _lookup(self, name: str) -> Optional[List[Union[str, bytes]]]:
         ...
 
     def get_all(self, name: str) -> List[str]:
@@ -21,8 +45,17 @@ class Headers:
     def get(self, name: str, default: str) -> str:
         ...
 
+    def remove(self, name: str) -> None:
+        ...
+
     def get_int(self, name: str) -> Optional[int]:
         ...
 
+    def encode(self) -> bytes:
+        ...
+
+    def __contains__(self, name: str) -> bool:
+        ...
+
     def __iter__(self) -> HeadersGenerator:
         ...
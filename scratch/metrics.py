@@ -0,0 +1,243 @@
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .request import Request
+from .response import Response
+
+#: The default upper bounds of latency histogram buckets, in seconds.
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+LabelsT = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """A histogram with fixed bucket upper bounds.  Counts are kept
+    per bucket and only made cumulative when rendered.
+    """
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other: "Histogram") -> None:
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+        self.count += other.count
+
+
+class MetricsShard:
+    """The metrics recorded by a single thread.  Every thread records
+    into its own shard so that the hot path never has to take a lock.
+    """
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = buckets
+        self.requests: Dict[Tuple[str, str, str], int] = {}
+        self.counters: Dict[str, int] = {}
+        self.latencies: Dict[Tuple[str, str], Histogram] = {}
+
+    def observe(self, route: str, phase: str, duration: float) -> None:
+        histogram = self.latencies.get((route, phase))
+        if histogram is None:
+            histogram = self.latencies[route, phase] = Histogram(self.buckets)
+        histogram.observe(duration)
+
+    def merge(self, other: "MetricsShard") -> None:
+        """Add other's metrics to this shard's.  Copying is atomic so
+        this is safe even though the thread that owns other might be
+        adding new keys concurrently.
+        """
+        for request_key, count in other.requests.copy().items():
+            self.requests[request_key] = self.requests.get(request_key, 0) + count
+
+        for latency_key, histogram in other.latencies.copy().items():
+            merged = self.latencies.get(latency_key)
+            if merged is None:
+                merged = self.latencies[latency_key] = Histogram(self.buckets)
+            merged.merge(histogram)
+
+        for name, count in other.counters.copy().items():
+            self.counters[name] = self.counters.get(name, 0) + count
+
+
+class Metrics:
+    """Collects request counts, latency histograms and gauges and
+    renders them in the Prometheus text exposition format.
+
+    Requests are labeled by the name of the route that handled them
+    or, for handlers that aren't routed by an Application, by the
+    prefix they were mounted at.  Each process keeps its own metrics.
+
+    Parameters:
+      buckets: The upper bounds of latency histogram buckets, in seconds.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets = sorted(buckets)
+        self.gauges: Dict[str, Tuple[str, Callable[[], float]]] = {}
+        self.counters: Dict[str, str] = {}
+        self._shards: List[MetricsShard] = []
+        # The metrics of threads that have exited.
+        self._retired = MetricsShard(self.buckets)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def shard(self) -> MetricsShard:
+        """The current thread's shard.
+        """
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = MetricsShard(self.buckets)
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def release_shard(self) -> None:
+        """Fold the current thread's shard into the totals of exited
+        threads.  Threads call this before exiting so that shards don't
+        pile up as threads come and go.
+        """
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            return
+
+        del self._local.shard
+        with self._lock:
+            self._shards.remove(shard)
+            self._retired.merge(shard)
+
+    def add_counter(self, name: str, description: str) -> None:
+        """Register a counter.  Counters are rendered even if they have
+        never been incremented.
+        """
+        self.counters[name] = description
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        shard = self.shard
+        shard.counters[name] = shard.counters.get(name, 0) + amount
+
+    def add_gauge(self, name: str, description: str, fn: Callable[[], float]) -> None:
+        """Register a gauge whose value is computed by calling fn every
+        time the metrics are rendered.
+        """
+        self.gauges[name] = description, fn
+
+    def observe_request(
+            self,
+            route: str,
+            method: str,
+            status: bytes,
+            parse_time: Optional[float] = None,
+            handler_time: Optional[float] = None,
+            send_time: Optional[float] = None,
+    ) -> None:
+        """Record a request that was responded to with status along
+        with the time, in seconds, spent in each phase of handling it.
+        """
+        shard = self.shard
+        key = route, method, status[:3].decode()
+        shard.requests[key] = shard.requests.get(key, 0) + 1
+        if parse_time is not None:
+            shard.observe(route, "parse", parse_time)
+        if handler_time is not None:
+            shard.observe(route, "handler", handler_time)
+        if send_time is not None:
+            shard.observe(route, "send", send_time)
+
+    def collect(self) -> Tuple[Dict[Tuple[str, str, str], int], Dict[Tuple[str, str], Histogram], Dict[str, int]]:
+        """Merge every thread's shard into a single set of request
+        counts, latency histograms and counters.
+        """
+        # Shards are merged into the retired totals under the lock, so
+        # taking both at once means every shard is counted exactly once.
+        total = MetricsShard(self.buckets)
+        with self._lock:
+            shards = list(self._shards)
+            total.merge(self._retired)
+
+        for shard in shards:
+            total.merge(shard)
+
+        counters: Dict[str, int] = dict.fromkeys(self.counters, 0)
+        counters.update(total.counters)
+        return total.requests, total.latencies, counters
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text format.
+        """
+        requests, latencies, counters = self.collect()
+        lines = [
+            "# HELP http_requests_total The number of requests served.",
+            "# TYPE http_requests_total counter",
+        ]
+        for (route, method, status), count in sorted(requests.items()):
+            labels: LabelsT = (("route", route), ("method", method), ("status", status))
+            lines.append(f"http_requests_total{format_labels(labels)} {count}")
+
+        lines.append("# HELP http_request_duration_seconds The time spent in each phase of handling requests.")
+        lines.append("# TYPE http_request_duration_seconds histogram")
+        for (route, phase), histogram in sorted(latencies.items()):
+            labels = (("route", route), ("phase", phase))
+            lines.extend(render_histogram("http_request_duration_seconds", labels, histogram))
+
+        for name, count in sorted(counters.items()):
+            lines.append(f"# HELP {name} {self.counters.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {count}")
+
+        for name, (description, fn) in sorted(self.gauges.items()):
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {format_value(fn())}")
+
+        lines.append("")
+        return "\n".join(lines)
+
+    def handler(self, request: Request) -> Response:
+        """A request handler that serves these metrics.  Mount it
+        wherever your Prometheus server expects to scrape from.
+        """
+        response = Response(content=self.render())
+        response.headers.add("content-type", "text/plain; version=0.0.4; charset=utf-8")
+        return response
+
+
+def format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    pairs = []
+    for name, value in labels:
+        value = value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def render_histogram(name: str, labels: LabelsT, histogram: Histogram) -> Iterable[str]:
+    cumulative_count = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative_count += count
+        yield f"{name}_bucket{format_labels(labels + (('le', format_value(bound)),))} {cumulative_count}"
+
+    cumulative_count += histogram.counts[-1]
+    yield f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {cumulative_count}"
+    yield f"{name}_sum{format_labels(labels)} {format_value(histogram.sum)}"
+    yield f"{name}_count{format_labels(labels)} {cumulative_count}"
@@ -0,0 +1,74 @@
+import typing
+
+H = typing.TypeVar("H")
+
+
+class MountNode(typing.Generic[H]):
+    """A node in a MountTable's segment tree.
+    """
+
+    __slots__ = ("children", "mount")
+
+    def __init__(self) -> None:
+        self.children: typing.Dict[str, MountNode[H]] = {}
+        self.mount: typing.Optional[typing.Tuple[str, H]] = None
+
+
+class MountTable(typing.Generic[H]):
+    """Maps path prefixes to the handlers mounted at them using a tree
+    of path segments so that finding the handler for a path takes time
+    proportional to its depth rather than to the number of mounts.
+
+    Prefixes match whole segments (eg. "/static" matches "/static" and
+    "/static/app.js" but not "/statics") and the longest matching
+    prefix wins.  Trailing slashes are ignored so "/" is the same as
+    "", which matches every path.
+    """
+
+    __slots__ = ("root",)
+
+    def __init__(self, mounts: typing.Iterable[typing.Tuple[str, H]] = ()) -> None:
+        self.root: MountNode[H] = MountNode()
+        for path_prefix, handler in mounts:
+            self.add(path_prefix, handler)
+
+    def add(self, path_prefix: str, handler: H) -> None:
+        """Mount handler at path_prefix.
+
+        Raises:
+          ValueError: When a handler is already mounted at path_prefix.
+        """
+        prefix = path_prefix.rstrip("/")
+        node = self.root
+        if prefix:
+            for segment in prefix.split("/"):
+                child = node.children.get(segment)
+                if child is None:
+                    child = node.children[segment] = MountNode()
+                node = child
+
+        if node.mount is not None:
+            raise ValueError(f"A handler is already mounted at {path_prefix!r}.")
+        node.mount = prefix, handler
+
+    def match(self, path: str) -> typing.Optional[typing.Tuple[str, H]]:
+        """Find the handler mounted at the longest prefix of path.
+        Returns the (normalized) prefix and the handler or None if
+        nothing matches.
+        """
+        node = self.root
+        match = node.mount
+        start = 0
+        while node.children:
+            end = path.find("/", start)
+            child = node.children.get(path[start:] if end == -1 else path[start:end])
+            if child is None:
+                break
+
+            node = child
+            if node.mount is not None:
+                match = node.mount
+            if end == -1:
+                break
+            start = end + 1
+        return match
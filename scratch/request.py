@@ -1,96 +1,697 @@
 import io
+import re
 import socket
+import sys
+import time
 import typing
 
+from .forms import (MalformedForm, Params, UploadedFile, parse_cookies,
+                    parse_multipart, parse_options, parse_query)
 from .headers import Headers
 
+#: The default max size of a request line and its headers, in bytes.
+MAX_HEAD_SIZE = 65_536
 
-class BodyReader(io.IOBase):
-    def __init__(self, sock: socket.socket, *, buff: bytes = b"", bufsize: int = 16_384) -> None:
+#: The default max number of headers a request may contain.
+MAX_HEADER_COUNT = 100
+
+#: The default max size of a request body, in bytes.
+MAX_BODY_SIZE = 10 * 1024 * 1024
+
+#: The max size of a chunk size line (including any extensions).
+MAX_CHUNK_LINE_SIZE = 4_096
+
+#: The default max number of unread body bytes to discard in order to
+#: reuse a connection.
+MAX_DRAIN_SIZE = 65_536
+
+#: Chunk sizes are plain hex numbers, optionally followed by
+#: extensions.
+CHUNK_SIZE_RE = re.compile(rb"([0-9a-fA-F]+)(?:[ \t]*;.*)?")
+
+#: Header names are tokens, so they can't be empty or contain
+#: whitespace, and lines can't be folded.
+HEADER_NAME_RE = re.compile(rb"[!#$%&'*+\-.^_`|~0-9A-Za-z]+")
+
+HeadT = typing.Tuple[str, str, str, Headers]
+
+T = typing.TypeVar("T")
+
+
+class HeadTooLarge(ValueError):
+    """Raised when a request head exceeds its size limits.
+    """
+
+
+class BodyTooLarge(ValueError):
+    """Raised when a request body exceeds its size limit.
+    """
+
+
+class IncompleteBody(ValueError):
+    """Raised when a client closes the connection before sending the
+    whole request body.
+    """
+
+
+class RequestTimeout(socket.timeout):
+    """Raised when a client takes too long to send a request head or
+    body.
+    """
+
+
+def transfer_time_left(timeout: float, min_rate: typing.Optional[float], size: int, elapsed: float) -> float:
+    """Compute how much longer a transfer that has moved size bytes in
+    elapsed seconds may take.  Transfers are allowed timeout seconds
+    plus however long it takes to move their data at min_rate bytes
+    per second.
+    """
+    allowed = timeout
+    if min_rate:
+        allowed += size / min_rate
+    return allowed - elapsed
+
+
+class BodyReader(io.RawIOBase):
+    """A file-like object for reading request bodies off of a socket.
+
+    Reads never go past the end of the body so the rest of the data on
+    the socket can be used to read subsequent requests.  When there is
+    no buffered data left, reads are done directly into the caller's
+    buffer.
+
+    Parameters:
+      sock: The socket to read from.
+      buff: Any data that was read off of the socket past the request head.
+      bufsize: The max number of bytes to read in a single recv call.
+      content_length: The size of the body.  If this is None and the
+        body isn't chunked, then it extends until the client closes
+        the connection.
+      chunked: Whether the body uses the chunked transfer encoding.
+      max_size: The max number of bytes that may be read from the body.
+      timeout: The max number of seconds to wait for body data to
+        arrive.  None means the socket's own timeout is used.
+      min_rate: The min average rate, in bytes per second, at which
+        the body must arrive.  Reading n bytes may take at most
+        timeout + n / min_rate seconds of waiting on the socket.
+        Requires a timeout.
+
+    Attributes:
+      timed_out: Whether reading the body timed out.
+      failed: Whether reading the body failed, in which case the rest
+        of the data on the socket can't be trusted.
+    """
+
+    def __init__(
+            self,
+            sock: socket.socket,
+            *,
+            buff: bytes = b"",
+            bufsize: int = 16_384,
+            content_length: typing.Optional[int] = None,
+            chunked: bool = False,
+            max_size: typing.Optional[int] = None,
+            timeout: typing.Optional[float] = None,
+            min_rate: typing.Optional[float] = None,
+    ) -> None:
         self._sock = sock
-        self._buff = buff
+        self._buff = bytearray(buff)
+        self._pos = 0
         self._bufsize = bufsize
+        self._remaining = content_length
+        self._chunked = chunked
+        self._chunk_remaining = 0
+        self._chunk_started = False
+        self._done = False
+        self._max_size = max_size
+        self._read = 0
+        self._timeout = timeout
+        self._min_rate = min_rate
+        self._received = 0
+        self._wait_time = 0.0
+        self.timed_out = False
+        self.failed = False
+
+        if max_size is not None and content_length is not None and content_length > max_size:
+            raise BodyTooLarge("Request body too large.")
+
+    @property
+    def pipelined(self) -> bool:
+        """Whether the body has been read in full and data past its
+        end (i.e. the start of the next request on the connection) has
+        already been read off of the socket.
+        """
+        complete = self._done if self._chunked else self._remaining == 0
+        return complete and self._pos < len(self._buff)
+
+    @property
+    def bounded(self) -> bool:
+        """Whether or not the end of the body can be determined
+        without reading until the connection is closed.
+        """
+        return self._chunked or self._remaining is not None
 
     def readable(self) -> bool:  # pragma: no cover
         return True
 
-    def read(self, n: int) -> bytes:
-        """Read up to n number of bytes from the request body.
+    def read(self, size: typing.Optional[int] = -1) -> bytes:
+        """Read up to size bytes from the request body.  Unlike most
+        raw streams, this blocks until size bytes have been read or the
+        body ends.  The whole body is read when size is negative.
         """
-        while len(self._buff) < n:
-            data = self._sock.recv(self._bufsize)
-            if not data:
-                break
+        if size is None or size < 0:
+            return self.readall()
 
-            self._buff += data
+        buff, total = bytearray(size), 0
+        with memoryview(buff) as view:
+            while total < size:
+                n = self.readinto(view[total:])
+                if not n:
+                    break
 
-        res, self._buff = self._buff[:n], self._buff[n:]
-        return res
+                total += n
 
+        del buff[total:]
+        return bytes(buff)
 
-class Request(typing.NamedTuple):
-    method: str
-    path: str
-    headers: Headers
-    body: BodyReader
+    def readinto(self, b: typing.Any) -> int:
+        """Read up to len(b) bytes of the request body into b.
 
-    @classmethod
-    def from_socket(cls, sock: socket.socket) -> "Request":
-        """Read and parse the request from a socket object.
+        Raises:
+          IncompleteBody: When the client closes the connection before
+            sending the whole body.
+        """
+        try:
+            with memoryview(b) as view:
+                n = self._limit(len(view))
+                if n == 0:
+                    return 0
+
+                available = len(self._buff) - self._pos
+                if available:
+                    n = min(n, available)
+                    view[:n] = memoryview(self._buff)[self._pos:self._pos + n]
+                    self._pos += n
+                else:
+                    n = self._recv(self._sock.recv_into, view[:n])
+                    if not n and self.bounded:
+                        raise IncompleteBody("Incomplete request body.")
+
+            self._consume(n)
+            return n
+        except (OSError, ValueError):
+            self.failed = True
+            raise
+
+    def readline(self, size: typing.Optional[int] = -1) -> bytes:
+        """Read up to and including the next newline in the body.
 
         Raises:
-          ValueError: When the request cannot be parsed.
+          IncompleteBody: When the client closes the connection before
+            sending the whole body.
         """
-        lines = iter_lines(sock)
+        if size is None or size < 0:
+            size = sys.maxsize
 
+        line = bytearray()
         try:
-            request_line = next(lines).decode("ascii")
-        except StopIteration:
-            raise ValueError("Request line missing.")
+            while len(line) < size:
+                n = self._limit(size - len(line))
+                if n == 0:
+                    break
+
+                if self._pos == len(self._buff) and not self._fill():
+                    if self.bounded:
+                        raise IncompleteBody("Incomplete request body.")
+                    break
+
+                end = min(self._pos + n, len(self._buff))
+                i = self._buff.find(b"\n", self._pos, end)
+                if i != -1:
+                    end = i + 1
+
+                line += memoryview(self._buff)[self._pos:end]
+                self._consume(end - self._pos)
+                self._pos = end
+                if i != -1:
+                    break
+        except (OSError, ValueError):
+            self.failed = True
+            raise
+
+        return bytes(line)
+
+    def drain(self, max_size: int = MAX_DRAIN_SIZE) -> bytes:
+        """Discard the unread part of the request body and return any
+        data that was read past its end (i.e. the start of the next
+        request on the connection).
+
+        Raises:
+          ValueError: When the body is unbounded or when more than
+            max_size bytes of it are left unread.
+        """
+        if not self.bounded:
+            raise ValueError("Cannot drain an unbounded body.")
+
+        if self._remaining is not None and self._remaining > max_size:
+            raise ValueError("Too much of the body is left unread.")
+
+        drained = 0
+        while drained <= max_size:
+            data = self.read(min(self._bufsize, max_size + 1 - drained))
+            if not data:
+                return bytes(self._buff[self._pos:])
+            drained += len(data)
+
+        raise ValueError("Too much of the body is left unread.")
 
+    def _limit(self, n: int) -> int:
+        """Clamp n to the number of body bytes that can be read before
+        the next framing boundary, reading chunk headers as needed.
+        """
+        if self._chunked:
+            if self._chunk_remaining == 0 and not self._done:
+                self._read_chunk_header()
+            return min(n, self._chunk_remaining)
+
+        if self._remaining is not None:
+            return min(n, self._remaining)
+        return n
+
+    def _consume(self, n: int) -> None:
+        if self._chunked:
+            self._chunk_remaining -= n
+        elif self._remaining is not None:
+            self._remaining -= n
+
+        self._read += n
+        if self._max_size is not None and self._read > self._max_size:
+            raise BodyTooLarge("Request body too large.")
+
+    def _fill(self) -> int:
+        """Read more data off of the socket into the buffer.  Returns
+        the number of bytes that were read.
+        """
+        del self._buff[:self._pos]
+        self._pos = 0
+
+        data = self._recv(self._sock.recv, self._bufsize)
+        self._buff += data
+        return len(data)
+
+    def _recv(self, fn: typing.Callable[[typing.Any], T], arg: typing.Any) -> T:
+        """Call one of the socket's recv methods, enforcing this body's
+        timeout and min rate.
+        """
+        if self._timeout is None:
+            return fn(arg)
+
+        time_left = transfer_time_left(self._timeout, self._min_rate, self._received, self._wait_time)
+        if time_left <= 0:
+            self.timed_out = True
+            raise RequestTimeout("Request body arrived too slowly.")
+
+        self._sock.settimeout(min(self._timeout, time_left))
+        started_at = time.monotonic()
         try:
-            method, path, _ = request_line.split(" ")
-        except ValueError:
-            raise ValueError(f"Malformed request line {request_line!r}.")
+            result = fn(arg)
+        except socket.timeout:
+            self.timed_out = True
+            raise RequestTimeout("Timed out reading request body.")
+        finally:
+            self._wait_time += time.monotonic() - started_at
+
+        self._received += result if isinstance(result, int) else len(result)  # type: ignore
+        return result
 
-        headers = Headers()
-        buff = b""
+    def _read_framing_line(self) -> bytes:
         while True:
-            try:
-                line = next(lines)
-            except StopIteration as e:
-                buff = e.value
-                break
+            i = self._buff.find(b"\r\n", self._pos)
+            if i != -1:
+                line = bytes(self._buff[self._pos:i])
+                self._pos = i + 2
+                return line
+
+            if len(self._buff) - self._pos > MAX_CHUNK_LINE_SIZE:
+                raise ValueError("Chunk line too long.")
+
+            if not self._fill():
+                raise IncompleteBody("Incomplete chunked body.")
+
+    def _read_chunk_header(self) -> None:
+        if self._chunk_started and self._read_framing_line() != b"":
+            raise ValueError("Malformed chunk terminator.")
+
+        self._chunk_started = True
+        size = parse_chunk_size(self._read_framing_line())
+        if size == 0:
+            # Trailers aren't exposed to handlers.
+            while self._read_framing_line():
+                pass
+
+            self._done = True
 
+        self._chunk_remaining = size
+
+
+class BufferedBody(io.BytesIO):
+    """A request body that was read into memory in full before the
+    request was handled (eg. by the asyncio engine).  It has the same
+    interface as BodyReader.
+    """
+
+    pipelined = False
+    bounded = True
+    timed_out = False
+    failed = False
+
+    def drain(self, max_size: int = MAX_DRAIN_SIZE) -> bytes:
+        """Discard the unread part of the body.  Nothing past its end
+        was ever read, so this always returns an empty string.
+        """
+        self.seek(0, io.SEEK_END)
+        return b""
+
+
+#: The body of a request.
+RequestBodyT = typing.Union[BodyReader, BufferedBody]
+
+
+class Request:
+    """An HTTP request.  The query string, cookies and form are parsed
+    the first time they're accessed and then cached on the request.
+
+    Parameters:
+      method: The request method (eg. "GET").
+      path: The request path, without its query string.
+      headers: The request headers.
+      body: The request body.
+      version: The HTTP version of the request.
+      query_string: The (undecoded) part of the request target after
+        the question mark, if any.
+    """
+
+    __slots__ = (
+        "method", "path", "headers", "body", "version", "query_string",
+        "_query", "_cookies", "_form", "_files",
+    )
+
+    def __init__(
+            self,
+            method: str,
+            path: str,
+            headers: Headers,
+            body: RequestBodyT,
+            version: str = "HTTP/1.1",
+            query_string: str = "",
+    ) -> None:
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+        self.version = version
+        self.query_string = query_string
+        self._query: typing.Optional[Params[str]] = None
+        self._cookies: typing.Optional[typing.Dict[str, str]] = None
+        self._form: typing.Optional[Params[str]] = None
+        self._files: typing.Optional[Params[UploadedFile]] = None
+
+    def __repr__(self) -> str:
+        return f"Request(method={self.method!r}, path={self.path!r}, query_string={self.query_string!r})"
+
+    def strip_prefix(self, prefix: str) -> None:
+        """Remove a mount prefix from the start of this request's path,
+        in place.  Nothing is copied when the prefix is empty.
+        """
+        if prefix:
+            self.path = self.path[len(prefix):]
+
+    @property
+    def query(self) -> Params[str]:
+        """The request's query string parameters.
+        """
+        if self._query is None:
+            self._query = parse_query(self.query_string)
+        return self._query
+
+    @property
+    def cookies(self) -> typing.Dict[str, str]:
+        """The cookies sent with the request.
+        """
+        if self._cookies is None:
+            self._cookies = parse_cookies(self.headers.get("cookie"))
+        return self._cookies
+
+    @property
+    def form(self) -> Params[str]:
+        """The fields of an urlencoded or multipart form body.  Reading
+        the form consumes the body.
+
+        Raises:
+          MalformedForm: When the body cannot be parsed.
+          BodyTooLarge: When the body is larger than its max size.
+        """
+        if self._form is None:
+            self._parse_form()
+        return typing.cast(Params[str], self._form)
+
+    @property
+    def files(self) -> Params[UploadedFile]:
+        """The files uploaded with a multipart form body.  Reading the
+        files consumes the body.
+
+        Raises:
+          MalformedForm: When the body cannot be parsed.
+          BodyTooLarge: When the body is larger than its max size.
+        """
+        if self._files is None:
+            self._parse_form()
+        return typing.cast(Params[UploadedFile], self._files)
+
+    def _parse_form(self) -> None:
+        content_type, options = parse_options(self.headers.get("content-type", ""))
+        if content_type == "application/x-www-form-urlencoded":
             try:
-                name, value = line.decode("ascii").split(":", 1)
-                headers.add(name, value.lstrip())
-            except ValueError:
-                raise ValueError(f"Malformed header line {line!r}.")
+                self._form = parse_query(self.body.read().decode(options.get("charset", "utf-8")))
+            except UnicodeDecodeError:
+                raise MalformedForm("Form body is not valid text.")
+            self._files = Params()
+        elif content_type == "multipart/form-data":
+            self._form, self._files = parse_multipart(self.body.read, options.get("boundary", ""))
+        else:
+            self._form, self._files = Params(), Params()
 
-        body = BodyReader(sock, buff=buff)
-        return cls(method=method.upper(), path=path, headers=headers, body=body)
+    @property
+    def keep_alive(self) -> bool:
+        """Whether or not the client wants the connection to be kept
+        open after this request.  HTTP/1.1 connections are persistent
+        by default whereas HTTP/1.0 connections have to opt in.
+        """
+        # Requests with both a transfer-encoding and a content-length
+        # may have been framed differently by an intermediary, so the
+        # connection can't be reused after them (RFC 9112, 6.3).
+        if "transfer-encoding" in self.headers and "content-length" in self.headers:
+            return False
 
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return "keep-alive" in connection
+        return "close" not in connection
+
+    @classmethod
+    def from_socket(
+            cls,
+            sock: socket.socket,
+            buff: bytes = b"",
+            *,
+            max_head_size: int = MAX_HEAD_SIZE,
+            max_header_count: int = MAX_HEADER_COUNT,
+            max_body_size: typing.Optional[int] = MAX_BODY_SIZE,
+            header_timeout: typing.Optional[float] = None,
+            body_timeout: typing.Optional[float] = None,
+            min_body_rate: typing.Optional[float] = None,
+            head_buffer: typing.Optional[bytearray] = None,
+    ) -> "Request":
+        """Read and parse the request from a socket object.  buff may
+        contain data that has already been read off of the socket.
+        head_buffer may be a buffer to reuse for reading the head (see
+        read_head).
 
-def iter_lines(sock: socket.socket, bufsize: int = 16_384) -> typing.Generator[bytes, None, bytes]:
-    """Given a socket, read all the individual CRLF-separated lines
-    and yield each one until an empty one is found.  Returns the
-    remainder after the empty line.
+        The head must arrive within header_timeout seconds.  The body
+        is subject to body_timeout and min_body_rate as it is read (see
+        BodyReader).
+
+        Raises:
+          HeadTooLarge: When the request head exceeds max_head_size
+            bytes or contains more than max_header_count headers.
+          BodyTooLarge: When the request's content-length is greater
+            than max_body_size.
+          RequestTimeout: When the head doesn't arrive in time.
+          ValueError: When the request cannot be parsed.
+        """
+        head, buff = read_head(sock, buff, max_head_size=max_head_size, timeout=header_timeout, buffer=head_buffer)
+        try:
+            method, target, version, headers = parse_head(head, max_header_count=max_header_count)
+        finally:
+            head.release()
+
+        path, _, query_string = target.partition("?")
+        content_length = get_content_length(headers)
+        body = BodyReader(
+            sock,
+            buff=buff,
+            content_length=content_length,
+            chunked=content_length is None,
+            max_size=max_body_size,
+            timeout=body_timeout,
+            min_rate=min_body_rate,
+        )
+        return cls(method=method, path=path, headers=headers, body=body, version=version, query_string=query_string)
+
+
+def read_head(
+        sock: socket.socket,
+        buff: bytes = b"",
+        *,
+        bufsize: int = 16_384,
+        max_head_size: int = MAX_HEAD_SIZE,
+        timeout: typing.Optional[float] = None,
+        buffer: typing.Optional[bytearray] = None,
+) -> typing.Tuple[memoryview, bytes]:
+    """Read a request head off of a socket into a single buffer.
+    Returns a view of the head, without the empty line that terminates
+    it, and any data that was read past it.  buff may contain data
+    that has already been read off of the socket.
+
+    If a buffer is given, the head is read into it (growing it as
+    needed) instead of a new one so that it can be reused between
+    requests.  The returned view must be released before it is.
+
+    If the connection is closed before the end of the head, then
+    whatever was read is returned as the head.
+
+    Raises:
+      HeadTooLarge: When the head exceeds max_head_size bytes.
+      RequestTimeout: When the whole head doesn't arrive within
+        timeout seconds.
     """
-    buff = b""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    data = bytearray(max(bufsize, len(buff))) if buffer is None else buffer
+    if len(data) < len(buff):
+        data.extend(bytes(len(buff) - len(data)))
+    data[:len(buff)] = buff
+    size, start = len(buff), 0
     while True:
-        data = sock.recv(bufsize)
-        if not data:
-            return b""
+        i = data.find(b"\r\n\r\n", start, size)
+        if i > max_head_size:
+            raise HeadTooLarge("Request head too large.")
 
-        buff += data
-        while True:
-            try:
-                i = buff.index(b"\r\n")
-                line, buff = buff[:i], buff[i + 2:]
-                if not line:
-                    return buff
-
-                yield line
-            except (IndexError, ValueError):
-                break
+        if i != -1:
+            view = memoryview(data)
+            return view[:i], bytes(view[i + 4:size])
+
+        if size >= max_head_size:
+            raise HeadTooLarge("Request head too large.")
+
+        # The terminator may straddle the boundary between reads.
+        start = max(0, size - 3)
+        if size == len(data):
+            data.extend(bytes(min(len(data), max_head_size)))
+
+        if deadline is not None:
+            time_left = deadline - time.monotonic()
+            if time_left <= 0:
+                raise RequestTimeout("Timed out reading request head.")
+            sock.settimeout(time_left)
+
+        try:
+            n = sock.recv_into(memoryview(data)[size:])
+        except socket.timeout:
+            if deadline is None:
+                raise
+            raise RequestTimeout("Timed out reading request head.")
+
+        if not n:
+            if data.endswith(b"\r\n", 0, size):
+                size -= 2
+            return memoryview(data)[:size], b""
+
+        size += n
+
+
+def parse_head(head: typing.Union[bytes, memoryview], *, max_header_count: int = MAX_HEADER_COUNT) -> HeadT:
+    """Parse a request head (the request line followed by any header
+    lines, without the empty line that terminates it) into its method,
+    target (path and query string), HTTP version and headers.  The
+    head is split into lines in one go and header values are kept as
+    raw bytes until they're used.
+
+    Raises:
+      HeadTooLarge: When there are more than max_header_count headers.
+      ValueError: When the request cannot be parsed.
+    """
+    request_line, *lines = bytes(head).split(b"\r\n")
+    if not request_line:
+        raise ValueError("Request line missing.")
+
+    if len(lines) > max_header_count:
+        raise HeadTooLarge("Too many headers.")
+
+    try:
+        method, path, version = request_line.decode("latin-1").split(" ")
+    except ValueError:
+        raise ValueError(f"Malformed request line {request_line.decode('latin-1')!r}.")
+
+    headers = Headers()
+    for line in lines:
+        name, sep, value = line.partition(b":")
+        if not sep or HEADER_NAME_RE.fullmatch(name) is None:
+            raise ValueError(f"Malformed header line {line!r}.")
+
+        headers.add_raw(name, value.lstrip())
+
+    return method.upper(), path, version.upper(), headers
+
+
+def parse_chunk_size(line: bytes) -> int:
+    """Parse the size out of a chunk size line, ignoring any chunk
+    extensions.
+
+    Raises:
+      ValueError: When the line is malformed.
+    """
+    match = CHUNK_SIZE_RE.fullmatch(line)
+    if match is None:
+        raise ValueError(f"Malformed chunk size line {line!r}.")
+    return int(match.group(1), 16)
+
+
+def get_content_length(headers: Headers) -> typing.Optional[int]:
+    """Determine the length of a request body from its headers.
+    Returns None if the body is chunked.
+
+    Raises:
+      ValueError: When the content-length or transfer-encoding is invalid.
+    """
+    transfer_encodings = headers.get_all("transfer-encoding")
+    if transfer_encodings:
+        # Other codings would have to be decoded before the body is
+        # handed to handlers, so they aren't supported.
+        codings = [coding.strip().lower() for header in transfer_encodings for coding in header.split(",")]
+        if codings != ["chunked"]:
+            raise ValueError(f"Unsupported transfer-encoding {', '.join(transfer_encodings)!r}.")
+        return None
+
+    # Repeated content-length headers (or a single header with a list
+    # of values) are only allowed if every value is the same.
+    values = {value.strip() for header in headers.get_all("content-length") for value in header.split(",")}
+    if not values:
+        return 0
+
+    if len(values) > 1:
+        raise ValueError(f"Conflicting content-lengths {sorted(values)!r}.")
+
+    content_length = values.pop()
+    if not content_length.isascii() or not content_length.isdigit():
+        raise ValueError(f"Invalid content-length {content_length!r}.")
+    return int(content_length)
@@ -1,9 +1,169 @@
+import asyncio
 import io
+import itertools
+import json
 import os
 import socket
+import time
 import typing
 
 from .headers import Headers
+from .request import transfer_time_left
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+
+COMMON_STATUSES = [
+    "100 Continue", "200 OK", "201 Created", "204 No Content", "206 Partial Content",
+    "301 Moved Permanently", "302 Found", "304 Not Modified",
+    "400 Bad Request", "401 Unauthorized", "403 Forbidden", "404 Not Found", "405 Method Not Allowed",
+    "408 Request Timeout", "413 Payload Too Large", "416 Range Not Satisfiable",
+    "431 Request Header Fields Too Large", "500 Internal Server Error", "503 Service Unavailable",
+    "504 Gateway Timeout",
+]
+
+#: The max number of bytes to send per sendfile call when writes have
+#: a deadline.
+SENDFILE_CHUNK_SIZE = 1024 * 1024
+
+#: Pre-encoded status lines, keyed by status.
+STATUS_LINES: typing.Dict[bytes, bytes] = {
+    status.encode(): f"HTTP/1.1 {status}\r\n".encode() for status in COMMON_STATUSES
+}
+
+#: The max number of entries in the status line cache.  This prevents
+#: arbitrary statuses from growing it without bound.
+ENCODING_CACHE_SIZE = 256
+
+
+def encode_status_line(status: bytes) -> bytes:
+    status_line = STATUS_LINES.get(status)
+    if status_line is None:
+        status_line = b"HTTP/1.1 " + status + b"\r\n"
+        if len(STATUS_LINES) < ENCODING_CACHE_SIZE:
+            STATUS_LINES[status] = status_line
+    return status_line
+
+
+def settimeout_until(sock: socket.socket, deadline: float) -> None:
+    """Set a socket's timeout so that operations on it don't go on
+    past deadline (in time.monotonic terms).
+
+    Raises:
+      socket.timeout: When the deadline has already passed.
+    """
+    time_left = deadline - time.monotonic()
+    if time_left <= 0:
+        raise socket.timeout("Timed out writing response.")
+    sock.settimeout(time_left)
+
+
+def sendmsg_all(sock: socket.socket, buffers: typing.List[typing.Any], deadline: typing.Optional[float] = None) -> None:
+    """Write a list of buffers to a socket using as few sendmsg calls
+    as possible.  Like sendall, this blocks until every buffer has
+    been written or, if one is given, until the deadline passes.
+
+    Raises:
+      socket.timeout: When the deadline passes.
+    """
+    while buffers:
+        if deadline is not None:
+            settimeout_until(sock, deadline)
+
+        sent = sock.sendmsg(buffers)
+        i = 0
+        while i < len(buffers) and sent >= len(buffers[i]):
+            sent -= len(buffers[i])
+            i += 1
+
+        buffers = buffers[i:]
+        if sent:
+            buffers[0] = memoryview(buffers[0])[sent:]
+
+
+class BufferedSocket:
+    """Wraps a socket so that writes to it are collected in memory
+    until they're flushed, letting the responses to pipelined requests
+    go out in as few sendmsg calls as possible.  Only immutable buffers
+    (eg. bytes) may be written to it.
+
+    Writes are flushed automatically once max_size bytes or
+    max_buffers buffers have been collected and before files are sent.
+
+    Parameters:
+      sock: The socket to write to.
+      max_size: The max number of bytes to hold on to.
+      max_buffers: The max number of buffers to hold on to.  This must
+        not exceed the platform's IOV_MAX.
+      timeout: The number of seconds each write may take.  None means
+        the socket's own timeout is used.
+      min_rate: The min rate, in bytes per second, at which data must
+        be written.  Writing n bytes may take at most timeout +
+        n / min_rate seconds.  Requires a timeout.
+    """
+
+    def __init__(
+            self,
+            sock: socket.socket,
+            max_size: int = 65_536,
+            max_buffers: int = 256,
+            *,
+            timeout: typing.Optional[float] = None,
+            min_rate: typing.Optional[float] = None,
+    ) -> None:
+        self.sock = sock
+        self.max_size = max_size
+        self.max_buffers = max_buffers
+        self.timeout = timeout
+        self.min_rate = min_rate
+        self.buffers: typing.List[typing.Any] = []
+        self.size = 0
+
+    def sendall(self, data: typing.Any) -> None:
+        self.buffers.append(data)
+        self.size += len(data)
+        if self.size >= self.max_size or len(self.buffers) >= self.max_buffers:
+            self.flush()
+
+    def sendmsg(self, buffers: typing.List[typing.Any]) -> int:
+        size = 0
+        for data in buffers:
+            self.sendall(data)
+            size += len(data)
+        return size
+
+    def sendfile(self, f: typing.IO[bytes], offset: int = 0, count: typing.Optional[int] = None) -> int:
+        self.flush()
+        if self.timeout is None or count is None:
+            return self.sock.sendfile(f, offset, count)  # type: ignore
+
+        deadline = self.deadline(count)
+        total = 0
+        while total < count:
+            settimeout_until(self.sock, deadline)
+            sent = self.sock.sendfile(f, offset + total, min(count - total, SENDFILE_CHUNK_SIZE))  # type: ignore
+            if not sent:
+                break
+            total += sent
+        return total
+
+    def flush(self) -> None:
+        """Write every collected buffer to the socket.
+
+        Raises:
+          socket.timeout: When writing takes too long.
+        """
+        if self.buffers:
+            buffers, self.buffers, size, self.size = self.buffers, [], self.size, 0
+            sendmsg_all(self.sock, buffers, None if self.timeout is None else self.deadline(size))
+
+    def deadline(self, size: int) -> float:
+        """Compute the deadline for writing size bytes.
+        """
+        return time.monotonic() + transfer_time_left(typing.cast(float, self.timeout), self.min_rate, size, 0)
 
 
 class Response:
@@ -12,15 +172,21 @@ class Response:
     Parameters:
       status: The response status line (eg. "200 OK").
       headers: The response headers.
-      body: A file containing the response body.
+      body: A file containing the response body.  In-memory (BytesIO)
+        bodies are always sent in full, other files are sent starting
+        from their current position.
       content: A string representing the response body.  If this is
         provided, then body is ignored.
       encoding: An encoding for the content, if provided.
+
+    Applications tag responses with the name of the route that produced
+    them using the route_name attribute.
     """
 
     status: bytes
     headers: Headers
     body: typing.IO[bytes]
+    route_name: typing.Optional[str] = None
 
     def __init__(
             self,
@@ -41,26 +207,274 @@ class Response:
         else:
             self.body = body
 
-    def send(self, sock: socket.socket) -> None:
-        """Write this response to a socket.
+    def prepare(self) -> typing.Tuple[bytes, int]:
+        """Compute this response's content-length and encode its
+        status line and headers.  Returns the encoded head and the
+        number of body bytes that must follow it.
         """
         content_length = self.headers.get_int("content-length")
         if content_length is None:
-            try:
-                body_stat = os.fstat(self.body.fileno())
-                content_length = body_stat.st_size
-            except OSError:
-                self.body.seek(0, os.SEEK_END)
-                content_length = self.body.tell()
-                self.body.seek(0, os.SEEK_SET)
-
-            if content_length > 0:
+            if isinstance(self.body, io.BytesIO):
+                content_length = len(self.body.getvalue())
+            else:
+                try:
+                    body_stat = os.fstat(self.body.fileno())
+                    content_length = body_stat.st_size - self.body.tell()
+                except OSError:
+                    self.body.seek(0, os.SEEK_END)
+                    content_length = self.body.tell()
+                    self.body.seek(0, os.SEEK_SET)
+
+            # Informational, 204 and 304 responses never have a body.
+            # Every other response must be delimited so that the
+            # connection can be reused.
+            if not self.status.startswith((b"1", b"204", b"304")):
                 self.headers.add("content-length", str(content_length))
 
-        headers = b"HTTP/1.1 " + self.status + b"\r\n"
-        for header_name, header_value in self.headers:
-            headers += f"{header_name}: {header_value}\r\n".encode()
+        return self.encode_head(), content_length
+
+    def encode_head(self) -> bytes:
+        """Encode this response's status line and headers.
+        """
+        return b"".join((encode_status_line(self.status), self.headers.encode(), b"\r\n"))
+
+    def send(self, sock: socket.socket) -> None:
+        """Write this response to a socket.  In-memory bodies are sent
+        together with the head using a single sendmsg call whereas file
+        bodies are sent using sendfile.
+        """
+        head, content_length = self.prepare()
+        if content_length <= 0:
+            sock.sendall(head)
+        elif isinstance(self.body, io.BytesIO):
+            # Unlike getbuffer, getvalue doesn't copy bodies that were
+            # created from an existing bytes object.
+            body = self.body.getvalue()
+            if content_length < len(body):
+                body = memoryview(body)[:content_length]  # type: ignore
+            sendmsg_all(sock, [head, body])
+        else:
+            offset = self.body.tell()
+            sock.sendall(head)
+            sock.sendfile(self.body, offset, content_length)  # type: ignore
+
+    def close(self) -> None:
+        """Release this response's body without sending it.
+        """
+        self.body.close()
+
+    async def send_async(self, writer: asyncio.StreamWriter) -> None:
+        """Write this response to an asyncio stream.
+        """
+        head, content_length = self.prepare()
+        if content_length <= 0:
+            writer.write(head)
+        elif isinstance(self.body, io.BytesIO):
+            writer.writelines([head, self.body.getvalue()[:content_length]])
+        else:
+            offset = self.body.tell()
+            writer.write(head)
+            loop = asyncio.get_event_loop()
+            await loop.sendfile(writer.transport, self.body, offset, content_length)  # type: ignore
+
+        await writer.drain()
+
+
+class StreamingResponse(Response):
+    """An HTTP response whose body is produced incrementally.  Each
+    chunk is written to the client as soon as it is produced.
+
+    Unless a content-length header is provided, the body is sent using
+    the chunked transfer encoding.  Async iterables are only supported
+    by the async server engine.
+
+    Parameters:
+      status: The response status line (eg. "200 OK").
+      headers: The response headers.
+      chunks: An iterable (or async iterable) of byte strings.
+    """
+
+    def __init__(
+            self,
+            status: str = "200 OK",
+            headers: typing.Optional[Headers] = None,
+            chunks: typing.Union[typing.Iterable[bytes], typing.AsyncIterable[bytes]] = (),
+    ) -> None:
+        super().__init__(status, headers)
+        self.chunks = chunks
+        self.chunked = True
+
+    def prepare(self) -> typing.Tuple[bytes, int]:
+        content_length = self.headers.get_int("content-length")
+        if content_length is not None:
+            self.chunked = False
+        elif self.chunked:
+            self.headers.add("transfer-encoding", "chunked")
+
+        return self.encode_head(), -1 if content_length is None else content_length
+
+    def encode_chunk(self, chunk: bytes) -> bytes:
+        if not self.chunked:
+            return chunk
+        return b"%x\r\n%b\r\n" % (len(chunk), chunk)
+
+    def close(self) -> None:
+        """Release this response's chunks without sending them.
+        """
+        close = getattr(self.chunks, "close", None)
+        if close is not None:
+            close()
+
+    def send(self, sock: socket.socket) -> None:
+        """Write this response to a socket, one chunk at a time.
+        """
+        head, _ = self.prepare()
+        sock.sendall(head)
+
+        chunks = typing.cast(typing.Iterable[bytes], self.chunks)
+        try:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+
+                if self.chunked:
+                    sendmsg_all(sock, [b"%x\r\n" % len(chunk), chunk, b"\r\n"])
+                else:
+                    sock.sendall(chunk)
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+
+        if self.chunked:
+            sock.sendall(b"0\r\n\r\n")
+
+    async def send_async(self, writer: asyncio.StreamWriter) -> None:
+        """Write this response to an asyncio stream, one chunk at a
+        time.
+        """
+        head, _ = self.prepare()
+        writer.write(head)
+
+        async for chunk in iterate_async(self.chunks):
+            if chunk:
+                writer.write(self.encode_chunk(chunk))
+                await writer.drain()
+
+        if self.chunked:
+            writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+async def iterate_async(
+        chunks: typing.Union[typing.Iterable[bytes], typing.AsyncIterable[bytes]],
+) -> typing.AsyncIterator[bytes]:
+    """Iterate over chunks from a coroutine.  Synchronous iterables are
+    advanced on the default executor so that they may block.
+    """
+    if isinstance(chunks, typing.AsyncIterable):
+        async for chunk in chunks:
+            yield chunk
+    else:
+        async for chunk in iterate_in_executor(chunks):
+            yield chunk
+
+
+async def iterate_in_executor(chunks: typing.Iterable[bytes]) -> typing.AsyncIterator[bytes]:
+    loop = asyncio.get_event_loop()
+    iterator = iter(chunks)
+
+    def next_chunk() -> typing.Optional[bytes]:
+        return next(iterator, None)
+
+    try:
+        while True:
+            chunk = await loop.run_in_executor(None, next_chunk)
+            if chunk is None:
+                break
+
+            yield chunk
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
+
+
+def encode_json_stdlib(value: typing.Any) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+#: The function used to encode JSON responses by default.  orjson is
+#: used when it's installed since it's many times faster than the
+#: json module.
+encode_json: typing.Callable[[typing.Any], bytes] = orjson.dumps if orjson is not None else encode_json_stdlib
+
+
+class JSONResponse(Response):
+    """An HTTP response whose body is a value encoded as JSON.
+
+    Parameters:
+      value: The value to encode.
+      status: The response status line (eg. "200 OK").
+      headers: The response headers.
+      encoder: A function that encodes values to JSON bytes.  Defaults
+        to encode_json.
+    """
+
+    def __init__(
+            self,
+            value: typing.Any,
+            status: str = "200 OK",
+            headers: typing.Optional[Headers] = None,
+            encoder: typing.Optional[typing.Callable[[typing.Any], bytes]] = None,
+    ) -> None:
+        content = (encoder or encode_json)(value)
+        super().__init__(status, headers, body=io.BytesIO(content))
+        self.headers.add("content-type", "application/json")
+
+
+class StreamingJSONResponse(StreamingResponse):
+    """An HTTP response whose body is a JSON array that is encoded
+    batch_size items at a time as it is sent, so that large arrays
+    never have to be held in memory all at once.
+
+    Parameters:
+      items: An iterable of the array's items.
+      status: The response status line (eg. "200 OK").
+      headers: The response headers.
+      encoder: A function that encodes values to JSON bytes.  Defaults
+        to encode_json.
+      batch_size: The number of items to encode per chunk.
+    """
+
+    def __init__(
+            self,
+            items: typing.Iterable[typing.Any],
+            status: str = "200 OK",
+            headers: typing.Optional[Headers] = None,
+            encoder: typing.Optional[typing.Callable[[typing.Any], bytes]] = None,
+            batch_size: int = 256,
+    ) -> None:
+        super().__init__(status, headers, iter_json_array(items, encoder or encode_json, batch_size))
+        self.headers.add("content-type", "application/json")
+
+
+def iter_json_array(
+        items: typing.Iterable[typing.Any],
+        encoder: typing.Callable[[typing.Any], bytes],
+        batch_size: int,
+) -> typing.Iterator[bytes]:
+    """Encode items as a JSON array, one chunk of up to batch_size
+    items at a time.
+    """
+    iterator = iter(items)
+    separator = b"["
+    while True:
+        batch = [encoder(item) for item in itertools.islice(iterator, batch_size)]
+        if not batch:
+            break
+
+        yield separator + b",".join(batch)
+        separator = b","
 
-        sock.sendall(headers + b"\r\n")
-        if content_length > 0:
-            sock.sendfile(self.body)  # type: ignore
+    yield b"]" if separator == b"," else b"[]"
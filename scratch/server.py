@@ -1,149 +1,1051 @@
 import logging
-import mimetypes
 import os
+import select
+import signal
 import socket
+import subprocess
+import sys
+import threading
+import time
 import typing
-from queue import Empty, Queue
-from threading import Thread
-from typing import Callable, List, Tuple
+from queue import Empty, Full, Queue
+from threading import Lock, Thread
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
 
-from .request import Request
-from .response import Response
+from .compression import CompressedFileCache, is_compressible
+from .forms import MalformedForm
+from .headers import Headers
+from .metrics import Metrics
+from .mounts import MountTable
+from .request import (MAX_BODY_SIZE, MAX_HEAD_SIZE, MAX_HEADER_COUNT,
+                      BodyTooLarge, HeadTooLarge, IncompleteBody, Request,
+                      RequestTimeout)
+from .response import BufferedSocket, Response, StreamingResponse
+from .static import (CacheControlRules, MultipartRangesResponse,
+                     StaticFileCache, if_range_matches, is_not_modified,
+                     parse_ranges)
 
 LOGGER = logging.getLogger(__name__)
 
+#: The environment variable through which reloaded processes inherit
+#: their listening socket's file descriptor.
+LISTEN_FD_ENV = "SCRATCH_LISTEN_FD"
+
+#: The environment variable through which reloaded processes get a
+#: file descriptor to notify their parent on once they're ready.
+READY_FD_ENV = "SCRATCH_READY_FD"
+
 HandlerT = Callable[[Request], Response]
 
 
 class HTTPWorker(Thread):
-    def __init__(self, connection_queue: Queue, handlers: List[Tuple[str, HandlerT]]) -> None:
+    def __init__(
+            self,
+            connection_queue: Queue,
+            handlers: typing.Union[List[Tuple[str, HandlerT]], MountTable[HandlerT]],
+            *,
+            keepalive_timeout: float = 5,
+            max_keepalive_requests: int = 100,
+            max_head_size: int = MAX_HEAD_SIZE,
+            max_header_count: int = MAX_HEADER_COUNT,
+            max_body_size: typing.Optional[int] = MAX_BODY_SIZE,
+            metrics: typing.Optional[Metrics] = None,
+            max_queue_wait: typing.Optional[float] = None,
+            pool: typing.Optional["WorkerPool"] = None,
+            header_timeout: typing.Optional[float] = None,
+            body_timeout: typing.Optional[float] = None,
+            write_timeout: typing.Optional[float] = None,
+            min_transfer_rate: typing.Optional[float] = None,
+            handler_timeout: typing.Optional[float] = None,
+    ) -> None:
         super().__init__(daemon=True)
 
         self.connection_queue = connection_queue
-        self.handlers = handlers
+        self.mounts = handlers if isinstance(handlers, MountTable) else MountTable(handlers)
+        self.keepalive_timeout = keepalive_timeout
+        self.max_keepalive_requests = max_keepalive_requests
+        self.max_head_size = max_head_size
+        self.max_header_count = max_header_count
+        self.max_body_size = max_body_size
+        self.metrics = metrics
+        self.max_queue_wait = max_queue_wait
+        self.pool = pool
+        self.header_timeout = header_timeout
+        self.body_timeout = body_timeout
+        self.write_timeout = write_timeout
+        self.min_transfer_rate = min_transfer_rate
+        self.handler_timeout = handler_timeout
+        # Buffers reused by every request this worker serves.
+        self.head_buffer = bytearray(16_384)
+        self.peek_buffer = bytearray(1)
         self.running = False
+        self.busy = False
+
+    @property
+    def draining(self) -> bool:
+        """True while the pool this worker belongs to is stopping.
+        Connections aren't kept alive while draining.
+        """
+        return self.pool is not None and self.pool.stopping
 
     def stop(self) -> None:
         self.running = False
 
     def run(self) -> None:
         self.running = True
-        while self.running:
-            try:
-                client_sock, client_addr = self.connection_queue.get(timeout=1)
-            except Empty:
-                continue
+        try:
+            idle_timeout = 1 if self.pool is None else self.pool.idle_timeout
+            while self.running:
+                try:
+                    item = self.connection_queue.get(timeout=idle_timeout)
+                except Empty:
+                    if self.pool is not None and self.pool.retire(self):
+                        return
+                    continue
 
-            try:
-                self.handle_client(client_sock, client_addr)
-            except Exception:
-                LOGGER.exception("Unhandled error in handle_client.")
-                continue
-            finally:
-                self.connection_queue.task_done()
+                if item is None:
+                    self.connection_queue.task_done()
+                    return
+
+                client_sock, client_addr, enqueued_at = item
+                try:
+                    queue_wait = time.monotonic() - enqueued_at
+                    if self.pool is not None and queue_wait > self.pool.grow_threshold:
+                        self.pool.grow()
+
+                    # Connections that waited too long for a worker have
+                    # most likely been given up on by their clients.
+                    if self.max_queue_wait is not None and queue_wait > self.max_queue_wait:
+                        client_sock.close()
+                        self.increment("http_connections_expired_total")
+                        continue
+
+                    self.busy = True
+                    self.handle_client(client_sock, client_addr)
+                except Exception:
+                    LOGGER.exception("Unhandled error in handle_client.")
+                    continue
+                finally:
+                    self.busy = False
+                    self.connection_queue.task_done()
+        finally:
+            # Threads come and go as the pool grows and shrinks so their
+            # metrics are folded into the totals when they exit.
+            if self.metrics is not None:
+                self.metrics.release_shard()
 
     def handle_client(self, client_sock: socket.socket, client_addr: typing.Tuple[str, int]) -> None:
+        """Serve requests off of a connection until it's closed.
+
+        Responses to pipelined requests (ones that were read off of the
+        socket along with the request before them) are buffered until
+        the worker either has to wait on the socket or call a handler,
+        since handlers may take arbitrarily long.
+        """
+        writer = BufferedSocket(client_sock, timeout=self.write_timeout, min_rate=self.min_transfer_rate)
         with client_sock:
             try:
-                request = Request.from_socket(client_sock)
+                self.serve_connection(client_sock, writer)
+                writer.flush()
+            except socket.timeout:
+                # Clients that don't read their responses fast enough
+                # get disconnected.
+                self.increment("http_write_timeouts_total")
+            except OSError:
+                pass
+
+    def serve_connection(self, client_sock: socket.socket, writer: BufferedSocket) -> None:
+        buffered_sock = typing.cast(socket.socket, writer)
+
+        buff = b""
+        for requests_served in range(1, self.max_keepalive_requests + 1):
+            try:
+                # Wait for the next request to start arriving so
+                # that idle connections closed by the client
+                # aren't mistaken for malformed requests.  The data
+                # is only peeked at so that it can be read straight
+                # into the reused head buffer.
+                client_sock.settimeout(self.keepalive_timeout)
+                if not buff and not client_sock.recv_into(self.peek_buffer, 1, socket.MSG_PEEK):
+                    return
+
+                # Reading the rest of a partially buffered head blocks.
+                if b"\r\n\r\n" not in buff:
+                    writer.flush()
+
+                started_at = time.perf_counter()
+                request = Request.from_socket(
+                    client_sock,
+                    buff=buff,
+                    max_head_size=self.max_head_size,
+                    max_header_count=self.max_header_count,
+                    max_body_size=self.max_body_size,
+                    header_timeout=self.header_timeout,
+                    body_timeout=self.body_timeout,
+                    min_body_rate=self.min_transfer_rate,
+                    head_buffer=self.head_buffer,
+                )
+            except RequestTimeout:
+                self.increment("http_header_timeouts_total")
+                self.send_error(buffered_sock, "408 Request Timeout", "Request Timeout")
+                return
+            except (socket.timeout, ConnectionError):
+                return
+            except HeadTooLarge:
+                self.send_error(buffered_sock, "431 Request Header Fields Too Large", "Headers Too Large")
+                return
+            except BodyTooLarge:
+                self.send_error(buffered_sock, "413 Payload Too Large", "Payload Too Large")
+                return
             except Exception:
                 LOGGER.warning("Failed to parse request.", exc_info=True)
-                response = Response(status="400 Bad Request", content="Bad Request")
-                response.send(client_sock)
+                self.send_error(buffered_sock, "400 Bad Request", "Bad Request")
                 return
 
+            parsed_at = time.perf_counter()
+            keep_alive = request.keep_alive and \
+                request.body.bounded and \
+                requests_served < self.max_keepalive_requests and \
+                not self.draining
+
             # Force clients to send their request bodies on every
             # request rather than making the handlers deal with this.
             if "100-continue" in request.headers.get("expect", ""):
                 response = Response(status="100 Continue")
-                response.send(client_sock)
-
-            for path_prefix, handler in self.handlers:
-                if request.path.startswith(path_prefix):
-                    try:
-                        request = request._replace(path=request.path[len(path_prefix):])
-                        response = handler(request)
-                        response.send(client_sock)
-                    except Exception as e:
-                        LOGGER.exception("Unexpected error from handler %r.", handler)
-                        response = Response(status="500 Internal Server Error", content="Internal Error")
-                        response.send(client_sock)
-                    finally:
-                        break
-            else:
-                response = Response(status="404 Not Found", content="Not Found")
-                response.send(client_sock)
+                response.send(buffered_sock)
+                writer.flush()
+
+            writer.flush()
+            response = self.handle_request(request)
+            handled_at = time.perf_counter()
+            if request.body.failed:
+                keep_alive = False
+            elif self.handler_timeout is not None and handled_at - parsed_at > self.handler_timeout:
+                LOGGER.warning("Handler for %r took %.2fs to respond.", request.path, handled_at - parsed_at)
+                self.increment("http_handler_timeouts_total")
+                response.close()
+                response = Response(status="504 Gateway Timeout", content="Gateway Timeout")
+
+            keep_alive = prepare_connection(request, response, keep_alive)
+            if not self.send_response(client_sock, writer, request, response):
+                keep_alive = False
+            if self.metrics is not None:
+                self.metrics.observe_request(
+                    response.route_name or "",
+                    request.method,
+                    response.status,
+                    parse_time=parsed_at - started_at,
+                    handler_time=handled_at - parsed_at,
+                    send_time=time.perf_counter() - handled_at,
+                )
+
+            if not keep_alive:
+                return
+
+            try:
+                buff = request.body.drain()
+            except (socket.timeout, ConnectionError, ValueError):
+                return
+
+    def send_response(
+            self,
+            client_sock: socket.socket,
+            writer: BufferedSocket,
+            request: Request,
+            response: Response,
+    ) -> bool:
+        """Write a response to the client.  Returns False if it could
+        not be sent in full and the connection has to be closed.
+        """
+        if not isinstance(response, StreamingResponse):
+            response.send(typing.cast(socket.socket, writer))
+            if not request.body.pipelined:
+                writer.flush()
+            return True
+
+        # Chunks may be produced slowly so they're sent as soon as
+        # they're available.
+        writer.flush()
+        client_sock.settimeout(self.write_timeout)
+        try:
+            response.send(client_sock)
+            return True
+        except Exception:
+            # The head has already gone out so the only way to tell the
+            # client that the body is incomplete is to close the
+            # connection.
+            LOGGER.exception("Unexpected error while streaming response from %r.", response.route_name)
+            return False
+
+    def handle_request(self, request: Request) -> Response:
+        mount = self.mounts.match(request.path)
+        if mount is None:
+            return Response(status="404 Not Found", content="Not Found")
+
+        path_prefix, handler = mount
+        try:
+            request.strip_prefix(path_prefix)
+            response = handler(request)
+            if response.route_name is None:
+                response.route_name = path_prefix
+            return response
+        except BodyTooLarge:
+            return Response(status="413 Payload Too Large", content="Payload Too Large")
+        except RequestTimeout:
+            self.increment("http_body_timeouts_total")
+            return Response(status="408 Request Timeout", content="Request Timeout")
+        except (IncompleteBody, MalformedForm):
+            return Response(status="400 Bad Request", content="Bad Request")
+        except Exception:
+            LOGGER.exception("Unexpected error from handler %r.", handler)
+            return Response(status="500 Internal Server Error", content="Internal Error")
+
+    def increment(self, name: str) -> None:
+        if self.metrics is not None:
+            self.metrics.increment(name)
+
+    def send_error(self, client_sock: socket.socket, status: str, content: str) -> None:
+        response = Response(status=status, content=content)
+        response.headers.add("connection", "close")
+        response.send(client_sock)
+        if self.metrics is not None:
+            self.metrics.observe_request("", "", response.status)
+
+
+class WorkerPoolStats(NamedTuple):
+    min_workers: int
+    max_workers: int
+    workers: int
+    busy_workers: int
+    spawned_total: int
+    retired_total: int
+
+    @property
+    def utilization(self) -> float:
+        """The fraction of workers currently serving a connection.
+        """
+        return self.busy_workers / self.workers if self.workers else 0.0
+
+
+class WorkerPool:
+    """An elastic pool of HTTPWorkers.
+
+    The pool starts out with min_workers workers and spawns new ones,
+    up to max_workers, whenever connections are queued faster than
+    idle workers can pick them up or when a connection waits longer
+    than grow_threshold seconds to be picked up.  Workers beyond
+    min_workers retire after idle_timeout seconds without a connection.
+
+    Parameters:
+      worker_factory: A function that makes a worker for the pool.
+      connection_queue: The queue the workers get connections from.
+      min_workers: The number of workers to keep around when idle.
+      max_workers: The max number of workers.
+      idle_timeout: The number of seconds a worker may be idle for
+        before it is retired.
+      grow_threshold: The number of seconds a connection may wait in
+        the queue before the pool is grown.
+    """
+
+    def __init__(
+            self,
+            worker_factory: Callable[["WorkerPool"], HTTPWorker],
+            connection_queue: Queue,
+            *,
+            min_workers: int,
+            max_workers: int,
+            idle_timeout: float = 30,
+            grow_threshold: float = 0.01,
+    ) -> None:
+        assert 0 < min_workers <= max_workers, "min_workers must be between 1 and max_workers"
+        self.worker_factory = worker_factory
+        self.connection_queue = connection_queue
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.idle_timeout = idle_timeout
+        self.grow_threshold = grow_threshold
+        self.workers: Set[HTTPWorker] = set()
+        self.spawned_total = 0
+        self.retired_total = 0
+        self.stopping = False
+        self._lock = Lock()
+
+    @property
+    def busy_workers(self) -> int:
+        return sum(worker.busy for worker in list(self.workers))
+
+    def start(self) -> None:
+        with self._lock:
+            while len(self.workers) < self.min_workers:
+                self._spawn()
+
+    def grow(self) -> bool:
+        """Spawn a worker unless the pool is already at capacity.
+        Returns True if a worker was spawned.
+        """
+        with self._lock:
+            if self.stopping or len(self.workers) >= self.max_workers:
+                return False
+
+            self._spawn()
+            return True
+
+    def maybe_grow(self) -> None:
+        """Spawn a worker if there are more queued connections than
+        idle workers.  This is called whenever a connection is queued.
+        """
+        if self.connection_queue.qsize() > len(self.workers) - self.busy_workers:
+            self.grow()
+
+    def retire(self, worker: HTTPWorker) -> bool:
+        """Remove an idle worker from the pool, unless that would shrink
+        it below min_workers.  Returns True if the worker should exit.
+        """
+        with self._lock:
+            if len(self.workers) <= self.min_workers:
+                return False
+
+            self.workers.discard(worker)
+            self.retired_total += 1
+            return True
+
+    def stop(self, timeout: float = 30) -> None:
+        """Stop every worker once the connections queued before this
+        was called have been served and wait up to timeout seconds for
+        them to exit.
+
+        Idle keep-alive connections aren't closed right away since
+        their clients may be in the middle of sending another request.
+        Instead, the next response on every connection tells the client
+        that the connection is being closed.  Idle connections are
+        closed once they time out.
+        """
+        with self._lock:
+            self.stopping = True
+            workers = list(self.workers)
+
+        deadline = time.monotonic() + timeout
+        try:
+            for _ in workers:
+                self.connection_queue.put(None, timeout=max(deadline - time.monotonic(), 0))
+        except Full:
+            LOGGER.warning("Timed out while stopping workers.")
+
+        for worker in workers:
+            worker.join(timeout=max(deadline - time.monotonic(), 0))
+
+    def stats(self) -> WorkerPoolStats:
+        return WorkerPoolStats(
+            min_workers=self.min_workers,
+            max_workers=self.max_workers,
+            workers=len(self.workers),
+            busy_workers=self.busy_workers,
+            spawned_total=self.spawned_total,
+            retired_total=self.retired_total,
+        )
+
+    def _spawn(self) -> None:
+        worker = self.worker_factory(self)
+        worker.start()
+        self.workers.add(worker)
+        self.spawned_total += 1
 
 
 class HTTPServer:
-    def __init__(self, host="127.0.0.1", port=9000, worker_count=16) -> None:
-        self.handlers: List[Tuple[str, HandlerT]] = []
+    """A threaded HTTP server.
+
+    SIGTERM and SIGINT shut the server down gracefully: it stops
+    accepting connections and waits for the ones it has already
+    accepted to be served.  SIGHUP reloads the server by starting a
+    new copy of the process that inherits the listening socket and
+    shutting down once that copy is ready to accept connections.
+
+    Parameters:
+      host: The address to listen on.
+      port: The port to listen on.
+      worker_count: The max number of worker threads per process.
+      min_worker_count: The number of worker threads per process to
+        keep around when idle.  Defaults to a quarter of worker_count.
+      worker_idle_timeout: The number of seconds a worker thread may be
+        idle for before it is retired.
+      shutdown_timeout: The number of seconds in-flight and queued
+        connections are given to finish when shutting down.
+      reload_timeout: The number of seconds a reloaded process is given
+        to start up before the reload is abandoned.
+      keepalive_timeout: The number of seconds an idle connection is
+        kept open for.
+      max_keepalive_requests: The max number of requests served off of
+        a single connection.
+      max_head_size: The max size of a request line and its headers.
+      max_header_count: The max number of headers per request.
+      max_body_size: The max size of a request body.  None means
+        request bodies may be of any size.
+      process_count: The number of worker processes to fork.  When this
+        is greater than 1, the process that calls serve_forever becomes
+        a supervisor that restarts crashed workers.
+      reuse_port: Whether each worker process should bind its own socket
+        using SO_REUSEPORT rather than sharing the supervisor's socket.
+        This lets the kernel balance connections between processes.
+      metrics: Where to record request metrics, if anywhere.  Mount
+        metrics.handler to expose them.
+      admission_timeout: The number of seconds to wait for room in the
+        connection queue before rejecting a new connection with a 503.
+        The default is to reject connections immediately.
+      max_queue_wait: The max number of seconds a connection may wait
+        in the queue.  Connections that wait longer are closed without
+        a response once a worker picks them up.  None disables this.
+      retry_after: The value of the Retry-After header sent along with
+        503 responses to rejected connections.
+      header_timeout: The max number of seconds a client may take to
+        send a request head once it starts sending it.  Slower clients
+        get a 408.
+      body_timeout: The max number of seconds to wait for request body
+        data to arrive.  Slower clients get a 408.
+      write_timeout: The max number of seconds to wait for a client to
+        accept response data.  Slower clients are disconnected.
+      min_transfer_rate: The min average rate, in bytes per second, at
+        which request bodies must arrive and responses must be read.
+        Transferring n bytes may take at most body_timeout (or
+        write_timeout) + n / min_transfer_rate seconds.  None disables
+        this.
+      handler_timeout: The max number of seconds a handler may take to
+        produce a response.  Handlers can't be interrupted, so slower
+        handlers run to completion but their responses are replaced
+        with a 504.  None disables this.
+    """
+
+    def __init__(
+            self,
+            host="127.0.0.1",
+            port=9000,
+            worker_count=16,
+            keepalive_timeout=5,
+            max_keepalive_requests=100,
+            max_head_size=MAX_HEAD_SIZE,
+            max_header_count=MAX_HEADER_COUNT,
+            max_body_size=MAX_BODY_SIZE,
+            process_count=1,
+            reuse_port=False,
+            metrics=None,
+            admission_timeout=0,
+            max_queue_wait=5,
+            retry_after=1,
+            min_worker_count=None,
+            worker_idle_timeout=30,
+            shutdown_timeout=30,
+            reload_timeout=30,
+            header_timeout=10,
+            body_timeout=30,
+            write_timeout=30,
+            min_transfer_rate=1024,
+            handler_timeout=None,
+    ) -> None:
+        self.mounts: MountTable[HandlerT] = MountTable()
         self.host = host
         self.port = port
         self.worker_count = worker_count
         self.worker_backlog = worker_count * 8
         self.connection_queue: Queue = Queue(self.worker_backlog)
+        self.keepalive_timeout = keepalive_timeout
+        self.max_keepalive_requests = max_keepalive_requests
+        self.max_head_size = max_head_size
+        self.max_header_count = max_header_count
+        self.max_body_size = max_body_size
+        self.process_count = process_count
+        self.reuse_port = reuse_port
+        self.metrics: Optional[Metrics] = metrics
+        self.admission_timeout = admission_timeout
+        self.max_queue_wait = max_queue_wait
+        self.retry_after = retry_after
+        self.min_worker_count = min_worker_count or max(worker_count // 4, 1)
+        self.worker_idle_timeout = worker_idle_timeout
+        self.shutdown_timeout = shutdown_timeout
+        self.reload_timeout = reload_timeout
+        self.header_timeout = header_timeout
+        self.body_timeout = body_timeout
+        self.write_timeout = write_timeout
+        self.min_transfer_rate = min_transfer_rate
+        self.handler_timeout = handler_timeout
+        self.pool: Optional[WorkerPool] = None
+        self.reloading = False
 
     def mount(self, path_prefix: str, handler: HandlerT) -> None:
-        """Mount a request handler at a particular path.  Handler
-        prefixes are tested in the order that they are added so the
-        first match "wins".
+        """Mount a request handler at a particular path.  Requests are
+        dispatched to the handler mounted at the longest prefix of
+        their path, matching whole path segments (see MountTable).
+
+        Raises:
+          ValueError: When a handler is already mounted at path_prefix.
+        """
+        self.mounts.add(path_prefix, handler)
+
+    def make_socket(self) -> socket.socket:
+        """Create a listening socket bound to this server's address, or
+        adopt the one inherited from the process that reloaded this one.
         """
-        self.handlers.append((path_prefix, handler))
+        listen_fd = os.environ.pop(LISTEN_FD_ENV, None)
+        if listen_fd is not None:
+            return socket.socket(fileno=int(listen_fd))
+
+        server_sock = socket.socket()
+        server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+        server_sock.bind((self.host, self.port))
+        server_sock.listen(self.worker_backlog)
+        return server_sock
 
     def serve_forever(self) -> None:
-        workers = []
-        for _ in range(self.worker_count):
-            worker = HTTPWorker(self.connection_queue, self.handlers)
-            worker.start()
-            workers.append(worker)
-
-        with socket.socket() as server_sock:
-            server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            server_sock.bind((self.host, self.port))
-            server_sock.listen(self.worker_backlog)
-            LOGGER.info("Listening on %s:%d...", self.host, self.port)
+        if self.process_count > 1:
+            self.supervise()
+            return
 
-            while True:
+        with self.make_socket() as server_sock:
+            self.serve(server_sock)
+
+    def serve(self, server_sock: socket.socket, reloadable: bool = True) -> None:
+        """Accept connections off of server_sock and hand them off to
+        this process' workers until interrupted, then wait for the
+        connections that were accepted to be served.
+        """
+        pool = self.pool = WorkerPool(
+            self.make_worker,
+            self.connection_queue,
+            min_workers=min(self.min_worker_count, self.worker_count),
+            max_workers=self.worker_count,
+            idle_timeout=self.worker_idle_timeout,
+        )
+        pool.start()
+
+        if self.metrics is not None:
+            self.metrics.add_gauge(
+                "http_connection_queue_depth",
+                "The number of connections waiting for a worker.",
+                self.connection_queue.qsize,
+            )
+            self.metrics.add_gauge(
+                "http_busy_workers",
+                "The number of workers currently serving a connection.",
+                lambda: pool.busy_workers,
+            )
+            self.metrics.add_gauge("http_workers", "The number of worker threads.", lambda: len(pool.workers))
+            self.metrics.add_gauge("http_max_workers", "The max number of worker threads.", lambda: pool.max_workers)
+            self.metrics.add_counter(
+                "http_connections_rejected_total",
+                "The number of connections rejected because the connection queue was full.",
+            )
+            self.metrics.add_counter(
+                "http_connections_expired_total",
+                "The number of connections closed after waiting in the queue for too long.",
+            )
+            self.metrics.add_counter(
+                "http_header_timeouts_total",
+                "The number of requests whose heads took too long to arrive.",
+            )
+            self.metrics.add_counter(
+                "http_body_timeouts_total",
+                "The number of requests whose bodies took too long to arrive.",
+            )
+            self.metrics.add_counter(
+                "http_write_timeouts_total",
+                "The number of connections closed because the client read its response too slowly.",
+            )
+            self.metrics.add_counter(
+                "http_handler_timeouts_total",
+                "The number of responses replaced with a 504 because their handler took too long.",
+            )
+
+        self.install_signal_handlers(server_sock, reloadable)
+        notify_ready()
+
+        LOGGER.info("Listening on %s:%d...", self.host, self.port)
+        while True:
+            try:
+                self.admit(*server_sock.accept())
+            except KeyboardInterrupt:
+                break
+
+        LOGGER.info("Shutting down...")
+        server_sock.close()
+        pool.stop(timeout=self.shutdown_timeout)
+
+    def make_worker(self, pool: Optional[WorkerPool] = None) -> HTTPWorker:
+        return HTTPWorker(
+            self.connection_queue,
+            self.mounts,
+            keepalive_timeout=self.keepalive_timeout,
+            max_keepalive_requests=self.max_keepalive_requests,
+            max_head_size=self.max_head_size,
+            max_header_count=self.max_header_count,
+            max_body_size=self.max_body_size,
+            metrics=self.metrics,
+            max_queue_wait=self.max_queue_wait,
+            pool=pool,
+            header_timeout=self.header_timeout,
+            body_timeout=self.body_timeout,
+            write_timeout=self.write_timeout,
+            min_transfer_rate=self.min_transfer_rate,
+            handler_timeout=self.handler_timeout,
+        )
+
+    def admit(self, client_sock: socket.socket, client_addr: typing.Tuple[str, int]) -> None:
+        """Hand a connection off to the workers, or reject it with a
+        503 if the connection queue stays full for longer than
+        admission_timeout seconds.
+        """
+        try:
+            item = client_sock, client_addr, time.monotonic()
+            if self.admission_timeout:
+                self.connection_queue.put(item, timeout=self.admission_timeout)
+            else:
+                self.connection_queue.put_nowait(item)
+        except Full:
+            self.reject(client_sock)
+            return
+
+        if self.pool is not None:
+            self.pool.maybe_grow()
+
+    def reject(self, client_sock: socket.socket) -> None:
+        response = Response(status="503 Service Unavailable", content="Service Unavailable")
+        response.headers.add("retry-after", str(self.retry_after))
+        response.headers.add("connection", "close")
+        head, _ = response.prepare()
+
+        # The accept loop must never block on a slow client so the
+        # response is only sent if it fits in the socket's buffer.
+        # Whatever part of the request has already arrived is read
+        # first because closing a socket with unread data resets the
+        # connection, discarding the response.
+        with client_sock:
+            try:
+                client_sock.setblocking(False)
+                while client_sock.recv(16_384):
+                    pass
+            except OSError:
+                pass
+
+            try:
+                client_sock.send(head + response.body.read())
+                client_sock.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+
+        if self.metrics is not None:
+            self.metrics.increment("http_connections_rejected_total")
+
+    def install_signal_handlers(self, server_sock: Optional[socket.socket], reloadable: bool = True) -> None:
+        """Make SIGTERM interrupt the current process like SIGINT does
+        and, if reloadable, make SIGHUP reload it.  Reloaded processes
+        inherit server_sock, if provided.
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return
+
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        if not reloadable:
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            return
+
+        def handle_sighup(signum, frame):
+            if self.reloading:
+                return
+
+            self.reloading = True
+            Thread(target=self.reload, args=(server_sock,), daemon=True).start()
+
+        signal.signal(signal.SIGHUP, handle_sighup)
+
+    def reload(self, server_sock: Optional[socket.socket]) -> bool:
+        """Start a new copy of the current process that inherits
+        server_sock and, once it is ready, shut this one down by
+        sending it a SIGTERM.  Returns False if the new process failed
+        to start in time, in which case this one keeps running.
+        """
+        ready_fd, notify_fd = os.pipe()
+        env = {**os.environ, READY_FD_ENV: str(notify_fd)}
+        pass_fds = [notify_fd]
+        if server_sock is not None:
+            env[LISTEN_FD_ENV] = str(server_sock.fileno())
+            pass_fds.append(server_sock.fileno())
+
+        argv = get_reload_argv()
+        try:
+            LOGGER.info("Reloading...")
+            process = subprocess.Popen(argv, env=env, pass_fds=pass_fds)
+        except OSError:
+            LOGGER.exception("Failed to start new process.")
+            os.close(ready_fd)
+            self.reloading = False
+            return False
+        finally:
+            os.close(notify_fd)
+
+        with os.fdopen(ready_fd, "rb") as ready_file:
+            readable, _, _ = select.select([ready_file], [], [], self.reload_timeout)
+            ready = bool(readable) and ready_file.read(1) == b"1"
+
+        if not ready:
+            LOGGER.error("New process %d failed to become ready.  Aborting reload.", process.pid)
+            process.kill()
+            process.wait()
+            self.reloading = False
+            return False
+
+        LOGGER.info("New process %d is ready.", process.pid)
+        os.kill(os.getpid(), signal.SIGTERM)
+        return True
+
+    def supervise(self) -> None:
+        """Fork process_count worker processes and restart any that
+        exit unexpectedly.  SIGTERM and SIGINT stop every worker
+        process and then return.  SIGHUP reloads the supervisor along
+        with its workers.
+        """
+        server_sock = None if self.reuse_port else self.make_socket()
+        children: Dict[int, float] = {}
+
+        def spawn() -> None:
+            pid = os.fork()
+            if pid == 0:
+                status = 0
                 try:
-                    self.connection_queue.put(server_sock.accept())
+                    if server_sock is None:
+                        with self.make_socket() as sock:
+                            self.serve(sock, reloadable=False)
+                    else:
+                        self.serve(server_sock, reloadable=False)
                 except KeyboardInterrupt:
+                    pass
+                except Exception:
+                    LOGGER.exception("Unhandled error in worker process.")
+                    status = 1
+                finally:
+                    # Never let the child fall through to the supervisor's code.
+                    os._exit(status)
+
+            LOGGER.info("Started worker process %d.", pid)
+            children[pid] = time.monotonic()
+
+        # The workers are forked off of this process so, if it has
+        # gotten this far, they're as good as ready.
+        self.install_signal_handlers(server_sock)
+        notify_ready()
+        try:
+            for _ in range(self.process_count):
+                spawn()
+
+            while True:
+                pid, status = os.wait()
+                started_at = children.pop(pid, None)
+                if started_at is None:
+                    continue
+
+                LOGGER.warning("Worker process %d exited with status %d.", pid, waitstatus_to_exitcode(status))
+
+                # Avoid spinning when worker processes crash on startup.
+                if time.monotonic() - started_at < 1:
+                    time.sleep(1)
+
+                spawn()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+            self.signal_children(children, signal.SIGTERM)
+
+            deadline = time.monotonic() + self.shutdown_timeout + 5
+            while children and time.monotonic() < deadline:
+                try:
+                    pid, _ = os.waitpid(-1, os.WNOHANG)
+                except ChildProcessError:
                     break
 
-        for worker in workers:
-            worker.stop()
+                if pid == 0:
+                    time.sleep(0.1)
+                    continue
 
-        for worker in workers:
-            worker.join(timeout=30)
+                children.pop(pid, None)
 
+            if children:
+                LOGGER.warning("Killing worker processes %r.", list(children))
+                self.signal_children(children, signal.SIGKILL)
 
-def serve_static(server_root: str) -> HandlerT:
+            if server_sock is not None:
+                server_sock.close()
+
+    def signal_children(self, children: Dict[int, float], signum: int) -> None:
+        for pid in children:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+
+def get_reload_argv() -> List[str]:
+    """Get the command line that starts a new copy of the current
+    process.
+    """
+    orig_argv = getattr(sys, "orig_argv", None)
+    if orig_argv:
+        return list(orig_argv)
+
+    # Before Python 3.10, sys.argv[0] is the path of the __main__
+    # module even when it was run with -m, and running that path as a
+    # script would break its relative imports.
+    spec = getattr(sys.modules.get("__main__"), "__spec__", None)
+    if spec is not None:
+        module_name = spec.name
+        if module_name.endswith(".__main__"):
+            module_name = module_name[:-len(".__main__")]
+        return [sys.executable, "-m", module_name, *sys.argv[1:]]
+    return [sys.executable, *sys.argv]
+
+
+def waitstatus_to_exitcode(status: int) -> int:
+    """Convert a status returned by os.wait into an exit code.  Processes
+    killed by a signal get the negated signal number, like subprocess.
+    """
+    if hasattr(os, "waitstatus_to_exitcode"):
+        return os.waitstatus_to_exitcode(status)
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def notify_ready() -> None:
+    """Let the process that started this one as part of a reload know
+    that this one is ready to accept connections.
+    """
+    ready_fd = os.environ.pop(READY_FD_ENV, None)
+    if ready_fd is not None:
+        try:
+            os.write(int(ready_fd), b"1")
+        except OSError:
+            LOGGER.warning("Failed to notify parent process.", exc_info=True)
+        finally:
+            os.close(int(ready_fd))
+
+
+def prepare_connection(request: Request, response: Response, keep_alive: bool) -> bool:
+    """Add the headers that tell the client whether the connection
+    will be kept open after response is sent.  Returns False if the
+    connection has to be closed.
+    """
+    # HTTP/1.0 clients don't understand chunked responses so those
+    # responses are delimited by closing the connection instead.
+    if request.version == "HTTP/1.0" and isinstance(response, StreamingResponse) and \
+            response.headers.get("content-length") is None:
+        response.chunked = False
+        keep_alive = False
+
+    if not keep_alive:
+        response.headers.add("connection", "close")
+    elif request.version == "HTTP/1.0":
+        response.headers.add("connection", "keep-alive")
+    return keep_alive
+
+
+def serve_static(
+        server_root: str,
+        *,
+        cache: Optional[StaticFileCache] = None,
+        cache_control: Optional[Dict[str, str]] = None,
+        compress: bool = True,
+        compressed_cache: Optional[CompressedFileCache] = None,
+) -> HandlerT:
     """Generate a request handler that serves file off of disk
     relative to server_root.
+
+    File metadata is kept in cache so that repeated requests for the
+    same files don't have to hit the disk until they are opened.
+    Responses carry ETag and Last-Modified validators and conditional
+    requests for files that haven't changed get a 304 response without
+    the file being opened.  Range requests are answered with 206
+    responses containing one or more parts of the file.
+
+    Compressible files are served gzip or brotli encoded to clients
+    that accept it, using precompressed siblings (eg. "app.js.gz") when
+    they exist.  Encoded responses ignore Range headers.
+
+    Parameters:
+      server_root: The directory to serve files from.
+      cache: The metadata cache to use.  A new one is created by default.
+      cache_control: A mapping from path prefixes to Cache-Control
+        header values.  The longest matching prefix wins.
+      compress: Whether or not to serve encoded variants of files.
+      compressed_cache: The cache of compressed files to use.  A new
+        one is created by default.
     """
+    server_root = os.path.abspath(server_root)
+    file_cache = cache or StaticFileCache()
+    cache_control_rules = CacheControlRules(cache_control)
+    compressed_file_cache = compressed_cache or CompressedFileCache()
 
     def handler(request: Request) -> Response:
         path = request.path
         if request.path == "/":
             path = "/index.html"
 
-        abspath = os.path.normpath(os.path.join(server_root, path.lstrip("/")))
-        if not abspath.startswith(server_root):
+        static_file = file_cache.get(server_root, path)
+        if static_file is None:
             return Response(status="404 Not Found", content="Not Found")
 
-        try:
-            content_type, encoding = mimetypes.guess_type(abspath)
-            if content_type is None:
-                content_type = "application/octet-stream"
+        headers = Headers()
+        variant = None
+        if compress and is_compressible(static_file.content_type):
+            headers.add("vary", "accept-encoding")
+            variant = compressed_file_cache.get_variant(
+                request.headers.get("accept-encoding"), file_cache, server_root, path, static_file,
+            )
 
-            if encoding is not None:
-                content_type += f"; charset={encoding}"
+        etag = static_file.etag if variant is None else variant.etag
+        headers.add("etag", etag)
+        headers.add("last-modified", static_file.last_modified)
+        headers.add("accept-ranges", "bytes")
+        cache_control_value = cache_control_rules.get(request.path)
+        if cache_control_value is not None:
+            headers.add("cache-control", cache_control_value)
 
-            body_file = open(abspath, "rb")
-            response = Response(status="200 OK", body=body_file)
-            response.headers.add("content-type", content_type)
-            return response
+        if is_not_modified(request.headers, static_file, etag):
+            return Response(status="304 Not Modified", headers=headers)
+
+        if variant is not None:
+            headers.add("content-type", static_file.content_type)
+            headers.add("content-encoding", variant.encoding)
+            headers.add("content-length", str(variant.size))
+            try:
+                return Response(status="200 OK", headers=headers, body=variant.open())
+            except FileNotFoundError:
+                return Response(status="404 Not Found", content="Not Found")
+
+        ranges = None
+        range_header = request.headers.get("range")
+        if range_header is not None and request.method == "GET" and if_range_matches(request.headers, static_file):
+            ranges = parse_ranges(range_header, static_file.size)
+            if ranges == []:
+                headers.add("content-range", f"bytes */{static_file.size}")
+                return Response(status="416 Range Not Satisfiable", headers=headers)
+
+        try:
+            body_file = open(static_file.abspath, "rb")
         except FileNotFoundError:
             return Response(status="404 Not Found", content="Not Found")
 
+        if ranges and len(ranges) > 1:
+            return MultipartRangesResponse(body_file, ranges, static_file.size, static_file.content_type, headers)
+
+        headers.add("content-type", static_file.content_type)
+        if ranges:
+            first, last = ranges[0]
+            body_file.seek(first)
+            headers.add("content-range", f"bytes {first}-{last}/{static_file.size}")
+            headers.add("content-length", str(last - first + 1))
+            return Response(status="206 Partial Content", headers=headers, body=body_file)
+
+        headers.add("content-length", str(static_file.size))
+        return Response(status="200 OK", headers=headers, body=body_file)
+
     return handler
@@ -0,0 +1,265 @@
+import asyncio
+import mimetypes
+import os
+import secrets
+import socket
+import stat
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import IO, Dict, List, NamedTuple, Optional, Tuple
+
+from .headers import Headers
+from .response import Response
+
+
+class StaticFile(NamedTuple):
+    """Metadata about a file that can be served off of disk.
+    """
+
+    abspath: str
+    size: int
+    mtime: float
+    content_type: str
+    etag: str
+    last_modified: str
+
+
+class StaticFileCache:
+    """An LRU cache of StaticFile metadata keyed by server root and
+    request path.  Entries are re-validated against the file system
+    once they are older than ttl seconds.  Missing files are cached
+    as well so repeated requests for them don't hit the disk either.
+
+    Parameters:
+      ttl: The number of seconds entries are considered fresh for.
+      max_entries: The max number of entries to hold on to.
+    """
+
+    def __init__(self, ttl: float = 1.0, max_entries: int = 1024) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Optional[StaticFile]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, server_root: str, path: str) -> Optional[StaticFile]:
+        """Look up the file at path relative to server_root.  Returns
+        None if the file doesn't exist or is outside of server_root.
+        """
+        key = server_root, path
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        static_file = load_static_file(server_root, path)
+        with self._lock:
+            self._entries[key] = now + self.ttl, static_file
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return static_file
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def load_static_file(server_root: str, path: str) -> Optional[StaticFile]:
+    """Resolve path relative to server_root and gather the metadata
+    needed to serve it.  Returns None if the file doesn't exist or is
+    outside of server_root.
+    """
+    abspath = os.path.normpath(os.path.join(server_root, path.lstrip("/")))
+    if not abspath.startswith(server_root + os.sep):
+        return None
+
+    try:
+        file_stat = os.stat(abspath)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+    if not stat.S_ISREG(file_stat.st_mode):
+        return None
+
+    content_type, encoding = mimetypes.guess_type(abspath)
+    if content_type is None:
+        content_type = "application/octet-stream"
+
+    if encoding is not None:
+        content_type += f"; charset={encoding}"
+
+    return StaticFile(
+        abspath=abspath,
+        size=file_stat.st_size,
+        mtime=file_stat.st_mtime,
+        content_type=content_type,
+        etag=f'"{file_stat.st_mtime_ns:x}-{file_stat.st_size:x}"',
+        last_modified=formatdate(file_stat.st_mtime, usegmt=True),
+    )
+
+
+def is_not_modified(headers: Headers, static_file: StaticFile, etag: Optional[str] = None) -> bool:
+    """Returns True if the conditional request headers show that the
+    client already has the current version of static_file.
+    If-None-Match takes precedence over If-Modified-Since.  The ETag
+    of an encoded variant of the file may be passed in as etag.
+    """
+    etag = etag or static_file.etag
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+
+        etags = [value.strip() for value in if_none_match.split(",")]
+        return etag in etags or f"W/{etag}" in etags
+
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+
+        return int(static_file.mtime) <= since
+
+    return False
+
+
+class CacheControlRules:
+    """Maps request path prefixes to Cache-Control header values.
+    The longest matching prefix wins.
+    """
+
+    def __init__(self, rules: Optional[Dict[str, str]] = None) -> None:
+        self.rules: List[Tuple[str, str]] = sorted((rules or {}).items(), key=lambda rule: -len(rule[0]))
+
+    def get(self, path: str) -> Optional[str]:
+        for prefix, value in self.rules:
+            if path.startswith(prefix):
+                return value
+        return None
+
+
+#: The max number of ranges a single request may ask for.  Requests
+#: for more ranges than this are served the whole file instead.
+MAX_RANGES = 16
+
+RangeT = Tuple[int, int]
+
+
+def parse_ranges(header: str, size: int) -> Optional[List[RangeT]]:
+    """Parse a Range header into a list of inclusive (first, last)
+    byte positions within a file of the given size.
+
+    Returns None if the header is malformed or should otherwise be
+    ignored and an empty list if none of the ranges can be satisfied.
+    """
+    unit, _, specs = header.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+
+    ranges = []
+    for spec in specs.split(","):
+        first_pos, sep, last_pos = spec.strip().partition("-")
+        if not sep:
+            return None
+
+        try:
+            if not first_pos:
+                suffix_length = int(last_pos)
+                if suffix_length <= 0:
+                    continue
+
+                first, last = max(size - suffix_length, 0), size - 1
+            else:
+                first, last = int(first_pos), size - 1
+                if last_pos:
+                    if first > int(last_pos):
+                        return None
+
+                    last = min(int(last_pos), last)
+        except ValueError:
+            return None
+
+        if first < size:
+            ranges.append((first, last))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+
+def if_range_matches(headers: Headers, static_file: StaticFile) -> bool:
+    """Returns True if the Range header should be honored given the
+    request's If-Range header, if any.
+    """
+    if_range = headers.get("if-range")
+    if if_range is None:
+        return True
+    return if_range.strip() in (static_file.etag, static_file.last_modified)
+
+
+class MultipartRangesResponse(Response):
+    """A 206 response containing several ranges of a file as a
+    multipart/byteranges body.  Each range is sent using sendfile.
+
+    Parameters:
+      body: The file to send ranges from.
+      ranges: A list of inclusive (first, last) byte positions.
+      size: The size of the file.
+      content_type: The content type of the file.
+      headers: Any additional response headers.
+    """
+
+    def __init__(
+            self,
+            body: IO[bytes],
+            ranges: List[RangeT],
+            size: int,
+            content_type: str,
+            headers: Optional[Headers] = None,
+    ) -> None:
+        super().__init__("206 Partial Content", headers=headers, body=body)
+
+        boundary = secrets.token_hex(16)
+        self.parts: List[Tuple[bytes, int, int]] = []
+        for first, last in ranges:
+            part_head = (
+                f"\r\n--{boundary}\r\n"
+                f"content-type: {content_type}\r\n"
+                f"content-range: bytes {first}-{last}/{size}\r\n\r\n"
+            ).encode()
+            self.parts.append((part_head, first, last - first + 1))
+
+        self.closing = f"\r\n--{boundary}--\r\n".encode()
+        content_length = sum(len(part_head) + count for part_head, _, count in self.parts) + len(self.closing)
+        self.headers.add("content-type", f"multipart/byteranges; boundary={boundary}")
+        self.headers.add("content-length", str(content_length))
+
+    def send(self, sock: socket.socket) -> None:
+        head, _ = self.prepare()
+        sock.sendall(head)
+        for part_head, offset, count in self.parts:
+            sock.sendall(part_head)
+            sock.sendfile(self.body, offset, count)  # type: ignore
+        sock.sendall(self.closing)
+
+    async def send_async(self, writer: asyncio.StreamWriter) -> None:
+        head, _ = self.prepare()
+        writer.write(head)
+
+        loop = asyncio.get_event_loop()
+        for part_head, offset, count in self.parts:
+            writer.write(part_head)
+            await loop.sendfile(writer.transport, self.body, offset, count)  # type: ignore
+
+        writer.write(self.closing)
+        await writer.drain()
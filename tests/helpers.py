@@ -0,0 +1,35 @@
+import typing
+from io import BytesIO
+
+from scratch.headers import Headers
+from scratch.request import Request
+
+
+class StubSocket:
+    """A socket that collects everything that's written to it.
+    """
+
+    def __init__(self) -> None:
+        self._buff = BytesIO()
+
+    def sendall(self, data: bytes) -> None:
+        self._buff.write(data)
+
+    def sendmsg(self, buffers: typing.List[bytes]) -> int:
+        for buff in buffers:
+            self._buff.write(buff)
+        return sum(len(buff) for buff in buffers)
+
+    def sendfile(self, f: typing.IO[bytes], offset: int = 0, count: typing.Optional[int] = None) -> None:
+        f.seek(offset)
+        self._buff.write(f.read(count))
+
+    def getvalue(self) -> bytes:
+        return self._buff.getvalue()
+
+
+def make_request(path: str, *headers: typing.Tuple[str, str], method: str = "GET") -> Request:
+    request_headers = Headers()
+    for name, value in headers:
+        request_headers.add(name, value)
+    return Request(method=method, path=path, headers=request_headers, body=BytesIO())
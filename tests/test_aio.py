@@ -0,0 +1,150 @@
+import asyncio
+
+import pytest
+
+from scratch.aio import (AsyncHTTPServer, TransferBudget, is_async_handler,
+                         read_chunked_body)
+from scratch.request import BufferedBody, RequestTimeout
+from scratch.response import Response
+from tests.helpers import make_request
+
+
+def sync_handler(request):
+    return Response(content="sync")
+
+
+async def async_handler(request):
+    return Response(content="async")
+
+
+class AsyncApp:
+    async def __call__(self, request):
+        return Response(content="async app")
+
+
+def test_async_handlers_can_be_detected():
+    assert is_async_handler(async_handler)
+    assert is_async_handler(AsyncApp())
+    assert not is_async_handler(sync_handler)
+
+
+def test_async_servers_can_dispatch_to_sync_and_async_handlers():
+    # Given that I have an async server with both kinds of handlers mounted
+    server = AsyncHTTPServer()
+    server.mount("/sync", sync_handler)
+    server.mount("/async", async_handler)
+    server.mount("/app", AsyncApp())
+
+    async def dispatch(path):
+        response = await server.handle_request(make_request(path))
+        return response.status, response.body.read()
+
+    # When I make requests to each of them
+    # Then each handler should produce its response
+    assert asyncio.run(dispatch("/sync")) == (b"200 OK", b"sync")
+    assert asyncio.run(dispatch("/async")) == (b"200 OK", b"async")
+    assert asyncio.run(dispatch("/app")) == (b"200 OK", b"async app")
+    assert asyncio.run(dispatch("/missing"))[0] == b"404 Not Found"
+
+
+def read_chunked(data: bytes, max_size=None) -> bytes:
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await read_chunked_body(reader, max_size)
+
+    return asyncio.run(read())
+
+
+def test_chunked_bodies_can_be_read():
+    assert read_chunked(b"5\r\nhello\r\n6;ext\r\n world\r\n0\r\nTrailer: 1\r\n\r\n") == b"hello world"
+
+
+def test_reading_large_chunked_bodies_fails():
+    with pytest.raises(ValueError):
+        read_chunked(b"5\r\nhello\r\n0\r\n\r\n", max_size=4)
+
+
+class StubWriter:
+    def __init__(self) -> None:
+        self.data = b""
+
+    def write(self, data: bytes) -> None:
+        self.data += data
+
+    def writelines(self, buffers) -> None:
+        for data in buffers:
+            self.write(data)
+
+    async def drain(self) -> None:
+        pass
+
+
+def read_request(server: AsyncHTTPServer, data: bytes):
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        writer = StubWriter()
+        return await server.read_request(reader, writer), writer.data
+
+    return asyncio.run(read())
+
+
+def test_request_bodies_are_buffered():
+    # Given that I have an async server
+    server = AsyncHTTPServer()
+
+    # When I read a request with a body
+    request, _ = read_request(server, b"POST / HTTP/1.1\r\ncontent-length: 5\r\n\r\nhello")
+
+    # Then its body should be buffered in memory
+    assert isinstance(request.body, BufferedBody)
+    assert request.body.read() == b"hello"
+    assert not request.body.pipelined
+    assert request.body.drain() == b""
+
+
+@pytest.mark.parametrize("data", [
+    b"POST / HTTP/1.1\r\ncontent-length: 10\r\n\r\nhello",
+    b"POST / HTTP/1.1\r\ntransfer-encoding: chunked\r\n\r\n5\r\nhello\r\n",
+])
+def test_request_bodies_that_arrive_too_slowly_get_a_408(data):
+    # Given that I have an async server with a body timeout
+    server = AsyncHTTPServer(body_timeout=0.1, min_transfer_rate=None)
+
+    # When a client only sends part of a request body
+    request, response = read_request(server, data)
+
+    # Then it should respond with a 408
+    assert request is None
+    assert response.startswith(b"HTTP/1.1 408 Request Timeout\r\n")
+
+
+def test_requests_with_malformed_header_names_get_a_400():
+    # Given that I have an async server
+    server = AsyncHTTPServer()
+
+    # When a client sends a header with whitespace before its colon
+    request, response = read_request(server, b"POST / HTTP/1.1\r\ncontent-length : 5\r\n\r\nhello")
+
+    # Then it should respond with a 400
+    assert request is None
+    assert response.startswith(b"HTTP/1.1 400 Bad Request\r\n")
+
+
+def test_transfer_budgets_grow_with_the_data_received():
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"5\r\nhello\r\n")
+        budget = TransferBudget(0.1, min_rate=100)
+        with pytest.raises(RequestTimeout):
+            await read_chunked_body(reader, budget=budget)
+        return budget
+
+    # Given that I have a budget that allows an extra second per 100 bytes
+    # When a chunked body stalls after some data
+    budget = asyncio.run(read())
+
+    # Then everything that was received should count towards it
+    assert budget.received == len(b"5\r\nhello\r\n")
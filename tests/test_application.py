@@ -1,9 +1,10 @@
 from io import BytesIO
 
-from scratch.application import Application
+from scratch.application import Application, after, before
 from scratch.headers import Headers
 from scratch.request import Request
 from scratch.response import Response
+from tests.helpers import make_request
 
 app = Application()
 
@@ -43,3 +44,122 @@ def test_applications_can_fail_to_route_invalid_paths():
 
     # Then I should get back a 404 response
     assert response.status == b"404 Not Found"
+
+
+def test_applications_respond_with_405_to_unrouted_methods():
+    # Given that I have an application
+    # When I request a registered path using a method it doesn't handle
+    response = app(Request(method="POST", path="/people/Jim/32", headers=Headers(), body=BytesIO()))
+
+    # Then I should get back a 405 response
+    assert response.status == b"405 Method Not Allowed"
+    assert response.headers.get("allow") == "GET"
+
+
+def test_middleware_wrap_handlers_in_order():
+    # Given that I have an application with global and per-route middleware
+    calls = []
+
+    def tracing(name):
+        def middleware(handler):
+            def wrapper(request, **params):
+                calls.append(name)
+                return handler(request, **params)
+            return wrapper
+        return middleware
+
+    app = Application()
+    app.add_middleware(tracing("first"))
+    app.add_middleware(tracing("second"))
+
+    @app.route("/people/{name}", middleware=[tracing("route")])
+    def get_person(request, name):
+        calls.append(name)
+        return Response(content=name)
+
+    # When I request that route
+    response = app(make_request("/people/Jim"))
+
+    # Then the global middleware should run first, in the order they were added
+    assert calls == ["first", "second", "route", "Jim"]
+    assert response.route_name == "get_person"
+
+
+def test_before_hooks_can_short_circuit_handlers():
+    # Given that I have an application with a before hook that rejects anonymous requests
+    def require_auth(request):
+        if request.headers.get("authorization") is None:
+            return Response("401 Unauthorized", content="Unauthorized")
+        return None
+
+    app = Application()
+
+    @app.route("/secret", middleware=[before(require_auth)])
+    def secret(request):
+        return Response(content="secret")
+
+    # When I request the route anonymously
+    response = app(make_request("/secret"))
+
+    # Then I should get back a 401 response tagged with the route's name
+    assert response.status == b"401 Unauthorized"
+    assert response.route_name == "secret"
+
+    # When I request the route with credentials
+    request = make_request("/secret")
+    request.headers.add("authorization", "Bearer 42")
+    response = app(request)
+
+    # Then I should get back the handler's response
+    assert response.body.read() == b"secret"
+
+
+def test_after_hooks_can_modify_responses():
+    # Given that I have an application with an after hook
+    def add_server_header(request, response):
+        response.headers.add("server", "scratch")
+        return response
+
+    app = Application()
+    app.add_middleware(after(add_server_header))
+    app.add_route("GET", "/", lambda request: Response(content="hi"), name="index")
+
+    # When I request a route
+    response = app(make_request("/"))
+
+    # Then the hook should have modified the response
+    assert response.headers.get("server") == "scratch"
+
+    # When I request a path that isn't routed
+    response = app(make_request("/missing"))
+
+    # Then the global hook should apply to that response as well
+    assert response.status == b"404 Not Found"
+    assert response.headers.get("server") == "scratch"
+
+
+def test_call_chains_are_built_once():
+    # Given that I have an application with a middleware that counts how many times it's applied
+    applied = []
+
+    def counting(handler):
+        applied.append(handler)
+        return handler
+
+    app = Application()
+    app.add_middleware(counting)
+    app.add_route("GET", "/", lambda request: Response(content="hi"), name="index")
+
+    # When I make a few requests
+    for _ in range(3):
+        app(make_request("/"))
+
+    # Then the middleware should only have been applied once per chain
+    assert len(applied) == 2
+
+    # When I add another route
+    app.add_route("GET", "/other", lambda request: Response(content="hi"), name="other")
+    app(make_request("/other"))
+
+    # Then the call chains should be rebuilt
+    assert len(applied) == 5
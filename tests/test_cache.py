@@ -0,0 +1,216 @@
+import gzip
+import threading
+import time
+
+from scratch import compression
+from scratch.application import Application
+from scratch.cache import ResponseCache
+from scratch.compression import compressed
+from scratch.response import JSONResponse, Response
+from tests.helpers import StubSocket, make_request
+
+
+def make_app(cache, handler=None):
+    calls = []
+
+    def get_user(request, user_id):
+        calls.append(user_id)
+        if handler is not None:
+            return handler(request, user_id)
+        return Response(content=f"user {user_id}")
+
+    app = Application()
+    app.add_route("GET", "/users/{user_id}", get_user, middleware=[cache])
+    app.add_route("POST", "/users/{user_id}", get_user, name="update_user", middleware=[cache])
+    return app, calls
+
+
+def test_responses_are_served_from_the_cache():
+    # Given that I have an application with a cached route
+    cache = ResponseCache(ttl=60)
+    app, calls = make_app(cache)
+
+    # When I request the same path twice
+    app(make_request("/users/1"))
+    response = app(make_request("/users/1"))
+
+    # Then the handler should only have been called once
+    assert calls == ["1"]
+    assert cache.hits == 1
+
+    # And the cached response should be sent in full
+    response.headers.add("connection", "close")
+    sock = StubSocket()
+    response.send(sock)
+    assert sock.getvalue() == b"HTTP/1.1 200 OK\r\ncontent-length: 6\r\nconnection: close\r\n\r\nuser 1"
+    assert response.route_name == "get_user"
+
+
+def test_responses_are_cached_per_path_and_vary_header():
+    # Given that I have an application with a cached route
+    cache = ResponseCache(ttl=60, vary=["accept-encoding"])
+    app, calls = make_app(cache)
+
+    # When I request different paths and encodings
+    app(make_request("/users/1"))
+    app(make_request("/users/2"))
+    app(make_request("/users/1", ("accept-encoding", "gzip")))
+
+    # Then every request should reach the handler
+    assert calls == ["1", "2", "1"]
+
+
+def test_only_safe_requests_and_successful_responses_are_cached():
+    # Given that I have an application whose handler fails for one user
+    def handler(request, user_id):
+        if user_id == "404":
+            return Response("404 Not Found", content="Not Found")
+        return Response(content="ok")
+
+    cache = ResponseCache(ttl=60)
+    app, calls = make_app(cache, handler)
+
+    # When I make repeated POST requests and requests for the missing user
+    for _ in range(2):
+        app(make_request("/users/1", method="POST"))
+        app(make_request("/users/404"))
+
+    # Then none of them should be cached
+    assert calls == ["1", "404", "1", "404"]
+    assert len(cache) == 0
+
+
+def test_expired_entries_are_recomputed():
+    # Given that I have an application with a short-lived cache
+    cache = ResponseCache(ttl=0.05)
+    app, calls = make_app(cache)
+
+    # When I request the same path before and after its entry expires
+    app(make_request("/users/1"))
+    time.sleep(0.1)
+    app(make_request("/users/1"))
+
+    # Then the handler should have been called twice
+    assert calls == ["1", "1"]
+
+
+def test_stale_entries_are_served_while_being_revalidated():
+    # Given that I have an application with a stale-while-revalidate cache
+    cache = ResponseCache(ttl=0.05, stale_while_revalidate=60)
+    counter = iter(range(100))
+    app, calls = make_app(cache, lambda request, user_id: Response(content=str(next(counter))))
+
+    # And a stale entry
+    app(make_request("/users/1"))
+    time.sleep(0.1)
+
+    # When I request it again
+    response = app(make_request("/users/1"))
+
+    # Then I should get the stale response right away
+    assert response.body.read() == b"0"
+
+    # And the entry should get refreshed in the background
+    deadline = time.monotonic() + 5
+    while app(make_request("/users/1")).body.read() != b"1":
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_concurrent_misses_are_coalesced():
+    # Given that I have an application with a slow cached route
+    released = threading.Event()
+
+    def handler(request, user_id):
+        released.wait()
+        return Response(content="slow")
+
+    cache = ResponseCache(ttl=60)
+    app, calls = make_app(cache, handler)
+
+    # When many requests for the same path arrive at once
+    responses = []
+    threads = [threading.Thread(target=lambda: responses.append(app(make_request("/users/1")))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+
+    time.sleep(0.1)
+    released.set()
+    for thread in threads:
+        thread.join()
+
+    # Then the handler should only be called once
+    assert calls == ["1"]
+    assert [response.body.read() for response in responses] == [b"slow"] * 8
+
+
+def test_entries_can_be_invalidated_by_route_name():
+    # Given that I have an application with a cached route
+    cache = ResponseCache(ttl=60)
+    app, calls = make_app(cache)
+    app(make_request("/users/1"))
+    app(make_request("/users/2"))
+
+    # When I invalidate that route
+    cache.invalidate("get_user")
+
+    # Then its responses should be recomputed
+    app(make_request("/users/1"))
+    assert calls == ["1", "2", "1"]
+
+
+def test_caches_evict_least_recently_used_entries():
+    # Given that I have a cache that can only hold a couple of responses
+    cache = ResponseCache(ttl=60, max_size=100)
+    app, calls = make_app(cache)
+
+    # When I request more paths than it can hold
+    for user_id in range(4):
+        app(make_request(f"/users/{user_id}"))
+
+    # Then the oldest entries should be evicted
+    assert len(cache) == 2
+    assert cache.size <= 100
+
+    app(make_request("/users/3"))
+    app(make_request("/users/0"))
+    assert calls == ["0", "1", "2", "3", "0"]
+
+
+def test_cached_responses_are_stored_compressed(monkeypatch):
+    # Given that I count how many times responses get compressed
+    calls = []
+    compress = compression.compress
+
+    def counting_compress(data, encoding, level):
+        calls.append(encoding)
+        return compress(data, encoding, level)
+
+    monkeypatch.setattr(compression, "compress", counting_compress)
+
+    # And I have a cached route with a large JSON response that is
+    # compressed inside of the cache
+    cache = ResponseCache(ttl=60)
+    app = Application()
+    value = [{"id": i, "name": f"user {i}"} for i in range(200)]
+    app.add_route("GET", "/users", lambda request: JSONResponse(value), middleware=[cache, compressed])
+
+    # When I request it several times, accepting gzip
+    responses = [app(make_request("/users", ("accept-encoding", "gzip"))) for _ in range(5)]
+
+    # Then every response should be compressed
+    assert cache.hits == 4
+    for response in responses:
+        assert response.headers.get("content-type") == "application/json"
+        assert response.headers.get("content-encoding") == "gzip"
+        assert response.headers.get("vary") == "accept-encoding"
+        assert gzip.decompress(response.body.getvalue()) == JSONResponse(value).body.getvalue()
+
+    # And the body should only have been compressed once
+    assert calls == ["gzip"]
+
+    # And clients that don't accept gzip should get their own entry
+    response = app(make_request("/users"))
+    assert cache.misses == 2
+    assert response.headers.get("content-encoding") is None
+    assert response.body.getvalue() == JSONResponse(value).body.getvalue()
@@ -0,0 +1,224 @@
+import gzip
+import threading
+import time
+import zlib
+
+import pytest
+
+from scratch import compression
+from scratch.compression import (CompressedFileCache, compress_chunks,
+                                 compressed, is_compressible,
+                                 negotiate_encoding)
+from scratch.headers import Headers
+from scratch.response import Response, StreamingResponse
+from scratch.server import serve_static
+from scratch.static import StaticFileCache
+from tests.helpers import make_request
+
+
+@pytest.fixture
+def server_root(tmp_path):
+    (tmp_path / "app.js").write_bytes(b"console.log('hello');\n" * 100)
+    (tmp_path / "site.css").write_bytes(b"body {}\n" * 100)
+    (tmp_path / "site.css.gz").write_bytes(b"precompressed")
+    (tmp_path / "image.png").write_bytes(b"\x89PNG" * 100)
+    return str(tmp_path)
+
+
+@pytest.mark.parametrize("header,available,expected", [
+    (None, ["br", "gzip"], None),
+    ("gzip", ["br", "gzip"], "gzip"),
+    ("gzip, br", ["br", "gzip"], "br"),
+    ("gzip;q=1.0, br;q=0.5", ["br", "gzip"], "gzip"),
+    ("br;q=0, *", ["br", "gzip"], "gzip"),
+    ("x-gzip", ["gzip"], "gzip"),
+    ("identity", ["gzip"], None),
+    ("gzip;q=0", ["gzip"], None),
+])
+def test_encodings_can_be_negotiated(header, available, expected):
+    assert negotiate_encoding(header, available) == expected
+
+
+@pytest.mark.parametrize("content_type,expected", [
+    ("text/html", True),
+    ("text/plain; charset=utf-8", True),
+    ("application/json", True),
+    ("image/svg+xml", True),
+    ("image/png", False),
+    ("application/octet-stream", False),
+    (None, False),
+])
+def test_compressible_content_types_can_be_detected(content_type, expected):
+    assert is_compressible(content_type) == expected
+
+
+def test_static_files_are_compressed_once_and_cached(server_root):
+    # Given that I have a static file handler
+    handler = serve_static(server_root)
+
+    # When I request a compressible file twice with gzip support
+    first_response = handler(make_request("/app.js", ("accept-encoding", "gzip")))
+    second_response = handler(make_request("/app.js", ("accept-encoding", "gzip")))
+
+    # Then I should get back its gzipped contents
+    data = first_response.body.read()
+    assert gzip.decompress(data) == b"console.log('hello');\n" * 100
+    assert first_response.headers.get("content-encoding") == "gzip"
+    assert first_response.headers.get("content-length") == str(len(data))
+    assert first_response.headers.get("vary") == "accept-encoding"
+
+    # And the file should only have been compressed once
+    assert second_response.body.read() == data
+
+    # And the encoded variant should have its own etag
+    assert first_response.headers.get("etag").endswith('-gzip"')
+
+
+def test_concurrent_misses_compress_static_files_once(server_root, monkeypatch):
+    # Given that compressing files is slow
+    calls = []
+
+    def slow_compress(data, encoding, level):
+        calls.append(encoding)
+        time.sleep(0.1)
+        return gzip.compress(data)
+
+    monkeypatch.setattr(compression, "compress", slow_compress)
+
+    # And I have a compressed file cache
+    cache = CompressedFileCache()
+    static_file = StaticFileCache().get(server_root, "/app.js")
+
+    # When many threads ask for the same file at the same time
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.compress_file(static_file, "gzip")))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Then they should all get back the same data
+    assert len(results) == 8
+    assert all(data is results[0] for data in results)
+
+    # And the file should only have been compressed once
+    assert calls == ["gzip"]
+
+
+def test_precompressed_static_files_are_preferred(server_root):
+    # Given that I have a static file handler
+    handler = serve_static(server_root)
+
+    # When I request a file that has a precompressed sibling
+    response = handler(make_request("/site.css", ("accept-encoding", "gzip")))
+
+    # Then I should get back the contents of the sibling
+    assert response.body.read() == b"precompressed"
+    assert response.headers.get("content-encoding") == "gzip"
+    assert response.headers.get("content-length") == "13"
+    assert response.headers.get("content-type") == "text/css"
+
+
+def test_static_files_are_not_compressed_unless_accepted(server_root):
+    # Given that I have a static file handler
+    handler = serve_static(server_root)
+
+    # When I request a compressible file without gzip support
+    response = handler(make_request("/app.js"))
+
+    # Then I should get back its contents as-is
+    assert response.body.read() == b"console.log('hello');\n" * 100
+    assert response.headers.get("content-encoding") is None
+    assert response.headers.get("vary") == "accept-encoding"
+
+
+def test_incompressible_static_files_are_not_compressed(server_root):
+    # Given that I have a static file handler
+    handler = serve_static(server_root)
+
+    # When I request an image with gzip support
+    response = handler(make_request("/image.png", ("accept-encoding", "gzip")))
+
+    # Then I should get back its contents as-is
+    assert response.body.read() == b"\x89PNG" * 100
+    assert response.headers.get("content-encoding") is None
+    assert response.headers.get("vary") is None
+
+
+def test_encoded_static_files_can_be_revalidated(server_root):
+    # Given that I have a static file handler
+    handler = serve_static(server_root)
+
+    # And I've previously requested a compressed file
+    response = handler(make_request("/app.js", ("accept-encoding", "gzip")))
+    etag = response.headers.get("etag")
+
+    # When I make a conditional request for it with the encoded variant's etag
+    response = handler(make_request("/app.js", ("accept-encoding", "gzip"), ("if-none-match", etag)))
+
+    # Then I should get back a 304
+    assert response.status == b"304 Not Modified"
+
+    # When I make the same conditional request without gzip support
+    response = handler(make_request("/app.js", ("if-none-match", etag)))
+
+    # Then I should get back the whole file
+    assert response.status == b"200 OK"
+
+
+def test_dynamic_responses_are_compressed_above_a_threshold():
+    # Given that I have a handler that returns large and small responses
+    def handler(request):
+        response = Response(content="x" * int(request.path[1:]))
+        response.headers.add("content-type", "text/plain")
+        return response
+
+    handler = compressed(handler, min_size=1024)
+
+    # When I request a large response with gzip support
+    response = handler(make_request("/2048", ("accept-encoding", "gzip")))
+
+    # Then I should get back a compressed response
+    assert response.headers.get("content-encoding") == "gzip"
+    assert gzip.decompress(response.body.getvalue()) == b"x" * 2048
+
+    # When I request a small response with gzip support
+    response = handler(make_request("/16", ("accept-encoding", "gzip")))
+
+    # Then I should get back an uncompressed response
+    assert response.headers.get("content-encoding") is None
+    assert response.headers.get("vary") == "accept-encoding"
+    assert response.body.getvalue() == b"x" * 16
+
+
+def test_streaming_responses_are_compressed_incrementally():
+    # Given that I have a handler that streams its response
+    def handler(request):
+        headers = Headers()
+        headers.add("content-type", "text/plain")
+        return StreamingResponse(headers=headers, chunks=iter([b"a" * 100, b"b" * 100]))
+
+    handler = compressed(handler)
+
+    # When I request it with gzip support
+    response = handler(make_request("/", ("accept-encoding", "gzip")))
+
+    # Then every chunk should be compressed individually
+    chunks = list(response.chunks)
+    assert len(chunks) == 3
+    assert response.headers.get("content-encoding") == "gzip"
+    assert gzip.decompress(b"".join(chunks)) == b"a" * 100 + b"b" * 100
+
+
+def test_compressed_chunks_can_be_decoded_as_they_arrive():
+    # Given that I have a stream of compressed chunks
+    chunks = compress_chunks(iter([b"hello ", b"world"]), "gzip", 6)
+
+    # When I decompress the first chunk
+    decompressor = zlib.decompressobj(31)
+
+    # Then I should get back its contents without waiting for the rest
+    assert decompressor.decompress(next(chunks)) == b"hello "
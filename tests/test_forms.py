@@ -0,0 +1,95 @@
+from io import BytesIO
+
+import pytest
+
+from scratch.forms import (MalformedForm, MultipartParser, Params,
+                           parse_cookies, parse_multipart, parse_options,
+                           parse_query)
+
+
+def make_multipart(*parts, boundary="xyz") -> bytes:
+    lines = []
+    for head, body in parts:
+        lines.append(f"--{boundary}\r\n{head}\r\n\r\n".encode() + body + b"\r\n")
+    lines.append(f"--{boundary}--\r\n".encode())
+    return b"".join(lines)
+
+
+def test_params_can_hold_repeated_names():
+    # Given that I have some params with a repeated name
+    params = Params([("a", "1"), ("b", "2"), ("a", "3")])
+
+    # When I get their values
+    # Then get should return the first value and get_all every value
+    assert params.get("a") == "1"
+    assert params.get_all("a") == ["1", "3"]
+    assert params.get("c", "fallback") == "fallback"
+    assert list(params) == [("a", "1"), ("a", "3"), ("b", "2")]
+
+
+@pytest.mark.parametrize("query_string,expected", [
+    ("", []),
+    ("limit=10", [("limit", "10")]),
+    ("q=hello%20world&tag=a&tag=b&empty=", [("q", "hello world"), ("tag", "a"), ("tag", "b"), ("empty", "")]),
+])
+def test_query_strings_can_be_parsed(query_string, expected):
+    assert list(parse_query(query_string)) == expected
+
+
+@pytest.mark.parametrize("header,expected", [
+    (None, {}),
+    ("a=1", {"a": "1"}),
+    ('a=1; b="two"; malformed; a=3', {"a": "1", "b": "two"}),
+])
+def test_cookies_can_be_parsed(header, expected):
+    assert parse_cookies(header) == expected
+
+
+def test_header_options_can_be_parsed():
+    assert parse_options('form-data; name="a \\"b\\""; filename=c.txt') == \
+        ("form-data", {"name": 'a "b"', "filename": "c.txt"})
+
+
+def test_multipart_bodies_can_be_parsed():
+    # Given that I have a multipart body with a field and a file
+    body = make_multipart(
+        ('Content-Disposition: form-data; name="name"', "Jöhn".encode()),
+        ('Content-Disposition: form-data; name="avatar"; filename="a.png"\r\nContent-Type: image/png',
+         b"\x89PNG\r\n--xy\r\n"),
+    )
+
+    # When I parse it a few bytes at a time
+    fields, files = MultipartParser(BytesIO(body).read, "xyz", chunk_size=3).parse()
+
+    # Then I should get back its fields and files
+    assert list(fields) == [("name", "Jöhn")]
+    avatar = files.get("avatar")
+    assert avatar is not None
+    assert avatar.filename == "a.png"
+    assert avatar.content_type == "image/png"
+    assert avatar.file.read() == b"\x89PNG\r\n--xy\r\n"
+
+
+def test_large_multipart_files_are_spooled_to_disk():
+    # Given that I have a multipart body with a large file
+    data = b"x" * 200_000
+    body = make_multipart(('Content-Disposition: form-data; name="f"; filename="f.bin"', data))
+
+    # When I parse it with a small spool size
+    _, files = parse_multipart(BytesIO(body).read, "xyz", max_spool_size=1024)
+
+    # Then the file should have been written to disk
+    uploaded = files.get("f")
+    assert uploaded is not None
+    assert uploaded.file._rolled  # type: ignore
+    assert uploaded.file.read() == data
+
+
+@pytest.mark.parametrize("body", [
+    b"",
+    b'--xyz\r\nContent-Disposition: form-data; name="a"\r\n\r\nunterminated',
+    b"--xyz\r\nContent-Disposition: form-data\r\n\r\nnameless\r\n--xyz--",
+])
+def test_malformed_multipart_bodies_are_rejected(body):
+    with pytest.raises(MalformedForm):
+        parse_multipart(BytesIO(body).read, "xyz")
@@ -107,3 +107,55 @@ def test_headers_is_iterable():
         ("x-some-header", "1"),
         ("x-some-header", "2"),
     ])
+
+
+def test_getting_missing_headers_does_not_add_them():
+    # Given that I have an empty Headers object
+    headers = Headers()
+
+    # When I look up some missing headers
+    assert headers.get_all("x-a-header") == []
+    assert headers.get("X-Another-Header") is None
+    assert "x-a-header" not in headers
+
+    # Then they should not have been added
+    assert list(headers) == []
+
+
+def test_raw_headers_are_decoded_on_access():
+    # Given that I have a Headers object
+    headers = Headers()
+
+    # And I've added some raw headers to it
+    headers.add_raw(b"Content-Type", b"text/plain")
+    headers.add_raw(b"X-Some-Header", b"caf\xe9")
+
+    # When I get their values
+    # Then they should be decoded as latin-1
+    assert headers.get("content-type") == "text/plain"
+    assert headers.get_all("x-some-header") == ["café"]
+    assert "Content-Type" in headers
+
+
+def test_headers_can_be_encoded():
+    # Given that I have a Headers object with a mix of raw and string values
+    headers = Headers()
+    headers.add("Content-Type", "text/plain")
+    headers.add_raw(b"x-some-header", b"1")
+    headers.add("x-some-header", "2")
+
+    # When I encode it
+    # Then I should get back the header lines as they are sent on the wire
+    assert headers.encode() == b"content-type: text/plain\r\nx-some-header: 1\r\nx-some-header: 2\r\n"
+
+
+def test_headers_can_be_removed():
+    # Given that I have a Headers object
+    headers = Headers()
+    headers.add("x-some-header", "1")
+
+    # When I remove a header using a differently-cased name
+    headers.remove("X-Some-Header")
+
+    # Then it should be gone
+    assert headers.get("x-some-header") is None
@@ -0,0 +1,123 @@
+import socket
+import threading
+from queue import Queue
+
+from scratch.application import Application
+from scratch.metrics import Metrics
+from scratch.response import Response
+from scratch.server import HTTPWorker
+
+app = Application()
+
+
+@app.route("/users/{user_id:int}")
+def get_user(request, user_id):
+    return Response(content=f"user {user_id}")
+
+
+def test_metrics_are_rendered_in_prometheus_format():
+    # Given that I have some metrics
+    metrics = Metrics(buckets=[0.1, 1])
+    metrics.add_gauge("http_busy_workers", "Busy workers.", lambda: 3)
+
+    # When I record a couple of requests
+    metrics.observe_request("get_user", "GET", b"200 OK", parse_time=0.05, handler_time=0.5, send_time=2)
+    metrics.observe_request("get_user", "GET", b"200 OK", parse_time=0.05)
+
+    # Then I should be able to render them
+    lines = metrics.render().splitlines()
+    assert 'http_requests_total{route="get_user",method="GET",status="200"} 2' in lines
+    assert 'http_request_duration_seconds_bucket{route="get_user",phase="parse",le="0.1"} 2' in lines
+    assert 'http_request_duration_seconds_bucket{route="get_user",phase="handler",le="0.1"} 0' in lines
+    assert 'http_request_duration_seconds_bucket{route="get_user",phase="handler",le="1"} 1' in lines
+    assert 'http_request_duration_seconds_bucket{route="get_user",phase="send",le="+Inf"} 1' in lines
+    assert 'http_request_duration_seconds_count{route="get_user",phase="parse"} 2' in lines
+    assert "http_busy_workers 3" in lines
+
+
+def test_metrics_recorded_by_different_threads_are_merged():
+    # Given that I have some metrics
+    metrics = Metrics()
+
+    # When I record requests from many threads
+    def record():
+        for _ in range(100):
+            metrics.observe_request("index", "GET", b"200 OK", handler_time=0.001)
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Then they should all be counted
+    requests, latencies, _ = metrics.collect()
+    assert requests == {("index", "GET", "200"): 400}
+    assert latencies["index", "handler"].count == 400
+
+
+def test_metrics_of_exited_threads_are_kept_without_their_shards():
+    # Given that I have some metrics
+    metrics = Metrics()
+
+    # When many short-lived threads record requests and then release
+    # their shards before exiting
+    def record():
+        metrics.observe_request("index", "GET", b"200 OK", handler_time=0.001)
+        metrics.increment("http_connections_expired_total")
+        metrics.release_shard()
+
+    for _ in range(10):
+        thread = threading.Thread(target=record)
+        thread.start()
+        thread.join()
+
+    # Then their metrics should still be counted
+    requests, latencies, counters = metrics.collect()
+    assert requests == {("index", "GET", "200"): 10}
+    assert latencies["index", "handler"].count == 10
+    assert counters == {"http_connections_expired_total": 10}
+
+    # And their shards should be gone
+    assert metrics._shards == []
+
+
+def test_label_values_are_escaped():
+    # Given that I have some metrics
+    metrics = Metrics()
+
+    # When I record a request for a route with quotes in its name
+    metrics.observe_request('say "hi"', "GET", b"200 OK")
+
+    # Then its name should be escaped
+    assert 'route="say \\"hi\\""' in metrics.render()
+
+
+def test_workers_record_metrics_per_route():
+    # Given that I have a worker that records metrics
+    metrics = Metrics()
+    worker = HTTPWorker(Queue(), [("", app)], metrics=metrics)
+
+    # When it serves a request
+    server_sock, client_sock = socket.socketpair()
+    with client_sock:
+        client_sock.sendall(b"GET /users/42 HTTP/1.1\r\nconnection: close\r\n\r\n")
+        worker.handle_client(server_sock, ("127.0.0.1", 0))
+        assert client_sock.recv(4096).startswith(b"HTTP/1.1 200 OK")
+
+    # Then the request should be recorded under its route's name
+    requests, latencies, _ = metrics.collect()
+    assert requests == {("get_user", "GET", "200"): 1}
+    assert set(latencies) == {("get_user", "parse"), ("get_user", "handler"), ("get_user", "send")}
+
+
+def test_metrics_can_be_served():
+    # Given that I have some metrics
+    metrics = Metrics()
+
+    # When I request them
+    response = metrics.handler(None)
+
+    # Then I should get back a text response
+    assert response.headers.get("content-type").startswith("text/plain; version=0.0.4")
+    assert b"# TYPE http_requests_total counter" in response.body.read()
@@ -0,0 +1,50 @@
+import pytest
+
+from scratch.mounts import MountTable
+
+
+@pytest.mark.parametrize("path,expected", [
+    ["/", ("", "root")],
+    ["/users", ("", "root")],
+    ["/api", ("/api", "api")],
+    ["/api/", ("/api", "api")],
+    ["/api/users", ("/api", "api")],
+    ["/api/v2", ("/api/v2", "api v2")],
+    ["/api/v2/users/1", ("/api/v2", "api v2")],
+    ["/api/v3/users", ("/api", "api")],
+    ["/apis", ("", "root")],
+    ["/static/app.js", ("/static", "static")],
+    ["*", ("", "root")],
+])
+def test_mount_tables_match_the_longest_prefix(path, expected):
+    # Given that I have a mount table with nested prefixes
+    mounts = MountTable([
+        ("", "root"),
+        ("/api/v2", "api v2"),
+        ("/api", "api"),
+        ("/static/", "static"),
+    ])
+
+    # When I match a path against it
+    # Then I should get back the handler mounted at its longest prefix
+    assert mounts.match(path) == expected
+
+
+def test_mount_tables_without_a_root_may_not_match():
+    # Given that I have a mount table without a root handler
+    mounts = MountTable([("/api", "api")])
+
+    # When I match a path outside of its prefixes
+    # Then I should get back None
+    assert mounts.match("/") is None
+    assert mounts.match("/users") is None
+
+
+def test_mounting_the_same_prefix_twice_fails():
+    # Given that I have a mount table
+    mounts = MountTable([("/api", "api")])
+
+    # When I mount another handler at the same prefix
+    # Then a ValueError should be raised
+    with pytest.raises(ValueError):
+        mounts.add("/api/", "other")
@@ -1,9 +1,13 @@
+import socket
 from io import BytesIO
 from textwrap import dedent
 
 import pytest
 
-from scratch.request import Request
+from scratch.headers import Headers
+from scratch.request import (BodyReader, BodyTooLarge, HeadTooLarge,
+                             IncompleteBody, Request, RequestTimeout,
+                             get_content_length, parse_chunk_size, parse_head)
 
 
 class StubSocket:
@@ -13,6 +17,21 @@ class StubSocket:
     def recv(self, n: int) -> bytes:
         return self._buff.read(n)
 
+    def recv_into(self, buff) -> int:
+        return self._buff.readinto(buff)
+
+
+class TrickleSocket(StubSocket):
+    """A socket that returns at most n bytes per read.
+    """
+
+    def __init__(self, data: str, n: int):
+        super().__init__(data)
+        self._n = n
+
+    def recv_into(self, buff) -> int:
+        return super().recv_into(buff[:self._n])
+
 
 def make_request(s: str) -> str:
     return dedent(s).replace("\n", "\r\n")
@@ -81,3 +100,563 @@ def test_invalid_requests(data, error):
         Request.from_socket(StubSocket(data))
 
     assert e.value.args == error.args
+
+
+def test_request_bodies_are_bounded_by_their_content_length():
+    # Given that I have a socket containing two pipelined requests
+    sock = StubSocket(make_request("""\
+    POST /users HTTP/1.1
+    Content-length: 2
+
+    {}GET / HTTP/1.1
+
+    """))
+
+    # When I parse the first request
+    request = Request.from_socket(sock)
+
+    # Then reading its body should not read past the end of it
+    assert not request.body.pipelined
+    assert request.body.read(16384) == b"{}"
+    assert request.body.read(16384) == b""
+
+    # And it should know that the next request has already been read
+    assert request.body.pipelined
+
+    # And draining it should give me back the start of the next request
+    buff = request.body.drain()
+    request = Request.from_socket(sock, buff=buff)
+    assert request.method == "GET"
+    assert request.path == "/"
+
+
+def test_draining_a_request_discards_its_unread_body():
+    # Given that I have a request whose body hasn't been read
+    sock = StubSocket(make_request("""\
+    POST /users HTTP/1.1
+    Content-length: 2
+
+    {}"""))
+    request = Request.from_socket(sock)
+
+    # When I drain it
+    # Then I should get back nothing since no other requests follow it
+    assert request.body.drain() == b""
+
+
+@pytest.mark.parametrize("data", [
+    "POST /users HTTP/1.1\r\nContent-Length: 11\r\n\r\nhello world",
+    "POST /users HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n6\r\nhello \r\n5\r\nworld\r\n0\r\n\r\n",
+])
+def test_draining_large_unread_bodies_fails(data):
+    # Given that I have a request whose body hasn't been read
+    request = Request.from_socket(StubSocket(data))
+
+    # When I drain it with a limit smaller than its body
+    # Then I should get back an error
+    with pytest.raises(ValueError):
+        request.body.drain(max_size=5)
+
+
+@pytest.mark.parametrize("data,keep_alive", [
+    [make_request("""\
+    GET / HTTP/1.1
+
+    """), True],
+
+    [make_request("""\
+    GET / HTTP/1.1
+    Connection: close
+
+    """), False],
+
+    [make_request("""\
+    GET / HTTP/1.0
+
+    """), False],
+
+    [make_request("""\
+    GET / HTTP/1.0
+    Connection: keep-alive
+
+    """), True],
+
+    [make_request("""\
+    POST / HTTP/1.1
+    Transfer-Encoding: chunked
+    Content-Length: 5
+
+    0
+
+    """), False],
+])
+def test_requests_know_whether_the_connection_should_be_kept_alive(data, keep_alive):
+    request = Request.from_socket(StubSocket(data))
+    assert request.keep_alive == keep_alive
+
+
+def test_request_heads_can_be_parsed():
+    # Given that I have a request head
+    head = b"get /users HTTP/1.1\r\nAccept: application/json\r\nX-Some-Header: 1"
+
+    # When I parse it
+    method, path, version, headers = parse_head(head)
+
+    # Then I should get back its individual components
+    assert (method, path, version) == ("GET", "/users", "HTTP/1.1")
+    assert sorted(headers) == [("accept", "application/json"), ("x-some-header", "1")]
+
+
+def test_head_buffers_can_be_reused_between_requests():
+    # Given that I have a socket containing two pipelined requests
+    # with heads larger than a small buffer
+    padding = "x" * 64
+    sock = StubSocket(make_request(f"""\
+    GET /a HTTP/1.1
+    X-Padding: {padding}
+
+    GET /b HTTP/1.1
+
+    """))
+    buffer = bytearray(16)
+
+    # When I read both of them using the same head buffer
+    first = Request.from_socket(sock, head_buffer=buffer)
+    second = Request.from_socket(sock, buff=first.body.drain(), head_buffer=buffer)
+
+    # Then both should be parsed correctly
+    assert first.path == "/a"
+    assert first.headers.get("x-padding") == padding
+    assert second.path == "/b"
+
+    # And the buffer should have grown to fit the larger head
+    assert len(buffer) > 16
+
+
+def test_mount_prefixes_can_be_stripped_in_place():
+    # Given that I have a request
+    request = Request.from_socket(StubSocket(make_request("""\
+    GET /api/users?limit=10 HTTP/1.1
+
+    """)))
+
+    # When I strip its mount prefix
+    request.strip_prefix("/api")
+
+    # Then its path should no longer contain the prefix
+    assert request.path == "/users"
+    assert request.query_string == "limit=10"
+
+
+@pytest.mark.parametrize("head,error", [
+    [b"", ValueError("Request line missing.")],
+    [b"GET", ValueError("Malformed request line 'GET'.")],
+    [b"GET / HTTP/1.0\r\nContent-type", ValueError("Malformed header line b'Content-type'.")],
+    [b"GET / HTTP/1.0\r\nContent-Length : 1", ValueError("Malformed header line b'Content-Length : 1'.")],
+    [b"GET / HTTP/1.0\r\n: 1", ValueError("Malformed header line b': 1'.")],
+    [b"GET / HTTP/1.0\r\nX-A: 1\r\n  folded", ValueError("Malformed header line b'  folded'.")],
+    [b"GET / HTTP/1.0\r\n\tX-A: 1", ValueError("Malformed header line b'\\tX-A: 1'.")],
+])
+def test_invalid_request_heads(head, error):
+    with pytest.raises(type(error)) as e:
+        parse_head(head)
+
+    assert e.value.args == error.args
+
+
+@pytest.mark.parametrize("n", [1, 3, 7])
+def test_requests_can_be_read_in_small_pieces(n):
+    # Given that I have a socket that returns data a few bytes at a time
+    sock = TrickleSocket(make_request("""\
+    POST /users HTTP/1.1
+    Content-length: 2
+
+    {}"""), n)
+
+    # When I read a request from it
+    request = Request.from_socket(sock)
+
+    # Then it should be parsed correctly
+    assert request.path == "/users"
+    assert request.headers.get("content-length") == "2"
+    assert request.body.read(16384) == b"{}"
+
+
+def test_requests_with_large_heads_are_rejected():
+    # Given that I have a request whose head is too large
+    sock = StubSocket(make_request(f"""\
+    GET / HTTP/1.1
+    X-Some-Header: {"a" * 1024}
+
+    """))
+
+    # When I read it
+    # Then I should get back an error
+    with pytest.raises(HeadTooLarge):
+        Request.from_socket(sock, max_head_size=512)
+
+
+def test_requests_with_many_headers_are_rejected():
+    # Given that I have a request with many headers
+    headers = "".join(f"X-Header-{i}: {i}\n" for i in range(10))
+    sock = StubSocket(make_request("GET / HTTP/1.1\n" + headers + "\n"))
+
+    # When I read it
+    # Then I should get back an error
+    with pytest.raises(HeadTooLarge):
+        Request.from_socket(sock, max_header_count=5)
+
+
+def test_request_bodies_can_be_read_into_buffers():
+    # Given that I have a request with a body
+    sock = StubSocket(make_request("""\
+    POST /users HTTP/1.1
+    Content-length: 11
+
+    hello world"""))
+    request = Request.from_socket(sock)
+
+    # When I read its body into a buffer
+    buff = bytearray(5)
+    n = request.body.readinto(buff)
+
+    # Then the buffer should contain the start of the body
+    assert buff[:n] == b"hello"[:n]
+
+    # And I should be able to read the rest
+    assert request.body.read() == b"hello world"[n:]
+
+
+def test_request_bodies_can_be_read_line_by_line():
+    # Given that I have a request with a multi-line body
+    sock = StubSocket(make_request("""\
+    POST /users HTTP/1.1
+    Content-length: 7
+
+    a
+    b
+    c"""))
+    request = Request.from_socket(sock)
+
+    # When I read its lines
+    # Then I should get back each line in turn
+    assert list(request.body) == [b"a\r\n", b"b\r\n", b"c"]
+
+
+@pytest.mark.parametrize("n", [1, 3, 1024])
+def test_chunked_request_bodies_are_decoded(n):
+    # Given that I have a socket containing a chunked request followed by another request
+    sock = TrickleSocket(make_request("""\
+    POST /users HTTP/1.1
+    Transfer-Encoding: chunked
+
+    5;some-extension
+    hello
+    6
+     world
+    0
+    Some-Trailer: 1
+
+    GET / HTTP/1.1
+
+    """), n)
+
+    # When I parse the first request
+    request = Request.from_socket(sock)
+
+    # Then I should be able to read its decoded body
+    assert request.body.readline() == b"hello world"
+    assert request.body.read() == b""
+
+    # And draining it should give me back the start of the next request
+    request = Request.from_socket(sock, buff=request.body.drain())
+    assert request.method == "GET"
+
+
+def test_malformed_chunked_request_bodies_are_rejected():
+    # Given that I have a request with an invalid chunk size
+    sock = StubSocket(make_request("""\
+    POST /users HTTP/1.1
+    Transfer-Encoding: chunked
+
+    zz
+    hello
+    0
+
+    """))
+    request = Request.from_socket(sock)
+
+    # When I read its body
+    # Then I should get back an error
+    with pytest.raises(ValueError):
+        request.body.read()
+
+
+@pytest.mark.parametrize("line,size", [
+    [b"5", 5],
+    [b"1aF", 431],
+    [b"5;ext=1", 5],
+    [b"5 ;ext", 5],
+])
+def test_chunk_sizes_can_be_parsed(line, size):
+    assert parse_chunk_size(line) == size
+
+
+@pytest.mark.parametrize("line", [b"", b"0x5", b"5_0", b"+5", b"-5", b" 5", b"5 ", b"zz"])
+def test_chunk_sizes_must_be_plain_hex_numbers(line):
+    with pytest.raises(ValueError):
+        parse_chunk_size(line)
+
+
+@pytest.mark.parametrize("transfer_encoding", [
+    "gzip",
+    "gzip, chunked",
+    "chunked, chunked",
+    "chunked\r\nTransfer-Encoding: gzip",
+])
+def test_requests_with_unsupported_transfer_encodings_are_rejected(transfer_encoding):
+    # Given that I have a request with a transfer-encoding that isn't
+    # just chunked
+    sock = StubSocket(f"POST /users HTTP/1.1\r\nTransfer-Encoding: {transfer_encoding}\r\n\r\n")
+
+    # When I parse it
+    # Then I should get back an error
+    with pytest.raises(ValueError):
+        Request.from_socket(sock)
+
+
+@pytest.mark.parametrize("content_lengths", [
+    ["abc"],
+    [""],
+    ["-1"],
+    ["+5"],
+    ["1_0"],
+    [" 0x5"],
+    ["\u00b2"],
+    ["5", "6"],
+    ["5, 6"],
+])
+def test_invalid_content_lengths_are_rejected(content_lengths):
+    # Given that I have request headers with invalid content-lengths
+    headers = Headers()
+    for content_length in content_lengths:
+        headers.add("content-length", content_length)
+
+    # When I get the length of the body
+    # Then I should get back an error
+    with pytest.raises(ValueError):
+        get_content_length(headers)
+
+
+def test_requests_with_repeated_content_lengths_are_accepted_if_they_agree():
+    # Given that I have a request whose content-length is repeated
+    sock = StubSocket(make_request("""\
+    POST /users HTTP/1.1
+    Content-Length: 2
+    Content-Length: 2, 2
+
+    {}"""))
+
+    # When I parse it
+    request = Request.from_socket(sock)
+
+    # Then its body should have that length
+    assert request.body.read() == b"{}"
+
+
+def test_requests_with_large_bodies_are_rejected():
+    # Given that I have a request whose content-length is too large
+    sock = StubSocket(make_request("""\
+    POST /users HTTP/1.1
+    Content-length: 1024
+
+    """))
+
+    # When I parse it
+    # Then I should get back an error
+    with pytest.raises(BodyTooLarge):
+        Request.from_socket(sock, max_body_size=512)
+
+
+def test_chunked_requests_with_large_bodies_are_rejected():
+    # Given that I have a chunked request whose body is too large
+    sock = StubSocket(make_request("""\
+    POST /users HTTP/1.1
+    Transfer-Encoding: chunked
+
+    a
+    0123456789
+    0
+
+    """))
+    request = Request.from_socket(sock, max_body_size=5)
+
+    # When I read its body
+    # Then I should get back an error
+    with pytest.raises(BodyTooLarge):
+        request.body.read()
+
+    # And the body should be marked as failed
+    assert request.body.failed
+
+
+@pytest.mark.parametrize("data", [
+    "POST /users HTTP/1.1\r\nContent-Length: 10\r\n\r\nabc",
+    "POST /users HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n10\r\nabc",
+    "POST /users HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n3\r\nabc",
+])
+@pytest.mark.parametrize("read", [
+    lambda body: body.read(),
+    lambda body: body.readline(),
+])
+def test_reading_truncated_request_bodies_fails(data, read):
+    # Given that I have a request whose client went away part way
+    # through sending its body
+    request = Request.from_socket(StubSocket(data))
+
+    # When I read its body
+    # Then I should get back an error
+    with pytest.raises(IncompleteBody):
+        read(request.body)
+
+    # And the body should be marked as failed
+    assert request.body.failed
+
+
+def test_unbounded_bodies_end_when_the_client_closes_the_connection():
+    # Given that I have a body reader without a content-length
+    body = BodyReader(StubSocket("abc"))
+
+    # When I read it
+    # Then I should get back everything up to the end of the stream
+    assert body.read() == b"abc"
+    assert not body.failed
+
+
+def test_query_strings_are_split_from_paths():
+    # Given that I have a request whose target contains a query string
+    sock = StubSocket(make_request("""\
+    GET /users?limit=10&tag=a&tag=b HTTP/1.1
+
+    """))
+
+    # When I parse it
+    request = Request.from_socket(sock)
+
+    # Then its path should not contain the query string
+    assert request.path == "/users"
+    assert request.query_string == "limit=10&tag=a&tag=b"
+
+    # And its query params should be parsed on access
+    assert request.query.get("limit") == "10"
+    assert request.query.get_all("tag") == ["a", "b"]
+    assert request.query is request.query
+
+
+def test_request_cookies_are_parsed_on_access():
+    # Given that I have a request with a cookie header
+    sock = StubSocket(make_request("""\
+    GET / HTTP/1.1
+    Cookie: session=abc; theme="dark"
+
+    """))
+
+    # When I parse it
+    request = Request.from_socket(sock)
+
+    # Then I should be able to get its cookies
+    assert request.cookies == {"session": "abc", "theme": "dark"}
+
+
+def test_urlencoded_forms_are_parsed_on_access():
+    # Given that I have a request with an urlencoded body
+    sock = StubSocket(make_request("""\
+    POST /users HTTP/1.1
+    Content-Type: application/x-www-form-urlencoded
+    Content-Length: 25
+
+    name=J%C3%B6hn&admin=true"""))
+
+    # When I parse it
+    request = Request.from_socket(sock)
+
+    # Then I should be able to get its fields
+    assert request.form.get("name") == "Jöhn"
+    assert request.form.get("admin") == "true"
+    assert list(request.files) == []
+
+
+def test_multipart_forms_are_parsed_on_access():
+    # Given that I have a request with a multipart body
+    body = (
+        "--xyz\r\n"
+        'Content-Disposition: form-data; name="name"\r\n\r\n'
+        "John\r\n"
+        "--xyz\r\n"
+        'Content-Disposition: form-data; name="bio"; filename="bio.txt"\r\n\r\n'
+        "Hello!\r\n"
+        "--xyz--\r\n"
+    )
+    sock = StubSocket(make_request(f"""\
+    POST /users HTTP/1.1
+    Content-Type: multipart/form-data; boundary=xyz
+    Content-Length: {len(body)}
+
+    """) + body)
+
+    # When I parse it
+    request = Request.from_socket(sock)
+
+    # Then I should be able to get its fields and files
+    assert request.form.get("name") == "John"
+    bio = request.files.get("bio")
+    assert bio is not None
+    assert bio.file.read() == b"Hello!"
+
+
+def test_forms_are_empty_for_other_content_types():
+    # Given that I have a request with a JSON body
+    sock = StubSocket(make_request("""\
+    POST /users HTTP/1.1
+    Content-Type: application/json
+    Content-Length: 2
+
+    {}"""))
+
+    # When I access its form
+    request = Request.from_socket(sock)
+
+    # Then it should be empty and the body should be left unread
+    assert list(request.form) == []
+    assert request.body.read() == b"{}"
+
+
+def test_requests_whose_heads_arrive_too_slowly_time_out():
+    # Given that I have a client that only sends part of a request head
+    server_sock, client_sock = socket.socketpair()
+    with server_sock, client_sock:
+        client_sock.sendall(b"GET / HTTP/1.1\r\nhost: ")
+
+        # When I read a request off of the socket with a header timeout
+        # Then a RequestTimeout error should be raised
+        with pytest.raises(RequestTimeout):
+            Request.from_socket(server_sock, header_timeout=0.1)
+
+
+def test_request_bodies_that_arrive_too_slowly_time_out():
+    # Given that I have a client that only sends part of a request body
+    server_sock, client_sock = socket.socketpair()
+    with server_sock, client_sock:
+        client_sock.sendall(b"POST / HTTP/1.1\r\ncontent-length: 10\r\n\r\nhello")
+
+        # When I read its body with a body timeout
+        request = Request.from_socket(server_sock, body_timeout=0.1, min_body_rate=1024)
+
+        # Then a RequestTimeout error should be raised once the
+        # available data has been read
+        assert not request.body.timed_out
+        with pytest.raises(RequestTimeout):
+            request.body.read()
+
+        # And the body should know that it timed out
+        assert request.body.timed_out
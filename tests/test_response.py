@@ -1,3 +1,4 @@
+import socket
 import typing
 from io import BytesIO
 from textwrap import dedent
@@ -5,21 +6,26 @@ from textwrap import dedent
 import pytest
 
 from scratch.headers import Headers
-from scratch.response import Response
+from scratch.response import (BufferedSocket, JSONResponse, Response,
+                              StreamingJSONResponse, StreamingResponse,
+                              encode_json_stdlib, iter_json_array)
+from tests.helpers import StubSocket
 
 
-class StubSocket:
-    def __init__(self) -> None:
-        self._buff = BytesIO()
+class PartialStubSocket(StubSocket):
+    """A socket that writes at most n bytes per sendmsg call.
+    """
 
-    def sendall(self, data: bytes) -> None:
-        self._buff.write(data)
-
-    def sendfile(self, f: typing.IO[bytes]) -> None:
-        self._buff.write(f.read())
+    def __init__(self, n: int) -> None:
+        super().__init__()
+        self._n = n
+        self.calls = 0
 
-    def getvalue(self) -> bytes:
-        return self._buff.getvalue()
+    def sendmsg(self, buffers: typing.List[bytes]) -> int:
+        self.calls += 1
+        data = b"".join(bytes(buff) for buff in buffers)[:self._n]
+        self._buff.write(data)
+        return len(data)
 
 
 def make_output(s: str) -> str:
@@ -38,6 +44,7 @@ def make_headers(*headers) -> Headers:
         Response("200 OK"),
         make_output("""\
         HTTP/1.1 200 OK
+        content-length: 0
 
         """)
     ],
@@ -86,3 +93,252 @@ def test_response(response, output):
     socket = StubSocket()
     response.send(socket)
     assert socket.getvalue() == output
+
+
+def test_streaming_responses_are_chunked():
+    # Given that I have a streaming response
+    response = StreamingResponse("200 OK", chunks=iter([b"Hello", b"", b", world!"]))
+
+    # When I send it
+    socket = StubSocket()
+    response.send(socket)
+
+    # Then each non-empty chunk should be sent using the chunked encoding
+    assert socket.getvalue() == make_output("""\
+    HTTP/1.1 200 OK
+    transfer-encoding: chunked
+
+    5
+    Hello
+    8
+    , world!
+    0
+
+    """)
+
+
+def test_streaming_responses_with_a_content_length_are_not_chunked():
+    # Given that I have a streaming response with a known length
+    response = StreamingResponse(
+        "200 OK",
+        headers=make_headers(("content-length", "13")),
+        chunks=[b"Hello", b", world!"],
+    )
+
+    # When I send it
+    socket = StubSocket()
+    response.send(socket)
+
+    # Then its chunks should be sent as-is
+    assert socket.getvalue() == make_output("""\
+    HTTP/1.1 200 OK
+    content-length: 13
+
+    Hello, world!""")
+
+
+def test_streaming_responses_close_their_generators():
+    # Given that I have a generator that fails halfway through
+    closed = []
+
+    def generate():
+        try:
+            yield b"Hello"
+            raise RuntimeError("failed")
+        finally:
+            closed.append(True)
+
+    # When I send a streaming response using it
+    response = StreamingResponse("200 OK", chunks=generate())
+    with pytest.raises(RuntimeError):
+        response.send(StubSocket())
+
+    # Then the generator should have been closed
+    assert closed == [True]
+
+
+def test_in_memory_responses_are_sent_using_a_single_sendmsg_call():
+    # Given that I have a response with an in-memory body
+    response = Response("200 OK", content="Hello")
+
+    # When I send it
+    socket = PartialStubSocket(1024)
+    response.send(socket)
+
+    # Then its head and body should be written using a single call
+    assert socket.calls == 1
+    assert socket.getvalue() == make_output("""\
+    HTTP/1.1 200 OK
+    content-length: 5
+
+    Hello""")
+
+
+def test_responses_handle_partial_writes():
+    # Given that I have a response with an in-memory body
+    response = Response("200 OK", content="Hello")
+
+    # When I send it to a socket that can only write a few bytes at a time
+    socket = PartialStubSocket(3)
+    response.send(socket)
+
+    # Then every byte should still be written
+    assert socket.getvalue() == make_output("""\
+    HTTP/1.1 200 OK
+    content-length: 5
+
+    Hello""")
+
+
+def test_responses_with_uncommon_statuses_can_be_sent():
+    # Given that I have a response with a custom status and header
+    response = Response("299 Whatever", headers=make_headers(("x-custom", "1")))
+
+    # When I send it
+    socket = StubSocket()
+    response.send(socket)
+
+    # Then it should be encoded correctly
+    assert socket.getvalue() == make_output("""\
+    HTTP/1.1 299 Whatever
+    x-custom: 1
+    content-length: 0
+
+    """)
+
+
+def test_json_responses_can_be_sent():
+    # Given that I have a JSON response
+    response = JSONResponse({"message": "héllo"})
+
+    # When I send it
+    socket = StubSocket()
+    response.send(socket)
+
+    # Then its body should be compact UTF-8 encoded JSON
+    assert socket.getvalue() == make_output("""\
+    HTTP/1.1 200 OK
+    content-type: application/json
+    content-length: 20
+
+    """) + '{"message":"héllo"}'.encode()
+
+
+def test_json_responses_can_use_custom_encoders():
+    # Given that I have a JSON response with a custom encoder
+    response = JSONResponse([1, 2], "201 Created", encoder=lambda value: b"custom")
+
+    # When I send it
+    socket = StubSocket()
+    response.send(socket)
+
+    # Then its body should be produced by that encoder
+    assert socket.getvalue().endswith(b"\r\n\r\ncustom")
+    assert socket.getvalue().startswith(b"HTTP/1.1 201 Created\r\n")
+
+
+def test_json_responses_share_their_encoded_bodies():
+    # Given that I have an encoded value
+    content = encode_json_stdlib(list(range(100)))
+
+    # When I build a JSON response for it
+    response = JSONResponse(None, encoder=lambda value: content)
+
+    # Then its body should not be a copy of the encoded bytes
+    assert response.body.getvalue() is content
+
+
+@pytest.mark.parametrize("items,expected", [
+    ([], b"[]"),
+    ([1], b"[1]"),
+    ([1, 2, 3], b"[1,2,3]"),
+    (range(5), b"[0,1,2,3,4]"),
+])
+def test_json_arrays_can_be_encoded_in_batches(items, expected):
+    # Given that I have some items
+    # When I encode them in batches of two
+    chunks = list(iter_json_array(items, encode_json_stdlib, 2))
+
+    # Then every batch but the last should hold two items
+    assert len(chunks) == (len(items) + 1) // 2 + 1
+
+    # And joining the chunks should produce a valid JSON array
+    assert b"".join(chunks) == expected
+
+
+def test_streaming_json_responses_can_be_sent():
+    # Given that I have a streaming JSON response
+    response = StreamingJSONResponse(({"id": i} for i in range(3)), batch_size=2)
+
+    # When I send it
+    socket = StubSocket()
+    response.send(socket)
+
+    # Then it should be sent as a chunked JSON array
+    assert socket.getvalue() == make_output("""\
+    HTTP/1.1 200 OK
+    content-type: application/json
+    transfer-encoding: chunked
+
+    12
+    [{"id":0},{"id":1}
+    9
+    ,{"id":2}
+    1
+    ]
+    0
+
+    """)
+
+
+def test_buffered_sockets_batch_writes_until_flushed():
+    # Given that I have a buffered socket
+    socket = PartialStubSocket(1024)
+    writer = BufferedSocket(socket)
+
+    # When I send a couple of responses to it
+    Response(content="Hello").send(writer)
+    Response(content="world").send(writer)
+
+    # Then nothing should be written until I flush it
+    assert socket.calls == 0
+    writer.flush()
+
+    # And then both responses should be written using a single call
+    assert socket.calls == 1
+    assert socket.getvalue() == make_output("""\
+    HTTP/1.1 200 OK
+    content-length: 5
+
+    HelloHTTP/1.1 200 OK
+    content-length: 5
+
+    world""")
+
+
+def test_buffered_sockets_flush_when_full():
+    # Given that I have a small buffered socket
+    socket = PartialStubSocket(1024)
+    writer = BufferedSocket(socket, max_size=8)
+
+    # When I write more data to it than it can hold
+    writer.sendall(b"12345")
+    writer.sendall(b"67890")
+
+    # Then it should be flushed automatically
+    assert socket.getvalue() == b"1234567890"
+    assert writer.size == 0
+
+
+def test_buffered_sockets_time_out_when_clients_read_too_slowly():
+    # Given that I have a buffered socket with a write timeout
+    # connected to a client that never reads
+    server_sock, client_sock = socket.socketpair()
+    with server_sock, client_sock:
+        writer = BufferedSocket(server_sock, timeout=0.1)
+
+        # When I write more data to it than the socket can hold
+        # Then a socket.timeout error should be raised
+        with pytest.raises(socket.timeout):
+            writer.sendall(bytes(8 * 1024 * 1024))
+            writer.flush()
@@ -52,3 +52,107 @@ def test_router_fails_to_add_routes_with_duplicate_names():
     with pytest.raises(ValueError):
         router.add_route("get_example", "GET", "/users/{name}", get_example)
         router.add_route("get_example", "GET", "/users/{name}", get_example)
+
+
+def test_router_can_convert_dynamic_segments():
+    # Given that I have a Router object
+    router = Router()
+
+    # And a route handler
+    def get_example(user_id):
+        return user_id
+
+    # When I add a route with an int segment
+    router.add_route("get_example", "GET", "/users/{user_id:int}", get_example)
+
+    # Then its segment should be converted when I look it up
+    assert router.lookup("GET", "/users/42")() == 42
+
+    # And paths whose segments can't be converted should not match
+    assert router.lookup("GET", "/users/Jim") is None
+
+
+def test_router_can_add_routes_with_path_segments():
+    # Given that I have a Router object
+    router = Router()
+
+    # And a route handler
+    def get_file(filename):
+        return filename
+
+    # When I add a route with a path segment
+    router.add_route("get_file", "GET", "/files/{filename:path}", get_file)
+
+    # Then it should capture the remainder of the path
+    assert router.lookup("GET", "/files/css/site.css")() == "css/site.css"
+    assert router.lookup("GET", "/files/") is None
+
+
+def test_router_prefers_static_segments_over_dynamic_ones():
+    # Given that I have a Router object
+    router = Router()
+
+    # And a static and a dynamic route that overlap
+    def get_me():
+        return "me"
+
+    def get_user(name):
+        return name
+
+    router.add_route("get_user", "GET", "/users/{name}", get_user)
+    router.add_route("get_me", "GET", "/users/me", get_me)
+
+    # When I look up the overlapping path
+    # Then the static route should win
+    assert router.lookup("GET", "/users/me").func is get_me
+    assert router.lookup("GET", "/users/Jim")() == "Jim"
+
+
+def test_router_backtracks_when_static_segments_dont_match():
+    # Given that I have a Router object
+    router = Router()
+
+    # And routes that share a static prefix with a dynamic one
+    def get_settings():
+        return "settings"
+
+    def get_user_posts(name):
+        return name
+
+    router.add_route("get_settings", "GET", "/users/me/settings", get_settings)
+    router.add_route("get_user_posts", "GET", "/users/{name}/posts", get_user_posts)
+
+    # When I look up a path that only matches through the dynamic segment
+    # Then I should get back the dynamic route
+    assert router.lookup("GET", "/users/me/posts")() == "me"
+
+
+def test_router_knows_which_methods_a_path_allows():
+    # Given that I have a Router object
+    router = Router()
+
+    # And a path with multiple routes on it
+    router.add_route("get_user", "GET", "/users/{name}", lambda name: name)
+    router.add_route("delete_user", "DELETE", "/users/{name}", lambda name: name)
+
+    # When I look up a method that isn't routed
+    # Then I should get back nothing
+    assert router.lookup("POST", "/users/Jim") is None
+
+    # And I should be able to get the methods that are routed
+    assert router.allowed_methods("/users/Jim") == {"GET", "DELETE"}
+    assert router.allowed_methods("/missing") == set()
+
+
+@pytest.mark.parametrize("path", [
+    "/users/{id:float}",
+    "/files/{filename:path}/edit",
+])
+def test_router_fails_to_add_invalid_routes(path):
+    # Given that I have a Router object
+    router = Router()
+
+    # When I add an invalid route
+    # Then I should get back a value error
+    with pytest.raises(ValueError):
+        router.add_route("invalid", "GET", path, lambda: None)
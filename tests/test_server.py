@@ -0,0 +1,807 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import types
+from importlib.machinery import ModuleSpec
+from io import BytesIO
+from queue import Queue
+
+import pytest
+
+from scratch.application import Application
+from scratch.headers import Headers
+from scratch.metrics import Metrics
+from scratch.request import Request
+from scratch.response import Response, StreamingResponse
+from scratch.server import (LISTEN_FD_ENV, READY_FD_ENV, HTTPServer,
+                            HTTPWorker, WorkerPool, get_reload_argv,
+                            notify_ready, prepare_connection,
+                            waitstatus_to_exitcode)
+
+
+def test_servers_can_share_a_port_using_reuse_port():
+    # Given that I have a server bound with SO_REUSEPORT
+    server = HTTPServer(port=0, reuse_port=True)
+    with server.make_socket() as first_sock:
+        _, port = first_sock.getsockname()
+
+        # When I bind another server to the same port
+        other_server = HTTPServer(port=port, reuse_port=True)
+        with other_server.make_socket() as second_sock:
+            # Then both sockets should be listening on that port
+            assert second_sock.getsockname()[1] == port
+
+
+@pytest.mark.parametrize("version,response,keep_alive,expected,connection", [
+    ["HTTP/1.1", Response(), True, True, None],
+    ["HTTP/1.1", Response(), False, False, "close"],
+    ["HTTP/1.0", Response(), True, True, "keep-alive"],
+    ["HTTP/1.1", StreamingResponse(), True, True, None],
+    ["HTTP/1.0", StreamingResponse(), True, False, "close"],
+])
+def test_connection_headers_are_added_to_responses(version, response, keep_alive, expected, connection):
+    # Given that I have a request
+    request = Request(method="GET", path="/", headers=Headers(), body=BytesIO(), version=version)
+
+    # When I prepare the connection for a response to it
+    result = prepare_connection(request, response, keep_alive)
+
+    # Then the connection should be kept alive only when possible
+    assert result == expected
+    assert response.headers.get("connection") == connection
+
+
+def test_streaming_responses_to_http_10_clients_are_not_chunked():
+    # Given that I have an HTTP/1.0 request and a streaming response
+    request = Request(method="GET", path="/", headers=Headers(), body=BytesIO(), version="HTTP/1.0")
+    response = StreamingResponse(chunks=[b"Hello"])
+
+    # When I prepare the connection for the response
+    prepare_connection(request, response, True)
+
+    # Then the response should not be chunked
+    assert not response.chunked
+
+
+def test_connections_are_rejected_when_the_queue_is_full():
+    # Given that I have a server whose connection queue is full
+    metrics = Metrics()
+    server = HTTPServer(metrics=metrics, retry_after=3)
+    server.connection_queue = Queue(1)
+    server.connection_queue.put_nowait(None)
+
+    # When a new connection is admitted
+    server_sock, client_sock = socket.socketpair()
+    with client_sock:
+        server.admit(server_sock, ("127.0.0.1", 0))
+
+        # Then it should be rejected with a 503
+        data = client_sock.recv(4096)
+        assert data.startswith(b"HTTP/1.1 503 Service Unavailable\r\n")
+        assert b"retry-after: 3\r\n" in data
+        assert client_sock.recv(4096) == b""
+
+    # And the rejection should be counted
+    assert metrics.collect()[2] == {"http_connections_rejected_total": 1}
+
+
+def test_connections_that_waited_too_long_are_dropped():
+    # Given that I have a worker with a max queue wait time
+    metrics = Metrics()
+    connection_queue: Queue = Queue()
+    worker = HTTPWorker(connection_queue, [], metrics=metrics, max_queue_wait=0.5)
+
+    # And a connection that has been waiting in the queue for longer than that
+    server_sock, client_sock = socket.socketpair()
+    connection_queue.put((server_sock, ("127.0.0.1", 0), time.monotonic() - 1))
+
+    # When the worker picks it up
+    worker.start()
+    connection_queue.join()
+    worker.stop()
+
+    # Then the connection should be closed without a response
+    with client_sock:
+        assert client_sock.recv(4096) == b""
+
+    # And it should be counted
+    assert metrics.collect()[2] == {"http_connections_expired_total": 1}
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_worker_pools_grow_with_load_and_shrink_when_idle():
+    # Given that I have a server whose handler blocks until released
+    released = threading.Event()
+
+    def handler(request):
+        released.wait()
+        return Response(content="done")
+
+    server = HTTPServer()
+    server.mount("", handler)
+
+    # And an elastic worker pool with between 1 and 3 workers
+    pool = server.pool = WorkerPool(
+        server.make_worker,
+        server.connection_queue,
+        min_workers=1,
+        max_workers=3,
+        idle_timeout=0.1,
+    )
+    pool.start()
+
+    # When 4 connections are admitted at once
+    client_socks = []
+    for _ in range(4):
+        server_sock, client_sock = socket.socketpair()
+        client_sock.sendall(b"GET / HTTP/1.1\r\nconnection: close\r\n\r\n")
+        server.admit(server_sock, ("127.0.0.1", 0))
+        client_socks.append(client_sock)
+
+    # Then the pool should grow up to its max size
+    wait_for(lambda: pool.stats().busy_workers == 3)
+    assert pool.stats().workers == 3
+    assert pool.stats().utilization == 1.0
+
+    # When the handlers are released
+    released.set()
+    for client_sock in client_socks:
+        with client_sock:
+            assert client_sock.recv(4096).startswith(b"HTTP/1.1 200 OK")
+
+    # Then the idle workers should be retired
+    wait_for(lambda: pool.stats().workers == 1)
+    assert pool.stats().retired_total == 2
+
+    # When the pool is stopped
+    pool.stop(timeout=5)
+
+    # Then its remaining worker should exit
+    assert not any(worker.is_alive() for worker in pool.workers)
+
+
+def test_servers_adopt_inherited_listening_sockets(monkeypatch):
+    # Given that I have a listening socket
+    server = HTTPServer(port=0)
+    with server.make_socket() as inherited_sock:
+        # And that its file descriptor is passed on through the environment
+        monkeypatch.setenv(LISTEN_FD_ENV, str(inherited_sock.fileno()))
+
+        # When I make a socket
+        server_sock = server.make_socket()
+
+        # Then it should be the inherited socket
+        assert server_sock.fileno() == inherited_sock.fileno()
+        assert LISTEN_FD_ENV not in os.environ
+        server_sock.detach()
+
+
+def test_reloaded_processes_notify_their_parent_when_ready(monkeypatch):
+    # Given that I have a pipe whose write end is passed on through the environment
+    ready_fd, notify_fd = os.pipe()
+    monkeypatch.setenv(READY_FD_ENV, str(notify_fd))
+
+    # When I notify the parent process
+    notify_ready()
+
+    # Then it should be able to read the notification
+    with os.fdopen(ready_fd, "rb") as ready_file:
+        assert ready_file.read() == b"1"
+
+
+def test_modules_run_with_m_are_reloaded_with_m(monkeypatch):
+    # Given that I'm running on a Python without sys.orig_argv
+    monkeypatch.delattr(sys, "orig_argv", raising=False)
+
+    # And that the server was started with python -m scratch
+    main = types.ModuleType("__main__")
+    main.__spec__ = ModuleSpec("scratch.__main__", None)
+    monkeypatch.setitem(sys.modules, "__main__", main)
+    monkeypatch.setattr(sys, "argv", ["/src/scratch/__main__.py", "--port", "9000"])
+
+    # When I get the command line to reload it with
+    # Then it should run the package with -m
+    assert get_reload_argv() == [sys.executable, "-m", "scratch", "--port", "9000"]
+
+
+def test_scripts_are_reloaded_as_scripts(monkeypatch):
+    # Given that I'm running on a Python without sys.orig_argv
+    monkeypatch.delattr(sys, "orig_argv", raising=False)
+
+    # And that the server was started as a script
+    main = types.ModuleType("__main__")
+    main.__spec__ = None
+    monkeypatch.setitem(sys.modules, "__main__", main)
+    monkeypatch.setattr(sys, "argv", ["app.py", "--port", "9000"])
+
+    # When I get the command line to reload it with
+    # Then it should run the script again
+    assert get_reload_argv() == [sys.executable, "app.py", "--port", "9000"]
+
+
+def test_queued_connections_are_served_before_pools_stop():
+    # Given that I have a server with a worker pool
+    server = HTTPServer(keepalive_timeout=1)
+    server.mount("", lambda request: Response(content="done"))
+    pool = server.pool = WorkerPool(server.make_worker, server.connection_queue, min_workers=1, max_workers=1)
+    pool.start()
+
+    # And a couple of keep-alive connections waiting in its queue
+    client_socks = []
+    for _ in range(2):
+        server_sock, client_sock = socket.socketpair()
+        client_sock.sendall(b"GET / HTTP/1.1\r\n\r\n")
+        server.connection_queue.put((server_sock, ("127.0.0.1", 0), time.monotonic()))
+        client_socks.append(client_sock)
+
+    # When the pool is stopped
+    pool.stop(timeout=5)
+
+    # Then every queued connection should have been served and closed
+    for client_sock in client_socks:
+        with client_sock:
+            assert client_sock.recv(4096).startswith(b"HTTP/1.1 200 OK")
+            assert client_sock.recv(4096) == b""
+
+
+def test_connections_with_large_unread_bodies_are_closed():
+    # Given that I have a worker whose handler ignores request bodies
+    worker = HTTPWorker(Queue(), [("", lambda request: Response(content="ignored"))])
+
+    # When a client starts sending a large body on a keep-alive connection
+    server_sock, client_sock = socket.socketpair()
+    with client_sock:
+        client_sock.sendall(b"POST / HTTP/1.1\r\ncontent-length: 1048576\r\n\r\n" + b"x" * 1024)
+        thread = threading.Thread(target=worker.handle_client, args=(server_sock, ("127.0.0.1", 0)))
+        thread.start()
+
+        # Then the worker should respond and close the connection
+        # rather than wait for the rest of the body
+        thread.join(timeout=5)
+        assert not thread.is_alive()
+        assert client_sock.recv(4096).startswith(b"HTTP/1.1 200 OK\r\n")
+
+
+def test_connections_are_not_kept_alive_while_draining():
+    # Given that I have a worker whose pool is stopping
+    server = HTTPServer()
+    server.mount("", lambda request: Response(content="done"))
+    pool = WorkerPool(server.make_worker, server.connection_queue, min_workers=1, max_workers=1)
+    pool.stopping = True
+    worker = server.make_worker(pool)
+
+    # When it serves a keep-alive request
+    server_sock, client_sock = socket.socketpair()
+    with client_sock:
+        client_sock.sendall(b"GET / HTTP/1.1\r\n\r\n")
+        worker.handle_client(server_sock, ("127.0.0.1", 0))
+
+        # Then the response should close the connection
+        data = client_sock.recv(4096)
+        assert b"connection: close\r\n" in data
+        assert client_sock.recv(4096) == b""
+
+
+def test_requests_with_query_strings_are_routed_by_path():
+    # Given that I have a worker serving an application
+    app = Application()
+
+    @app.route("/users")
+    def list_users(request):
+        return Response(content=f"limit={request.query.get('limit')}")
+
+    worker = HTTPWorker(Queue(), [("", app)])
+
+    # When it serves a request whose target has a query string
+    server_sock, client_sock = socket.socketpair()
+    with client_sock:
+        client_sock.sendall(b"GET /users?limit=10 HTTP/1.1\r\nconnection: close\r\n\r\n")
+        worker.handle_client(server_sock, ("127.0.0.1", 0))
+
+        # Then the handler should get the parsed query params
+        assert client_sock.recv(4096).endswith(b"\r\n\r\nlimit=10")
+
+
+def test_malformed_forms_are_rejected_with_a_400():
+    # Given that I have a worker serving a handler that reads forms
+    def handler(request):
+        return Response(content=str(list(request.form)))
+
+    worker = HTTPWorker(Queue(), [("", handler)])
+
+    # When it serves a request with a malformed multipart body
+    server_sock, client_sock = socket.socketpair()
+    with client_sock:
+        client_sock.sendall(
+            b"POST / HTTP/1.1\r\nconnection: close\r\ncontent-type: multipart/form-data; boundary=x\r\n"
+            b"content-length: 5\r\n\r\nhello"
+        )
+        worker.handle_client(server_sock, ("127.0.0.1", 0))
+
+        # Then it should respond with a 400
+        assert client_sock.recv(4096).startswith(b"HTTP/1.1 400 Bad Request\r\n")
+
+
+def test_pipelined_requests_are_answered_in_order():
+    # Given that I have a worker serving an application
+    app = Application()
+
+    @app.route("/users/{user_id}")
+    def get_user(request, user_id):
+        return Response(content=f"user {user_id}")
+
+    worker = HTTPWorker(Queue(), [("", app)])
+
+    # When a client pipelines several requests in a single write
+    server_sock, client_sock = socket.socketpair()
+    with client_sock:
+        client_sock.sendall(
+            b"GET /users/1 HTTP/1.1\r\n\r\n"
+            b"GET /users/2 HTTP/1.1\r\n\r\n"
+            b"GET /users/3 HTTP/1.1\r\nconnection: close\r\n\r\n"
+        )
+        worker.handle_client(server_sock, ("127.0.0.1", 0))
+
+        # Then every response should be sent back in order
+        data = b""
+        while True:
+            chunk = client_sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+
+        assert data.count(b"HTTP/1.1 200 OK") == 3
+        assert data.index(b"user 1") < data.index(b"user 2") < data.index(b"user 3")
+
+
+def test_responses_to_pipelined_requests_are_not_held_back_by_slow_handlers():
+    # Given that I have a worker with a fast and a slow handler
+    slow_handler_done = threading.Event()
+
+    def slow(request):
+        time.sleep(0.5)
+        slow_handler_done.set()
+        return Response(content="slow")
+
+    worker = HTTPWorker(Queue(), [("/fast", lambda request: Response(content="fast")), ("/slow", slow)])
+
+    # When a client pipelines a request to each
+    server_sock, client_sock = socket.socketpair()
+    with client_sock:
+        client_sock.sendall(b"GET /fast HTTP/1.1\r\n\r\nGET /slow HTTP/1.1\r\nconnection: close\r\n\r\n")
+        thread = threading.Thread(target=worker.handle_client, args=(server_sock, ("127.0.0.1", 0)))
+        thread.start()
+
+        # Then the first response should arrive before the slow handler finishes
+        data = client_sock.recv(4096)
+        assert data.startswith(b"HTTP/1.1 200 OK\r\n")
+        assert data.endswith(b"fast")
+        assert not slow_handler_done.is_set()
+        thread.join()
+
+
+def test_requests_whose_heads_arrive_too_slowly_get_a_408():
+    # Given that I have a worker with a header timeout
+    metrics = Metrics()
+    worker = HTTPWorker(Queue(), [], metrics=metrics, header_timeout=0.1)
+
+    # When a client only sends part of a request head
+    server_sock, client_sock = socket.socketpair()
+    with client_sock:
+        client_sock.sendall(b"GET / HTTP/1.1\r\nhost: ")
+        worker.handle_client(server_sock, ("127.0.0.1", 0))
+
+        # Then it should respond with a 408 and close the connection
+        data = client_sock.recv(4096)
+        assert data.startswith(b"HTTP/1.1 408 Request Timeout\r\n")
+        assert b"connection: close\r\n" in data
+
+    # And the timeout should be counted
+    assert metrics.collect()[2] == {"http_header_timeouts_total": 1}
+
+
+def test_requests_whose_bodies_arrive_too_slowly_get_a_408():
+    # Given that I have a worker serving a handler that reads request bodies
+    def handler(request):
+        return Response(content=request.body.read())
+
+    metrics = Metrics()
+    worker = HTTPWorker(Queue(), [("", handler)], metrics=metrics, body_timeout=0.1, min_transfer_rate=1024)
+
+    # When a client only sends part of a request body
+    server_sock, client_sock = socket.socketpair()
+    with client_sock:
+        client_sock.sendall(b"POST / HTTP/1.1\r\ncontent-length: 10\r\n\r\nhello")
+        worker.handle_client(server_sock, ("127.0.0.1", 0))
+
+        # Then it should respond with a 408 and close the connection
+        data = client_sock.recv(4096)
+        assert data.startswith(b"HTTP/1.1 408 Request Timeout\r\n")
+        assert b"connection: close\r\n" in data
+
+    # And the timeout should be counted
+    assert metrics.collect()[2] == {"http_body_timeouts_total": 1}
+
+
+def test_responses_from_slow_handlers_are_replaced_with_a_504():
+    # Given that I have a worker with a handler timeout
+    def handler(request):
+        time.sleep(0.2)
+        return Response(content="Hello")
+
+    metrics = Metrics()
+    worker = HTTPWorker(Queue(), [("", handler)], metrics=metrics, handler_timeout=0.1)
+
+    # When it serves a request whose handler takes longer than that
+    server_sock, client_sock = socket.socketpair()
+    with client_sock:
+        client_sock.sendall(b"GET / HTTP/1.1\r\nconnection: close\r\n\r\n")
+        worker.handle_client(server_sock, ("127.0.0.1", 0))
+
+        # Then it should respond with a 504
+        assert client_sock.recv(4096).startswith(b"HTTP/1.1 504 Gateway Timeout\r\n")
+
+    # And the timeout should be counted
+    assert metrics.collect()[2] == {"http_handler_timeouts_total": 1}
+
+
+def test_errors_from_streaming_responses_close_the_connection():
+    # Given that I have a handler whose response fails half way through
+    def generate():
+        yield b"Hello"
+        raise RuntimeError("failed")
+
+    def handler(request):
+        return StreamingResponse(chunks=generate())
+
+    metrics = Metrics()
+    worker = HTTPWorker(Queue(), [("/stream", handler)], metrics=metrics)
+
+    # When it serves a keep-alive request to that handler
+    server_sock, client_sock = socket.socketpair()
+    with client_sock:
+        client_sock.sendall(b"GET /stream HTTP/1.1\r\n\r\n")
+        worker.handle_client(server_sock, ("127.0.0.1", 0))
+
+        # Then the connection should be closed before the last chunk
+        data = b""
+        while True:
+            chunk = client_sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+
+        assert data.startswith(b"HTTP/1.1 200 OK\r\n")
+        assert data.endswith(b"5\r\nHello\r\n")
+
+    # And the request should still be recorded
+    assert metrics.collect()[0] == {("/stream", "GET", "200"): 1}
+
+
+def make_file_response():
+    body = BytesIO(b"Hello")
+    return Response(body=body), lambda: body.closed
+
+
+def make_streaming_response():
+    closed = []
+
+    def generate():
+        try:
+            yield b"Hello"
+        finally:
+            closed.append(True)
+
+    chunks = generate()
+    next(chunks)
+    return StreamingResponse(chunks=chunks), lambda: closed == [True]
+
+
+@pytest.mark.parametrize("make_response", [make_file_response, make_streaming_response])
+def test_responses_replaced_with_a_504_are_closed(make_response):
+    # Given that I have a slow handler whose response holds resources
+    response, is_closed = make_response()
+
+    def handler(request):
+        time.sleep(0.2)
+        return response
+
+    worker = HTTPWorker(Queue(), [("", handler)], handler_timeout=0.1)
+
+    # When it serves a request whose handler takes longer than the timeout
+    server_sock, client_sock = socket.socketpair()
+    with client_sock:
+        client_sock.sendall(b"GET / HTTP/1.1\r\nconnection: close\r\n\r\n")
+        worker.handle_client(server_sock, ("127.0.0.1", 0))
+        assert client_sock.recv(4096).startswith(b"HTTP/1.1 504 Gateway Timeout\r\n")
+
+    # Then the discarded response should be closed
+    assert is_closed()
+
+
+def test_requests_are_dispatched_to_the_longest_matching_mount():
+    # Given that I have a worker with a catch-all handler mounted
+    # before a more specific one
+    def root(request):
+        return Response(content=f"root {request.path}")
+
+    def api(request):
+        return Response(content=f"api {request.path}")
+
+    worker = HTTPWorker(Queue(), [("", root), ("/api", api)])
+
+    # When it handles requests under and outside of the specific prefix
+    def dispatch(path):
+        return worker.handle_request(Request("GET", path, Headers(), BytesIO())).body.read()
+
+    # Then each should go to the handler with the longest matching prefix
+    assert dispatch("/api/users") == b"api /users"
+    assert dispatch("/apis") == b"root /apis"
+    assert dispatch("/") == b"root /"
+
+
+def test_requests_with_invalid_content_lengths_get_a_400_and_are_closed():
+    # Given that I have a worker
+    worker = HTTPWorker(Queue(), [("", lambda request: Response(content="echo"))])
+
+    # When a client sends a request with an invalid content-length
+    # followed by a body that looks like another request
+    server_sock, client_sock = socket.socketpair()
+    with client_sock:
+        client_sock.sendall(b"POST /echo HTTP/1.1\r\ncontent-length: abc\r\n\r\nGET /smuggled HTTP/1.1\r\n\r\n")
+        worker.handle_client(server_sock, ("127.0.0.1", 0))
+
+        # Then it should respond with a single 400 and close the connection
+        data = b""
+        while True:
+            chunk = client_sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+
+        assert data.startswith(b"HTTP/1.1 400 Bad Request\r\n")
+        assert data.count(b"HTTP/1.1") == 1
+
+
+@pytest.mark.parametrize("header", [
+    b"Content-Length : 27",
+    b"Transfer-Encoding : chunked",
+    b" content-length: 27",
+    b"x-a: 1\r\n content-length: 27",
+    b": 27",
+])
+def test_requests_with_malformed_header_names_get_a_400_and_are_closed(header):
+    # Given that I have a worker
+    worker = HTTPWorker(Queue(), [("", lambda request: Response(content=request.path))])
+
+    # When a client sends a request with a malformed header line
+    # followed by a body that looks like another request
+    server_sock, client_sock = socket.socketpair()
+    with client_sock:
+        client_sock.sendall(b"POST /a HTTP/1.1\r\n%b\r\n\r\nGET /smuggled HTTP/1.1\r\n\r\n" % header)
+        worker.handle_client(server_sock, ("127.0.0.1", 0))
+
+        # Then it should respond with a single 400 and close the connection
+        data = b""
+        while True:
+            chunk = client_sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+
+        assert data.startswith(b"HTTP/1.1 400 Bad Request\r\n")
+        assert data.count(b"HTTP/1.1") == 1
+
+
+def test_truncated_request_bodies_get_a_400_and_are_closed():
+    # Given that I have a worker whose handler reads request bodies
+    worker = HTTPWorker(Queue(), [("", lambda request: Response(content=request.body.read().decode()))])
+
+    # When a client stops sending part way through a request body
+    server_sock, client_sock = socket.socketpair()
+    with client_sock:
+        client_sock.sendall(b"POST /echo HTTP/1.1\r\ncontent-length: 10\r\n\r\nabc")
+        client_sock.shutdown(socket.SHUT_WR)
+        worker.handle_client(server_sock, ("127.0.0.1", 0))
+
+        # Then it should respond with a 400 and close the connection
+        data = client_sock.recv(4096)
+        assert data.startswith(b"HTTP/1.1 400 Bad Request\r\n")
+        assert b"connection: close\r\n" in data
+
+
+def test_chunked_request_bodies_that_are_too_large_get_a_413_and_are_closed():
+    # Given that I have a worker with a small max body size
+    worker = HTTPWorker(
+        Queue(),
+        [("", lambda request: Response(content=request.body.read().decode()))],
+        max_body_size=5,
+    )
+
+    # When a client sends a chunked body larger than that
+    server_sock, client_sock = socket.socketpair()
+    with client_sock:
+        client_sock.sendall(b"POST /echo HTTP/1.1\r\ntransfer-encoding: chunked\r\n\r\na\r\n0123456789\r\n0\r\n\r\n")
+        worker.handle_client(server_sock, ("127.0.0.1", 0))
+
+        # Then it should respond with a 413 and tell the client that
+        # the connection is being closed
+        data = client_sock.recv(4096)
+        assert data.startswith(b"HTTP/1.1 413 Payload Too Large\r\n")
+        assert b"connection: close\r\n" in data
+
+
+def test_connections_are_closed_after_requests_with_both_framing_headers():
+    # Given that I have a worker
+    worker = HTTPWorker(Queue(), [("", lambda request: Response(content=request.path))])
+
+    # When a client sends a request with both a transfer-encoding and a
+    # content-length, followed by another request
+    server_sock, client_sock = socket.socketpair()
+    with client_sock:
+        client_sock.sendall(
+            b"POST /first HTTP/1.1\r\ntransfer-encoding: chunked\r\ncontent-length: 5\r\n\r\n0\r\n\r\n"
+            b"GET /second HTTP/1.1\r\n\r\n"
+        )
+        worker.handle_client(server_sock, ("127.0.0.1", 0))
+
+        # Then only the first request should be served before the
+        # connection is closed
+        data = b""
+        while True:
+            chunk = client_sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+
+        assert data.count(b"HTTP/1.1 200 OK") == 1
+        assert b"connection: close\r\n" in data
+        assert data.endswith(b"/first")
+
+
+SUPERVISOR_SCRIPT = """
+import logging, os, sys
+from scratch.response import Response
+from scratch.server import HTTPServer
+
+logging.basicConfig(level=logging.INFO)
+server = HTTPServer(port=int(sys.argv[1]), process_count=1, shutdown_timeout=1)
+server.mount("", lambda request: Response(content=str(os.getpid())))
+server.supervise()
+"""
+
+
+def get_worker_pid(port):
+    """Get the pid of the worker process that serves a request, or
+    None if the server can't be reached.
+    """
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=1) as sock:
+            sock.sendall(b"GET / HTTP/1.1\r\nconnection: close\r\n\r\n")
+            data = b""
+            while True:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    break
+                data += chunk
+    except OSError:
+        return None
+
+    _, _, body = data.partition(b"\r\n\r\n")
+    return int(body) if body else None
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires fork")
+def test_supervisors_restart_crashed_workers_and_stop_on_sigterm():
+    # Given that I have a supervisor running a single worker process
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        _, port = sock.getsockname()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen(
+        [sys.executable, "-c", SUPERVISOR_SCRIPT, str(port)],
+        cwd=root,
+        stderr=subprocess.PIPE,
+    )
+    try:
+        pids = []
+        wait_for(lambda: pids.append(get_worker_pid(port)) or pids[-1] is not None, timeout=10)
+        first_pid = pids[-1]
+
+        # When its worker process is killed
+        os.kill(first_pid, signal.SIGKILL)
+
+        # Then a new worker process should take over
+        wait_for(lambda: pids.append(get_worker_pid(port)) or pids[-1] not in (None, first_pid), timeout=10)
+        second_pid = pids[-1]
+
+        # When the supervisor is sent a SIGTERM
+        process.send_signal(signal.SIGTERM)
+
+        # Then it should exit cleanly along with its worker
+        assert process.wait(10) == 0
+        with pytest.raises(ProcessLookupError):
+            os.kill(second_pid, 0)
+
+        # And the crash should have been logged with the signal that caused it
+        assert f"Worker process {first_pid} exited with status -9.".encode() in process.stderr.read()
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stderr.close()
+
+
+def test_wait_statuses_are_converted_to_exit_codes():
+    # Given that I have a child process that's killed by a signal
+    process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(10)"])
+    process.kill()
+    _, status = os.waitpid(process.pid, 0)
+
+    # When I convert its wait status
+    # Then I should get back the negated signal number
+    assert waitstatus_to_exitcode(status) == -signal.SIGKILL
+
+
+def test_idle_keep_alive_connections_are_closed_after_the_keepalive_timeout():
+    # Given that I have a worker with a short keepalive timeout
+    worker = HTTPWorker(Queue(), [("", lambda request: Response(content="hello"))], keepalive_timeout=0.1)
+
+    # When a client sends a single request and then goes idle
+    server_sock, client_sock = socket.socketpair()
+    with client_sock:
+        client_sock.sendall(b"GET / HTTP/1.1\r\n\r\n")
+        started_at = time.monotonic()
+        worker.handle_client(server_sock, ("127.0.0.1", 0))
+
+        # Then the request should be answered without closing the connection
+        data = b""
+        while True:
+            chunk = client_sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+
+        assert data.startswith(b"HTTP/1.1 200 OK\r\n")
+        assert b"connection: close" not in data
+
+        # And the connection should be closed once it times out
+        assert time.monotonic() - started_at < 2
+
+
+def test_connections_are_closed_after_max_keepalive_requests():
+    # Given that I have a worker that serves at most 2 requests per connection
+    worker = HTTPWorker(Queue(), [("", lambda request: Response(content=request.path))], max_keepalive_requests=2)
+
+    # When a client sends 3 requests on a single connection
+    server_sock, client_sock = socket.socketpair()
+    with client_sock:
+        client_sock.sendall(b"GET /1 HTTP/1.1\r\n\r\nGET /2 HTTP/1.1\r\n\r\nGET /3 HTTP/1.1\r\n\r\n")
+        worker.handle_client(server_sock, ("127.0.0.1", 0))
+
+        # Then only the first 2 should be served
+        data = b""
+        while True:
+            chunk = client_sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+
+        assert data.count(b"HTTP/1.1 200 OK") == 2
+        assert data.endswith(b"/2")
+
+        # And the last response should tell the client that the
+        # connection is being closed
+        _, _, last_response = data.rpartition(b"HTTP/1.1 200 OK")
+        assert b"connection: close\r\n" in last_response
@@ -0,0 +1,185 @@
+import pytest
+
+from scratch.server import serve_static
+from scratch.static import StaticFileCache, parse_ranges
+from tests.helpers import StubSocket, make_request
+
+
+@pytest.fixture
+def server_root(tmp_path):
+    (tmp_path / "index.html").write_bytes(b"<h1>Hello!</h1>")
+    (tmp_path / "assets").mkdir()
+    (tmp_path / "assets" / "site.css").write_bytes(b"body {}")
+    (tmp_path / "numbers.txt").write_bytes(b"0123456789")
+    return str(tmp_path)
+
+
+def test_static_files_are_served_with_validators(server_root):
+    # Given that I have a static file handler
+    handler = serve_static(server_root)
+
+    # When I request a file
+    response = handler(make_request("/"))
+
+    # Then I should get back its contents along with its validators
+    assert response.status == b"200 OK"
+    assert response.body.read() == b"<h1>Hello!</h1>"
+    assert response.headers.get("content-type") == "text/html"
+    assert response.headers.get("etag") is not None
+    assert response.headers.get("last-modified") is not None
+
+
+def test_static_files_that_havent_changed_are_not_resent(server_root):
+    # Given that I have a static file handler
+    handler = serve_static(server_root)
+
+    # And I've requested a file once
+    response = handler(make_request("/assets/site.css"))
+    etag = response.headers.get("etag")
+    last_modified = response.headers.get("last-modified")
+
+    # When I request it again using either validator
+    # Then I should get back a 304 response
+    assert handler(make_request("/assets/site.css", ("if-none-match", etag))).status == b"304 Not Modified"
+    assert handler(make_request("/assets/site.css", ("if-modified-since", last_modified))).status == b"304 Not Modified"
+
+    # And a stale ETag should get me the file
+    assert handler(make_request("/assets/site.css", ("if-none-match", '"stale"'))).status == b"200 OK"
+
+
+def test_static_files_can_have_cache_control_rules(server_root):
+    # Given that I have a static file handler with cache control rules
+    handler = serve_static(server_root, cache_control={
+        "/": "no-cache",
+        "/assets/": "public, max-age=31536000, immutable",
+    })
+
+    # When I request files under different prefixes
+    # Then the longest matching rule should apply
+    assert handler(make_request("/")).headers.get("cache-control") == "no-cache"
+    assert handler(make_request("/assets/site.css")).headers.get("cache-control") == \
+        "public, max-age=31536000, immutable"
+
+
+@pytest.mark.parametrize("path", ["/missing.html", "/assets", "/../etc/passwd"])
+def test_static_files_outside_the_root_or_missing_are_not_found(server_root, path):
+    # Given that I have a static file handler
+    handler = serve_static(server_root)
+
+    # When I request a file that isn't there
+    # Then I should get back a 404 response
+    assert handler(make_request(path)).status == b"404 Not Found"
+
+
+def test_static_file_caches_evict_least_recently_used_entries(server_root):
+    # Given that I have a small static file cache
+    cache = StaticFileCache(max_entries=2)
+
+    # When I look up more files than it can hold
+    cache.get(server_root, "/index.html")
+    cache.get(server_root, "/assets/site.css")
+    cache.get(server_root, "/index.html")
+    cache.get(server_root, "/missing.html")
+
+    # Then the least recently used entry should be evicted
+    assert len(cache) == 2
+    assert list(cache._entries) == [(server_root, "/index.html"), (server_root, "/missing.html")]
+
+
+def test_static_file_caches_revalidate_expired_entries(server_root, tmp_path):
+    # Given that I have a static file cache without a ttl
+    cache = StaticFileCache(ttl=0)
+
+    # And I've looked up a file
+    first = cache.get(server_root, "/index.html")
+
+    # When that file changes
+    (tmp_path / "index.html").write_bytes(b"<h1>Changed!</h1>")
+
+    # Then looking it up again should return its new metadata
+    assert cache.get(server_root, "/index.html").size != first.size
+
+
+@pytest.mark.parametrize("header,ranges", [
+    ["bytes=0-4", [(0, 4)]],
+    ["bytes=5-", [(5, 9)]],
+    ["bytes=-3", [(7, 9)]],
+    ["bytes=8-20", [(8, 9)]],
+    ["bytes=0-1, 4-5", [(0, 1), (4, 5)]],
+    ["bytes=20-30", []],
+    ["bytes=5-1", None],
+    ["bytes=a-b", None],
+    ["lines=0-1", None],
+    ["bytes=" + ",".join(["0-1"] * 17), None],
+])
+def test_range_headers_can_be_parsed(header, ranges):
+    assert parse_ranges(header, 10) == ranges
+
+
+def test_static_files_can_be_requested_in_part(server_root):
+    # Given that I have a static file handler
+    handler = serve_static(server_root)
+
+    # When I request a single range of a file
+    response = handler(make_request("/numbers.txt", ("range", "bytes=2-5")))
+
+    # Then I should get back just that range
+    socket = StubSocket()
+    response.send(socket)
+    assert response.status == b"206 Partial Content"
+    assert response.headers.get("content-range") == "bytes 2-5/10"
+    assert socket.getvalue().endswith(b"\r\n\r\n2345")
+
+
+def test_static_files_can_be_requested_in_multiple_parts(server_root):
+    # Given that I have a static file handler
+    handler = serve_static(server_root)
+
+    # When I request multiple ranges of a file
+    response = handler(make_request("/numbers.txt", ("range", "bytes=0-1,8-")))
+    socket = StubSocket()
+    response.send(socket)
+
+    # Then I should get back a multipart response containing each range
+    assert response.status == b"206 Partial Content"
+    content_type = response.headers.get("content-type")
+    assert content_type.startswith("multipart/byteranges; boundary=")
+
+    boundary = content_type.split("=")[1]
+    head, body = socket.getvalue().split(b"\r\n\r\n", 1)
+    assert len(body) == int(response.headers.get("content-length"))
+    assert body == (
+        f"\r\n--{boundary}\r\n"
+        f"content-type: text/plain\r\n"
+        f"content-range: bytes 0-1/10\r\n\r\n"
+        f"01"
+        f"\r\n--{boundary}\r\n"
+        f"content-type: text/plain\r\n"
+        f"content-range: bytes 8-9/10\r\n\r\n"
+        f"89"
+        f"\r\n--{boundary}--\r\n"
+    ).encode()
+
+
+def test_unsatisfiable_ranges_are_rejected(server_root):
+    # Given that I have a static file handler
+    handler = serve_static(server_root)
+
+    # When I request a range past the end of a file
+    response = handler(make_request("/numbers.txt", ("range", "bytes=10-")))
+
+    # Then I should get back a 416 response
+    assert response.status == b"416 Range Not Satisfiable"
+    assert response.headers.get("content-range") == "bytes */10"
+
+
+def test_ranges_are_ignored_when_if_range_does_not_match(server_root):
+    # Given that I have a static file handler
+    handler = serve_static(server_root)
+
+    # When I request a range of a file that has since changed
+    response = handler(make_request("/numbers.txt", ("range", "bytes=0-1"), ("if-range", '"stale"')))
+
+    # Then I should get back the whole file
+    assert response.status == b"200 OK"
+    assert response.body.read() == b"0123456789"